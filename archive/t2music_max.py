@@ -2,20 +2,20 @@ import os
 import logging
 import asyncio
 import replicate
-import aiohttp
-import ffmpeg
 
 from replicate.helpers import FileOutput
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.types import (
-    Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 )
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
+from media.audio import url_to_voice
+
 # Загрузка переменных окружения
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -123,31 +123,13 @@ async def handle_voice_text(message: Message, state: FSMContext):
         else:
             raise ValueError("Не удалось получить ссылку на аудио.")
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(audio_url) as resp:
-                if resp.status != 200:
-                    raise Exception("Ошибка скачивания аудио")
-                with open("output.mp3", "wb") as f:
-                    f.write(await resp.read())
-
-        (
-            ffmpeg
-            .input("output.mp3")
-            .output("voice.ogg", format='opus', audio_bitrate='64k', acodec='libopus')
-            .overwrite_output()
-            .run()
-        )
-
-        voice = FSInputFile("voice.ogg")
+        # Перекодирование идёт через медиа-пул, не блокируя цикл событий
+        voice = await url_to_voice(audio_url)
         await message.answer_voice(voice)
 
     except Exception:
         logger.exception("Ошибка генерации аудио:")
         await message.answer("⚠️ Ошибка генерации аудио.")
-    finally:
-        for file in ["output.mp3", "voice.ogg"]:
-            if os.path.exists(file):
-                os.remove(file)
 
     await state.clear()
 
@@ -0,0 +1,47 @@
+# Сколько стоит master_audio на типичных результатах: озвучка Chatterbox (моно 24 кГц)
+# и треки MusicGen до 3 минут (стерео 32 кГц). Сигнал синтетический — шум с огибающей,
+# тишиной в начале и затуханием в конце, как у настоящей генерации.
+# Запуск из корня проекта: python bench/audio_master.py
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from media.loudness import master_audio, integrated_loudness
+
+SAMPLES = [
+    ("chatterbox 20 с", 24000, 1, 20),
+    ("musicgen 30 с", 32000, 2, 30),
+    ("musicgen 180 с", 32000, 2, 180),
+]
+RUNS = 5
+
+
+def make_audio(rate: int, channels: int, seconds: int) -> np.ndarray:
+    rng = np.random.default_rng(seconds)
+    n = rate * seconds
+    envelope = 0.3 + 0.7 * np.abs(np.sin(np.arange(n) / rate * 1.3))
+    samples = (rng.standard_normal((n, channels)) * 0.05 * envelope[:, None]).astype(np.float32)
+    samples[: rate // 2] = 0
+    samples[-rate:] *= np.linspace(1, 0, rate, dtype=np.float32)[:, None] ** 4
+    return samples[:, 0].copy() if channels == 1 else samples
+
+
+def main():
+    for name, rate, channels, seconds in SAMPLES:
+        samples = make_audio(rate, channels, seconds)
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            result = master_audio(samples, rate)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:<16} {integrated_loudness(samples, rate):6.1f} -> {integrated_loudness(result, rate):6.1f} LUFS, "
+              f"пик {20 * np.log10(np.abs(result).max()):5.1f} дБ, {len(samples) / rate:.1f} -> {len(result) / rate:.1f} с, "
+              f"медиана {np.median(timings) * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Бенчмарк: задержка чтения баланса в хендлере промпта с кэшем и без него.
+# Запуск из корня проекта: python bench/balance_cache.py
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp_dir}/bench.db"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("REPLICATE_API_TOKEN", "bench")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from database.db import engine, async_session, init_db
+from database.models import User
+from bot import balance_cache
+from bot.billing import get_user_balance
+
+USERS = 1000
+REQUESTS = 5000
+CONCURRENCY = 20
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(enabled: bool) -> list[float]:
+    balance_cache.BALANCE_CACHE_ENABLED = enabled
+    balance_cache._balances.clear()
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    hot_users = list(range(1, 201))
+
+    async def handler():
+        async with semaphore:
+            start = time.perf_counter()
+            await get_user_balance(random.choice(hot_users))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(handler() for _ in range(REQUESTS)))
+    return latencies
+
+
+async def main():
+    engine.echo = False
+    await init_db()
+    async with async_session() as session:
+        session.add_all(User(telegram_id=i, balance=100) for i in range(1, USERS + 1))
+        await session.commit()
+
+    for enabled in (False, True):
+        latencies = await run(enabled)
+        label = "с кэшем " if enabled else "без кэша"
+        print(
+            f"{label}: p50={statistics.median(latencies):.3f} мс "
+            f"p99={percentile(latencies, 0.99):.3f} мс"
+        )
+    print(f"статистика кэша: {balance_cache.balance_cache_stats()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+# Перцептивный хэш входных фото: время на фото и различимость почти-дублей.
+# Почти-дубли — то же фото после пересжатия, уменьшения и перевода в PNG;
+# разные — фото из того же генератора с другим сидом.
+# Запуск из корня проекта: python bench/image_dedup.py
+import io
+import os
+import sys
+import time
+import random
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from media.images import dhash, hamming_distances
+from media.ingest import DHASH_MAX_DISTANCE
+
+PHOTOS = 50
+SIZE = (1280, 960)  # типичное фото из Telegram
+RUNS = 20
+
+
+def make_photo(seed: int) -> Image.Image:
+    rnd = random.Random(seed)
+    image = Image.linear_gradient("L").rotate(rnd.randrange(360)).resize(SIZE).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rnd.randrange(SIZE[0]), rnd.randrange(SIZE[1])
+        r = rnd.randrange(40, SIZE[0] // 3)
+        draw.ellipse((x, y, x + r, y + r), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    return image.filter(ImageFilter.GaussianBlur(3))
+
+
+def encode(image: Image.Image, format: str = "JPEG", **params) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format, **params)
+    return output.getvalue()
+
+
+def variants(image: Image.Image) -> list[bytes]:
+    w, h = image.size
+    return [
+        encode(image, quality=60),
+        encode(image.resize((w * 3 // 4, h * 3 // 4)), quality=85),
+        encode(image.resize((w // 2, h // 2)), "PNG"),
+        encode(image.crop((8, 8, w - 8, h - 8)), quality=80),
+    ]
+
+
+def main():
+    images = [make_photo(seed) for seed in range(PHOTOS)]
+    originals = [encode(image, quality=90) for image in images]
+
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        hashes = [dhash(data) for data in originals]
+    per_image = (time.perf_counter() - start) / RUNS / PHOTOS * 1000
+    print(f"dHash: {per_image:.2f} мс на фото {SIZE[0]}x{SIZE[1]} JPEG")
+
+    index = np.array(hashes, dtype=np.uint64)
+    near = []
+    matched = 0
+    for i, image in enumerate(images):
+        for data in variants(image):
+            distances = hamming_distances(index, dhash(data))
+            near.append(int(distances[i]))
+            matched += int(distances.argmin()) == i and distances[i] <= DHASH_MAX_DISTANCE
+
+    far = [int(d) for i, h in enumerate(hashes) for d in hamming_distances(index[i + 1:], h)]
+    false_matches = sum(d <= DHASH_MAX_DISTANCE for d in far)
+    print(f"почти-дубли: расстояние медиана {np.median(near):.0f}, максимум {max(near)}; "
+          f"найдено {matched}/{len(near)} при пороге {DHASH_MAX_DISTANCE}")
+    print(f"разные фото: расстояние минимум {min(far)}, медиана {np.median(far):.0f}; "
+          f"ложных совпадений {false_matches}/{len(far)}")
+
+
+if __name__ == "__main__":
+    main()
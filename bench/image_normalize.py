@@ -0,0 +1,64 @@
+# Сколько байт экономит нормализация входных фото для каждой модели.
+# Набор — синтетические «фото» разных размеров, как их присылают в Telegram
+# (до 2560 по длинной стороне) и как документ с телефона (4032x3024 с EXIF-поворотом).
+# Запуск из корня проекта: python bench/image_normalize.py
+import io
+import os
+import sys
+import time
+import random
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from media.images import IMAGE_PROFILES, normalize_image
+
+SAMPLES = [
+    ("telegram 1280x960", (1280, 960), None),
+    ("telegram 2560x1920", (2560, 1920), None),
+    ("телефон 4032x3024, EXIF 6", (4032, 3024), 6),
+]
+
+
+def make_photo(size: tuple[int, int], orientation: int | None) -> bytes:
+    rnd = random.Random(size[0])
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(300):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        r = rnd.randrange(10, size[0] // 8)
+        draw.ellipse((x, y, x + r, y + r), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(2))
+    # Немного шума, как у настоящей камеры
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+
+    output = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(output, "JPEG", quality=95, exif=exif)
+    return output.getvalue()
+
+
+def main():
+    photos = [(name, make_photo(size, orientation)) for name, size, orientation in SAMPLES]
+    for model, profile in IMAGE_PROFILES.items():
+        before = after = 0
+        elapsed = 0.0
+        for name, data in photos:
+            start = time.perf_counter()
+            result = normalize_image(data, **profile)
+            elapsed += time.perf_counter() - start
+            before += len(data)
+            after += len(result)
+            with Image.open(io.BytesIO(result)) as image:
+                size = image.size
+            print(f"{model:>8} {name:<26} {len(data) / 1024:8.0f} КБ -> {len(result) / 1024:6.0f} КБ {size}")
+        print(f"{model:>8} итого: {before / 1024:.0f} КБ -> {after / 1024:.0f} КБ "
+              f"(-{(1 - after / before) * 100:.0f}%), {elapsed * 1000 / len(photos):.0f} мс на фото\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Доставка трека MusicGen: старый путь (read() целиком -> файл -> FSInputFile) против
+# потокового через SpooledInputFile. Replicate и Telegram Bot API заменены локальным сервером.
+# Каждый прогон идёт в отдельном процессе, чтобы пиковый RSS не накапливался между ними.
+# Запуск из корня проекта: python bench/musicgen_stream.py
+import os
+import sys
+import time
+import asyncio
+import resource
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import FSInputFile
+
+from media.stream import download_spooled
+
+PORT = 8769
+SIZES_MB = (5, 50, 200)
+RUNS = 3
+
+
+async def track(request: web.Request):
+    size = int(request.match_info["size"]) * 1024 * 1024
+    response = web.StreamResponse(headers={"Content-Type": "audio/mpeg", "Content-Length": str(size)})
+    await response.prepare(request)
+    chunk = os.urandom(256 * 1024)
+    for _ in range(size // len(chunk)):
+        await response.write(chunk)
+    return response
+
+
+async def send_audio(request: web.Request):
+    # Читаем multipart до конца, не накапливая его, как это делал бы Telegram
+    reader = await request.multipart()
+    while part := await reader.next():
+        while await part.read_chunk():
+            pass
+    return web.json_response({"ok": True, "result": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"},
+    }})
+
+
+async def deliver_old(session: aiohttp.ClientSession, bot: Bot, url: str):
+    filename = "generated_track.mp3"
+    async with session.get(url) as music_response:
+        with open(filename, "wb") as f:
+            f.write(await music_response.read())
+    await bot.send_audio(1, FSInputFile(filename))
+    os.remove(filename)
+
+
+async def deliver_stream(session: aiohttp.ClientSession, bot: Bot, url: str):
+    async with download_spooled(session, url, "track.mp3") as audio:
+        await bot.send_audio(1, audio)
+
+
+async def run_once(mode: str, size_mb: int):
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_get("/track/{size}", track)
+    app.router.add_post("/bot{token}/sendAudio", send_audio)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    api = TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}")
+    bot = Bot("0:bench", session=AiohttpSession(api=api))
+    deliver = deliver_old if mode == "old" else deliver_stream
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await deliver(session, bot, f"http://127.0.0.1:{PORT}/track/{size_mb}")
+        elapsed = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    await bot.session.close()
+    await runner.cleanup()
+    print(f"{elapsed} {(peak - baseline) / 1024}")
+
+
+def main():
+    for size_mb in SIZES_MB:
+        for mode in ("old", "stream"):
+            results = []
+            for _ in range(RUNS):
+                out = subprocess.run([sys.executable, __file__, mode, str(size_mb)],
+                                     capture_output=True, text=True, check=True).stdout.split()
+                results.append((float(out[0]), float(out[1])))
+            elapsed = sorted(r[0] for r in results)[RUNS // 2]
+            rss = max(r[1] for r in results)
+            print(f"{size_mb:>4} МБ {mode:>6}: {elapsed * 1000:7.0f} мс, прирост RSS {rss:6.1f} МБ")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        asyncio.run(run_once(sys.argv[1], int(sys.argv[2])))
+    else:
+        main()
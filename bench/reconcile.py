@@ -0,0 +1,84 @@
+# Прогон сверки платежей против локальной заглушки ЮKassa: подмешиваем расхождения
+# и проверяем, что пиковая память не растёт вместе с числом платежей.
+# Запуск из корня проекта: python bench/reconcile.py
+import os
+import sys
+import time
+import uuid
+import asyncio
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp_dir}/bench.db"
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import delete, insert
+
+from database.db import engine, init_db
+from database.models import User, PaymentRecord, DEBIT_STATUS
+from bot.yookassa import YooKassaClient
+from bench.yookassa_stub import start_stub, add_payment
+from bot.reconcile import reconcile
+
+PORT = 8768
+USERS = 100
+
+
+async def seed(app, payments: int):
+    stub = app["stub"]
+    stub["payments"].clear()
+    stub["order"].clear()
+    async with engine.begin() as conn:
+        await conn.execute(delete(PaymentRecord))
+        rows = []
+        for i in range(payments):
+            telegram_id = i % USERS + 1
+            payment = add_payment(app, 100 + i % 7, metadata={"telegram_id": str(telegram_id)})
+            amount = float(payment["amount"]["value"])
+            if i < 5:
+                continue  # missing_local
+            if i < 10:
+                amount += 1  # mismatch
+            rows.append({"user_id": telegram_id, "amount": amount, "payment_id": payment["id"], "status": "succeeded"})
+            if i < 13:
+                stub["order"].append(payment["id"])  # duplicate_remote
+            # Списания за генерации в сверке не участвуют
+            rows.append({"user_id": telegram_id, "amount": 9, "payment_id": str(uuid.uuid4()), "status": DEBIT_STATUS})
+        for i in range(5):
+            rows.append({"user_id": 1, "amount": 100, "payment_id": str(uuid.uuid4()), "status": "succeeded"})  # missing_remote
+        await conn.execute(insert(PaymentRecord), rows)
+
+
+async def main():
+    engine.echo = False
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [{"telegram_id": i, "balance": 0} for i in range(1, USERS + 1)])
+
+    app, runner = await start_stub(PORT)
+    client = YooKassaClient("shop", "key", base_url=f"http://127.0.0.1:{PORT}/v3")
+    since = datetime.now(timezone.utc) - timedelta(days=1)
+
+    for payments in (2_000, 20_000):
+        await seed(app, payments)
+        tracemalloc.start()
+        start = time.perf_counter()
+        summary = await reconcile(since, report_path=os.path.join(_tmp_dir, "report.csv"), client=client)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"платежей {payments}: {summary}, {elapsed:.2f} с, пик памяти {peak / 1024 / 1024:.1f} МБ")
+
+    await client.close()
+    await runner.cleanup()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+# Нагрузочный прогон вебхуков ЮKassa: тысячи подписанных тел (дубли, повторы,
+# перепутанный порядок статусов), затем сверка балансов с ожидаемыми.
+# Запуск из корня проекта: python bench/webhook_load.py
+import os
+import sys
+import json
+import hmac
+import time
+import uuid
+import random
+import hashlib
+import asyncio
+import tempfile
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp_dir}/bench.db"
+os.environ["YOOKASSA_WEBHOOK_SECRET"] = "bench-secret"
+
+import logging
+logging.disable(logging.CRITICAL)
+
+import aiohttp
+from aiohttp import web
+from sqlalchemy import select
+
+from database.db import engine, async_session, init_db
+from database.models import User
+from bot import webhook
+
+PORT = 8767
+USERS = 300
+PAYMENTS = 3000
+CONCURRENCY = 50
+
+
+def sign(body: bytes) -> str:
+    return hmac.new(b"bench-secret", body, hashlib.sha256).hexdigest()
+
+
+def build_bodies() -> tuple[list[bytes], dict[int, float]]:
+    bodies, expected = [], {}
+    for _ in range(PAYMENTS):
+        telegram_id = random.randint(1, USERS)
+        amount = random.choice([100, 500, 1000])
+        payment = {
+            "id": str(uuid.uuid4()),
+            "amount": {"value": f"{amount:.2f}", "currency": "RUB"},
+            "metadata": {"telegram_id": str(telegram_id)},
+        }
+        statuses = ["pending", "succeeded"]
+        if random.random() < 0.3:
+            statuses.append("succeeded")  # повторная доставка
+        if random.random() < 0.1:
+            statuses.reverse()  # pending пришёл позже succeeded
+        for status in statuses:
+            event = {"type": "notification", "event": f"payment.{status}", "object": {**payment, "status": status}}
+            bodies.append(json.dumps(event).encode())
+        expected[telegram_id] = expected.get(telegram_id, 0) + amount
+    random.shuffle(bodies)
+    return bodies, expected
+
+
+async def main():
+    engine.echo = False
+    await init_db()
+    bodies, expected = build_bodies()
+
+    app = web.Application()
+    webhook.setup_webhook_routes(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    url = f"http://127.0.0.1:{PORT}/yookassa_webhook"
+
+    async with aiohttp.ClientSession() as session:
+        async def post(body):
+            async with semaphore:
+                start = time.perf_counter()
+                async with session.post(url, data=body, headers={"Content-HMAC": sign(body)}) as resp:
+                    assert resp.status == 200, resp.status
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(body) for body in bodies))
+        acked = time.perf_counter() - started
+        await webhook._queue.join()
+        processed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"вебхуков: {len(bodies)}, подтверждены за {acked:.2f} с, обработаны за {processed:.2f} с")
+    print(f"ответ: p50={statistics.median(latencies):.2f} мс p99={latencies[int(len(latencies) * 0.99)]:.2f} мс")
+
+    async with async_session() as session:
+        result = await session.execute(select(User.telegram_id, User.balance))
+        balances = dict(result.all())
+    mismatched = [tg for tg, amount in expected.items() if balances.get(tg) != amount]
+    print(f"пользователей: {len(expected)}, балансов с расхождением: {len(mismatched)}")
+
+    await runner.cleanup()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+# Прогон асинхронного клиента ЮKassa против локальной заглушки:
+# повторы с тем же Idempotence-Key, переиспользование пула и задержки вызовов.
+# Запуск из корня проекта: python bench/yookassa_client.py
+import os
+import sys
+import asyncio
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bot.yookassa import YooKassaClient
+from bench.yookassa_stub import start_stub
+
+PORT = 8766
+PAYMENTS = 500
+CONCURRENCY = 50
+
+
+async def main():
+    app, runner = await start_stub(PORT)
+    client = YooKassaClient("shop", "key", base_url=f"http://127.0.0.1:{PORT}/v3", timeout=2, backoff=0.05)
+
+    # Две 503 подряд: клиент повторяет запрос, платёж создаётся ровно один раз
+    stub = app["stub"]
+    stub["fail_next"] = 2
+    payment = await client.create_payment(100, "https://t.me/bot", idempotence_key="retry-check")
+    again = await client.create_payment(100, "https://t.me/bot", idempotence_key="retry-check")
+    assert payment["id"] == again["id"] and len(stub["payments"]) == 1, "повтор создал второй платёж"
+    print(f"повторы: запросов к API {stub['requests']}, платежей {len(stub['payments'])}")
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def create(i):
+        async with semaphore:
+            await client.create_payment(100 + i, "https://t.me/bot", metadata={"telegram_id": i})
+
+    await asyncio.gather(*(create(i) for i in range(PAYMENTS)))
+    print(f"создано платежей: {len(stub['payments'])}")
+    for operation, stats in client.stats().items():
+        print(f"{operation}: {stats}")
+
+    await client.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+# Локальная заглушка API ЮKassa для разработки и нагрузочных прогонов.
+# Запуск: python bench/yookassa_stub.py  (затем YOOKASSA_API_URL=http://127.0.0.1:8765/v3)
+import os
+import sys
+import uuid
+import asyncio
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+STUB_PORT = int(os.getenv("YOOKASSA_STUB_PORT", "8765"))
+
+
+def add_payment(app: web.Application, amount: float, status: str = "succeeded", metadata: dict | None = None,
+                payment_id: str | None = None) -> dict:
+    payment = {
+        "id": payment_id or str(uuid.uuid4()),
+        "status": status,
+        "paid": status == "succeeded",
+        "amount": {"value": f"{amount:.2f}", "currency": "RUB"},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "metadata": metadata or {},
+    }
+    stub = app["stub"]
+    stub["payments"][payment["id"]] = payment
+    stub["order"].append(payment["id"])
+    return payment
+
+
+async def _maybe_fail(request: web.Request):
+    stub = request.app["stub"]
+    stub["requests"] += 1
+    if stub["delay"]:
+        await asyncio.sleep(stub["delay"])
+    if stub["fail_next"] > 0:
+        stub["fail_next"] -= 1
+        raise web.HTTPServiceUnavailable(text='{"type": "error", "code": "internal_server_error"}',
+                                         content_type="application/json")
+
+
+async def create_payment(request: web.Request):
+    await _maybe_fail(request)
+    key = request.headers.get("Idempotence-Key")
+    if not key:
+        return web.json_response({"type": "error", "code": "invalid_request"}, status=400)
+
+    stub = request.app["stub"]
+    if key in stub["idempotence"]:
+        return web.json_response(stub["payments"][stub["idempotence"][key]])
+
+    data = await request.json()
+    payment = add_payment(request.app, float(data["amount"]["value"]), status="pending", metadata=data.get("metadata"))
+    payment["description"] = data.get("description")
+    payment["confirmation"] = {
+        "type": "redirect",
+        "confirmation_url": f"http://127.0.0.1:{STUB_PORT}/pay/{payment['id']}",
+    }
+    stub["idempotence"][key] = payment["id"]
+    return web.json_response(payment)
+
+
+async def get_payment(request: web.Request):
+    await _maybe_fail(request)
+    payment = request.app["stub"]["payments"].get(request.match_info["payment_id"])
+    if payment is None:
+        return web.json_response({"type": "error", "code": "not_found"}, status=404)
+    return web.json_response(payment)
+
+
+async def list_payments(request: web.Request):
+    await _maybe_fail(request)
+    stub = request.app["stub"]
+    limit = min(int(request.query.get("limit", 10)), 100)
+    start = int(request.query.get("cursor", 0))
+    # Как и в настоящем API — от новых к старым
+    ids = stub["order"][::-1][start:start + limit]
+    body = {"type": "list", "items": [stub["payments"][payment_id] for payment_id in ids]}
+    if start + limit < len(stub["order"]):
+        body["next_cursor"] = str(start + limit)
+    return web.json_response(body)
+
+
+def create_stub_app() -> web.Application:
+    app = web.Application()
+    app["stub"] = {
+        "payments": {},
+        "order": [],
+        "idempotence": {},
+        "requests": 0,
+        "fail_next": 0,  # сколько следующих запросов ответить 503
+        "delay": 0.0,    # искусственная задержка ответа, секунды
+    }
+    app.router.add_post("/v3/payments", create_payment)
+    app.router.add_get("/v3/payments", list_payments)
+    app.router.add_get("/v3/payments/{payment_id}", get_payment)
+    return app
+
+
+async def start_stub(port: int = STUB_PORT) -> tuple[web.Application, web.AppRunner]:
+    app = create_stub_app()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return app, runner
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else STUB_PORT
+    web.run_app(create_stub_app(), host="127.0.0.1", port=port)
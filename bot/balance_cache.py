@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import socket
+import time
+
+from bot.config import BALANCE_CACHE_ENABLED, BALANCE_CACHE_TTL, BALANCE_CACHE_BIND, BALANCE_CACHE_PEERS
+
+logger = logging.getLogger("balance_cache")
+
+# telegram_id -> (баланс, момент устаревания). Заполняется при чтении из БД и обновляется сразу
+# после каждого изменения баланса в этом процессе. Изменения из других процессов приходят
+# инвалидацией, а если канал не настроен — запись просто устаревает через BALANCE_CACHE_TTL.
+_balances: dict[int, tuple[float, float]] = {}
+# telegram_id -> номер изменения. Растёт при каждой записи и инвалидации, чтобы значение,
+# прочитанное из БД до такого изменения, не затёрло в кэше более свежее.
+_versions: dict[int, int] = {}
+_stats = {"hits": 0, "misses": 0, "updates": 0, "invalidations": 0, "remote_invalidations": 0}
+
+_sock: socket.socket | None = None
+_transport: asyncio.DatagramTransport | None = None
+
+
+def _parse_addr(addr: str) -> tuple[str, int]:
+    host, port = addr.rsplit(":", 1)
+    return host, int(port)
+
+
+_peers = [_parse_addr(peer) for peer in BALANCE_CACHE_PEERS]
+
+
+def get_cached_balance(telegram_id: int) -> float | None:
+    if not BALANCE_CACHE_ENABLED:
+        return None
+    entry = _balances.get(telegram_id)
+    if entry is None or entry[1] <= time.monotonic():
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    return entry[0]
+
+
+def balance_version(telegram_id: int) -> int:
+    """Снимается до чтения баланса из БД и передаётся в fill_cached_balance."""
+    return _versions.get(telegram_id, 0)
+
+
+def _bump(telegram_id: int):
+    _versions[telegram_id] = _versions.get(telegram_id, 0) + 1
+
+
+def fill_cached_balance(telegram_id: int, balance: float, version: int):
+    """Кладёт в кэш баланс, прочитанный из БД, если с момента чтения его никто не менял."""
+    if not BALANCE_CACHE_ENABLED or _versions.get(telegram_id, 0) != version:
+        return
+    entry = _balances.get(telegram_id)
+    if entry is None or entry[1] <= time.monotonic():
+        _store(telegram_id, balance)
+
+
+def _store(telegram_id: int, balance: float):
+    _balances[telegram_id] = (float(balance), time.monotonic() + BALANCE_CACHE_TTL)
+
+
+def set_cached_balance(telegram_id: int, balance: float, notify: bool = True):
+    """Write-through: вызывается сразу после коммита нового баланса в БД."""
+    _bump(telegram_id)
+    if BALANCE_CACHE_ENABLED:
+        _store(telegram_id, balance)
+        _stats["updates"] += 1
+    if notify:
+        _notify_peers(telegram_id)
+
+
+def invalidate_balance(telegram_id: int, notify: bool = True):
+    _bump(telegram_id)
+    _balances.pop(telegram_id, None)
+    _stats["invalidations"] += 1
+    if notify:
+        _notify_peers(telegram_id)
+
+
+def balance_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "size": len(_balances), "hit_rate": _stats["hits"] / lookups if lookups else 0.0}
+
+
+# === Инвалидация между процессами ===
+# Каждый воркер слушает UDP-порт; при изменении баланса остальным отправляется
+# telegram_id, и они просто выкидывают запись из своего кэша.
+def _notify_peers(telegram_id: int):
+    global _sock
+    if not _peers:
+        return
+    if _sock is None:
+        _sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _sock.setblocking(False)
+    payload = str(telegram_id).encode()
+    for peer in _peers:
+        try:
+            _sock.sendto(payload, peer)
+        except OSError:
+            logger.warning(f"Не удалось отправить инвалидацию баланса на {peer}")
+
+
+class _InvalidationProtocol(asyncio.DatagramProtocol):
+    def datagram_received(self, data, addr):
+        try:
+            telegram_id = int(data.decode())
+        except ValueError:
+            return
+        _bump(telegram_id)
+        _balances.pop(telegram_id, None)
+        _stats["remote_invalidations"] += 1
+
+
+async def start_balance_cache_channel():
+    global _transport
+    if not BALANCE_CACHE_BIND or _transport is not None:
+        return
+    loop = asyncio.get_running_loop()
+    _transport, _ = await loop.create_datagram_endpoint(
+        _InvalidationProtocol, local_addr=_parse_addr(BALANCE_CACHE_BIND)
+    )
+    logger.info(f"Канал инвалидации балансов: {BALANCE_CACHE_BIND} -> {BALANCE_CACHE_PEERS}")
+
+
+def stop_balance_cache_channel():
+    global _transport
+    if _transport is not None:
+        _transport.close()
+        _transport = None
@@ -0,0 +1,97 @@
+import uuid
+import logging
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_session
+from database.models import User, PaymentRecord, DEBIT_STATUS, REFUND_STATUS
+from bot.config import FREE_GENERATIONS_ON_START
+from bot.balance_cache import get_cached_balance, set_cached_balance, balance_version, fill_cached_balance
+from bot.quota import release_generation, QUOTA_PAID
+
+logger = logging.getLogger("billing")
+
+
+async def get_user_balance(telegram_id: int) -> float:
+    """Баланс из кэша, иначе из БД; пользователя, которого ещё нет, заводит с нулевым балансом."""
+    cached = get_cached_balance(telegram_id)
+    if cached is not None:
+        return cached
+
+    # Версию снимаем до чтения: если пока идёт запрос, баланс успеют изменить,
+    # прочитанное значение уже устарело и в кэш не попадёт
+    version = balance_version(telegram_id)
+    async with async_session() as session:
+        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalars().first()
+        if user is None:
+            # Два хендлера одного нового пользователя могут прийти сюда одновременно
+            await session.execute(
+                insert(User).values(telegram_id=telegram_id, balance=0, remaining_generations=FREE_GENERATIONS_ON_START)
+                .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            )
+            await session.commit()
+            balance = 0.0
+        else:
+            balance = float(user.balance)
+    fill_cached_balance(telegram_id, balance, version)
+    return balance
+
+
+async def charge(telegram_id: int, amount: float) -> bool:
+    """Списывает amount одной записью. False, если пользователя нет или не хватает баланса."""
+    # Проверка и списание — одним UPDATE: пополнение из вебхука между чтением и записью не потеряется
+    async with async_session() as session:
+        async with session.begin():
+            row = (await session.execute(
+                update(User)
+                .where(User.telegram_id == telegram_id, User.balance >= amount)
+                .values(balance=User.balance - amount)
+                .returning(User.id, User.balance)
+            )).first()
+            if row is None:
+                return False
+            session.add(PaymentRecord(
+                user_id=row.id,
+                amount=amount,
+                payment_id=str(uuid.uuid4()),
+                status=DEBIT_STATUS
+            ))
+    set_cached_balance(telegram_id, row.balance)
+    return True
+
+
+async def refund(telegram_id: int, amount: float):
+    """Возвращает на баланс часть списания, за которую пользователь так ничего и не получил."""
+    async with async_session() as session:
+        async with session.begin():
+            row = (await session.execute(
+                update(User)
+                .where(User.telegram_id == telegram_id)
+                .values(balance=User.balance + amount)
+                .returning(User.id, User.balance)
+            )).first()
+            if row is None:
+                logger.error(f"Возврат {amount} ₽: пользователь {telegram_id} не найден")
+                return
+            session.add(PaymentRecord(
+                user_id=row.id,
+                amount=amount,
+                payment_id=str(uuid.uuid4()),
+                status=REFUND_STATUS
+            ))
+    set_cached_balance(telegram_id, row.balance)
+    logger.info(f"Возврат {amount} ₽ пользователю {telegram_id}")
+
+
+async def refund_generation(telegram_id: int, model: str, kind: str, price: float) -> str:
+    """Откатывает генерацию, которая не дошла до пользователя: деньги или бесплатную генерацию.
+
+    Возвращает строку для сообщения об ошибке.
+    """
+    release_generation(telegram_id, model, kind)
+    if kind == QUOTA_PAID:
+        await refund(telegram_id, price)
+        return "💰 Списанная сумма возвращена на баланс."
+    return "🎁 Бесплатная генерация возвращена."
@@ -7,6 +7,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from database.db import async_session
 from database.models import User  # импортируем из bot.models, как у вас
+from bot.balance_cache import invalidate_balance
 
 async def change_user_balance(telegram_id: int, amount: float):
     async with async_session() as session:
@@ -23,7 +24,12 @@ async def change_user_balance(telegram_id: int, amount: float):
             # session.begin() автоматически коммитит изменения,
             # но если нужно, можно вызвать await session.commit()
 
-            print(f"Баланс пользователя {user.username} ({telegram_id}) изменён на {amount}. Новый баланс: {user.balance}")
+        # Скрипт работает в отдельном процессе — сообщаем запущенным воркерам бота,
+        # чтобы они перечитали баланс из БД. Доходит до адресов из BALANCE_CACHE_PEERS;
+        # без них бот увидит новый баланс через BALANCE_CACHE_TTL секунд.
+        invalidate_balance(telegram_id)
+
+        print(f"Баланс пользователя {user.username} ({telegram_id}) изменён на {amount}. Новый баланс: {user.balance}")
 
 if __name__ == "__main__":
     telegram_id = 679030923
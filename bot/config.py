@@ -14,6 +14,22 @@ NO_GENERATION_MESSAGE = "Недостаточно средств на балан
 # Количество бесплатных генераций новому пользователю
 FREE_GENERATIONS_ON_START = 1
 
+# Модели, на которые можно потратить общие бесплатные генерации (самые дешёвые)
+FREE_GENERATION_MODELS = {"ideogram", "imagegen4", "flux", "musicgen", "chatterbox"}
+
+# Отдельные бесплатные генерации по моделям: {"chatterbox": 1, ...}
+FREE_GENERATIONS_PER_MODEL = {}
+
+# Дневной лимит генераций на пользователя (0 — без лимита) и лимиты по моделям
+DAILY_GENERATION_CAP = int(os.getenv("DAILY_GENERATION_CAP", "100"))
+DAILY_GENERATION_CAPS_PER_MODEL = {
+    "veo3": 10,
+    "kling": 20,
+}
+
+# Как часто счётчики квот сбрасываются в БД (секунды); столько же может потеряться при падении процесса
+QUOTA_FLUSH_INTERVAL = int(os.getenv("QUOTA_FLUSH_INTERVAL", "30"))
+
 # Разрешить ли генерацию при нуле (например, для отладки)
 ALLOW_GENERATION_WHEN_ZERO = False
 
@@ -21,10 +37,33 @@ ALLOW_GENERATION_WHEN_ZERO = False
 PRICE_CHATTERBOX = 14.0
 PRICE_IMAGE_GEN = 14.0 
 
+# Кэш балансов в памяти. Если запущено несколько воркеров, они сообщают друг другу
+# об изменениях по UDP: BALANCE_CACHE_BIND="127.0.0.1:9901",
+# BALANCE_CACHE_PEERS="127.0.0.1:9902,127.0.0.1:9903".
+# bot/change_balance.py шлёт инвалидацию тем же адресам из BALANCE_CACHE_PEERS: чтобы бот
+# увидел правку сразу, у бота задаётся BALANCE_CACHE_BIND, а у скрипта — PEERS с этим адресом.
+# Без этого запись устаревает сама через BALANCE_CACHE_TTL секунд.
+BALANCE_CACHE_ENABLED = os.getenv("BALANCE_CACHE_ENABLED", "1") == "1"
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "60"))
+BALANCE_CACHE_BIND = os.getenv("BALANCE_CACHE_BIND", "")
+BALANCE_CACHE_PEERS = [p.strip() for p in os.getenv("BALANCE_CACHE_PEERS", "").split(",") if p.strip()]
+
+# Сколько file_id уже отправленных файлов держать в памяти (остальные читаются из БД)
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "10000"))
+
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 YOOKASSA_SHOP_ID = os.getenv("YOOKASSA_SHOP_ID")
 YOOKASSA_API_KEY = os.getenv("YOOKASSA_API_KEY")
+YOOKASSA_API_URL = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3")
+YOOKASSA_TIMEOUT = float(os.getenv("YOOKASSA_TIMEOUT", "10"))  # секунды на весь запрос
+YOOKASSA_MAX_RETRIES = int(os.getenv("YOOKASSA_MAX_RETRIES", "3"))
+
+# Вебхуки ЮKassa: секрет подписи, порт HTTP-сервера, размер очереди и число обработчиков
+YOOKASSA_WEBHOOK_SECRET = os.getenv("YOOKASSA_WEBHOOK_SECRET")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))  # SQLite всё равно пишет в один поток
 
 # Этот токен используется Telegram при выставлении счета через бот @YooKassaTestShopBot
 # Обрати внимание: это НЕ YOOKASSA_API_KEY, а именно Telegram-совместимый токен
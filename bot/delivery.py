@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from collections import deque
+
+import aiohttp
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramEntityTooLarge
+from aiogram.types import BufferedInputFile, FSInputFile, Message, InputMediaPhoto, InputMediaVideo
+
+from bot.file_cache import remember_result
+from media.audio import TranscodeError
+from media.stream import download_spooled, DownloadError
+from media.pool import media_pool_busy
+from media.video import contact_sheet, prepare_video, PreparedVideo, VIDEO_POSTPROCESS
+
+logger = logging.getLogger("delivery")
+
+URL, UPLOAD, LINK = "url", "upload", "link"
+
+# Сколько Telegram готов скачать по ссылке сам и сколько принимает загрузкой от бота
+URL_LIMITS = {"photo": 5 * 1024 * 1024}
+URL_LIMIT_DEFAULT = 20 * 1024 * 1024
+UPLOAD_LIMITS = {"photo": 10 * 1024 * 1024}
+UPLOAD_LIMIT_DEFAULT = 50 * 1024 * 1024
+# Видео в этих контейнерах Telegram показывает со стримингом и по ссылке
+URL_VIDEO_TYPES = ("video/mp4",)
+
+# По последним попыткам решаем, не пора ли начинать с загрузки вместо ссылки
+HISTORY_SIZE = 50
+MIN_ATTEMPTS = 5
+MIN_URL_SUCCESS_RATE = 0.5
+
+DELIVERY_ERRORS = (TelegramBadRequest, TelegramNetworkError, TelegramEntityTooLarge,
+                   DownloadError, TranscodeError, aiohttp.ClientError, TimeoutError)
+
+# (модель, тип медиа, способ) -> последние исходы: True — доставлено
+_history: dict[tuple[str | None, str, str], deque[bool]] = {}
+_stats: dict[str, int] = {URL: 0, UPLOAD: 0, LINK: 0, "failures": 0}
+
+
+def _record(model: str | None, media_type: str, strategy: str, ok: bool):
+    _history.setdefault((model, media_type, strategy), deque(maxlen=HISTORY_SIZE)).append(ok)
+    if ok:
+        _stats[strategy] += 1
+    else:
+        _stats["failures"] += 1
+
+
+def success_rate(model: str | None, media_type: str, strategy: str) -> float | None:
+    history = _history.get((model, media_type, strategy))
+    if not history or len(history) < MIN_ATTEMPTS:
+        return None
+    return sum(history) / len(history)
+
+
+async def _head(url: str) -> tuple[int | None, str | None]:
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                if resp.status != 200:
+                    return None, None
+                return resp.content_length, resp.content_type
+    except (aiohttp.ClientError, TimeoutError):
+        return None, None
+
+
+async def plan(media_type: str, url: str, model: str | None = None) -> list[str]:
+    """Порядок способов доставки: от дешёвого к надёжному."""
+    strategies = [URL, UPLOAD]
+    size, content_type = await _head(url)
+    if media_type == "video" and VIDEO_POSTPROCESS:
+        # Ссылку Telegram скачает сам; готовить видео (faststart, превью, H.264) стоит,
+        # только если mp4 по ссылке он, скорее всего, не примет
+        if size is None or size > URL_LIMIT_DEFAULT or content_type not in URL_VIDEO_TYPES:
+            return [UPLOAD, URL]
+    elif size is not None and size > URL_LIMITS.get(media_type, URL_LIMIT_DEFAULT):
+        strategies = [UPLOAD]
+        if size > UPLOAD_LIMITS.get(media_type, UPLOAD_LIMIT_DEFAULT):
+            strategies = []
+        return strategies
+
+    rate = success_rate(model, media_type, URL)
+    if rate is not None and rate < MIN_URL_SUCCESS_RATE:
+        strategies = [UPLOAD, URL]
+    return strategies
+
+
+async def _send(message: Message, media_type: str, file, **kwargs) -> Message:
+    return await getattr(message, f"answer_{media_type}")(file, **kwargs)
+
+
+async def send_prepared_video(message: Message, video: PreparedVideo, **kwargs) -> Message:
+    return await _send(
+        message, "video", FSInputFile(video.path, filename="video.mp4"),
+        thumbnail=FSInputFile(video.thumbnail) if video.thumbnail else None,
+        width=video.width, height=video.height, duration=round(video.duration),
+        supports_streaming=True, **kwargs,
+    )
+
+
+async def _send_upload(message: Message, media_type: str, url: str, **kwargs) -> Message:
+    if media_type == "video" and VIDEO_POSTPROCESS:
+        async with prepare_video(url) as video:
+            return await send_prepared_video(message, video, **kwargs)
+
+    filename = url.rsplit("/", 1)[-1].split("?", 1)[0] or media_type
+    async with aiohttp.ClientSession() as session:
+        async with download_spooled(session, url, filename) as file:
+            return await _send(message, media_type, file, **kwargs)
+
+
+async def deliver(message: Message, media_type: str, url: str, model: str | None = None,
+                  link_text: str = "⚠️ Не удалось отправить файл в Telegram. Результат можно скачать по ссылке:",
+                  **kwargs) -> Message:
+    """Доставляет результат генерации в чат message: ссылкой или загрузкой.
+
+    Способы пробуются по порядку из plan(); если не сработал ни один, пользователь получает
+    текстовую ссылку, чтобы оплаченная генерация не пропала.
+    """
+    for strategy in await plan(media_type, url, model):
+        try:
+            if strategy == URL:
+                sent = await _send(message, media_type, url, **kwargs)
+            else:
+                sent = await _send_upload(message, media_type, url, **kwargs)
+        except DELIVERY_ERRORS as e:
+            logger.warning(f"Доставка {media_type} ({model}) способом {strategy} не удалась: {e}")
+            _record(model, media_type, strategy, False)
+            continue
+
+        _record(model, media_type, strategy, True)
+        await remember_result(message.chat.id, sent, model)
+        logger.info(f"Доставка {media_type} ({model}): {strategy}")
+        return sent
+
+    _record(model, media_type, LINK, True)
+    logger.error(f"Результат {model} не доставлен в чат {message.chat.id}, отправлена ссылка: {url}")
+    return await message.answer(f"{link_text}\n{url}")
+
+
+ALBUM_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo}
+
+
+async def deliver_album(message: Message, media_type: str, urls: list[str], model: str | None = None,
+                        caption: str | None = None, captions: list[str | None] | None = None,
+                        **kwargs) -> list[Message]:
+    """Несколько результатов одним альбомом (от 2 до 10 штук).
+
+    Подпись caption ставится у первого элемента; captions — свои подписи у каждого.
+
+    Альбом уходит ссылками одним запросом; если Telegram его не принял, каждый результат
+    доставляется по отдельности через deliver() со всеми его запасными способами.
+    """
+    if captions is None:
+        captions = [caption] + [None] * (len(urls) - 1)
+    if len(urls) == 1:
+        return [await deliver(message, media_type, urls[0], model=model, caption=captions[0], **kwargs)]
+
+    media = [ALBUM_MEDIA[media_type](media=url, caption=item_caption, **kwargs)
+             for url, item_caption in zip(urls, captions)]
+    try:
+        sent = await message.answer_media_group(media)
+    except DELIVERY_ERRORS as e:
+        logger.warning(f"Альбом {media_type} ({model}) не отправлен, доставляем по одному: {e}")
+        _record(model, media_type, URL, False)
+        return [await deliver(message, media_type, url, model=model, caption=item_caption, **kwargs)
+                for url, item_caption in zip(urls, captions)]
+
+    _record(model, media_type, URL, True)
+    # Повторно присылается первый элемент альбома — тот, что с подписью
+    await remember_result(message.chat.id, sent[0], model)
+    logger.info(f"Доставка альбома {media_type} ({model}): {len(urls)} шт.")
+    return sent
+
+
+async def send_contact_sheet(message: Message, url: str, model: str | None = None,
+                             caption: str = "👀 Раскадровка. Видео загружается...") -> Message | None:
+    try:
+        if media_pool_busy():
+            # Все слоты заняты — раскадровка встала бы в очередь перед самим видео
+            logger.info(f"Раскадровка {model} пропущена: медиа-пул занят")
+            return None
+        sheet = await contact_sheet(url)
+        return await _send(message, "photo", BufferedInputFile(sheet, filename="preview.jpg"), caption=caption)
+    except Exception:
+        # Раскадровка — только приятное дополнение, видео всё равно придёт
+        logger.warning(f"Раскадровка {model} не отправлена", exc_info=True)
+        return None
+
+
+async def deliver_video(message: Message, url: str, model: str | None = None, **kwargs) -> Message:
+    """deliver() для видео с раскадровкой вперёд.
+
+    Раскадровке хватает нескольких коротких запросов по ссылке, поэтому она приходит,
+    пока само видео ещё скачивается, перекодируется и загружается.
+    """
+    preview = asyncio.create_task(send_contact_sheet(message, url, model))
+    try:
+        return await deliver(message, "video", url, model=model, **kwargs)
+    finally:
+        # Видео уже в чате — раскадровка после него ни к чему
+        preview.cancel()
+
+
+def delivery_stats() -> dict:
+    rates = {f"{model}/{media_type}/{strategy}": round(sum(h) / len(h), 2)
+             for (model, media_type, strategy), h in _history.items() if h}
+    return {**_stats, "success_rates": rates}
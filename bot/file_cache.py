@@ -0,0 +1,120 @@
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_session
+from database.models import MediaFile
+from bot.config import FILE_CACHE_SIZE
+
+logger = logging.getLogger("file_cache")
+
+MEDIA_TYPES = ("photo", "video", "animation", "audio", "voice", "document")
+
+# key -> (media_type, file_id). Самые свежие в конце; лишнее вытесняется, но остаётся в БД.
+_files: OrderedDict[str, tuple[str, str]] = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "stored": 0, "stale": 0}
+
+
+def last_result_key(telegram_id: int) -> str:
+    """Ключ последнего результата, отправленного в чат. Ссылки Replicate и содержимое
+    у каждой генерации свои, а повторяется именно просьба прислать результат ещё раз."""
+    return f"last:{telegram_id}"
+
+
+def _remember_in_memory(key: str, media_type: str, file_id: str):
+    _files[key] = (media_type, file_id)
+    _files.move_to_end(key)
+    while len(_files) > FILE_CACHE_SIZE:
+        _files.popitem(last=False)
+
+
+async def get_cached_file(key: str) -> tuple[str, str] | None:
+    cached = _files.get(key)
+    if cached is not None:
+        _files.move_to_end(key)
+        _stats["hits"] += 1
+        return cached
+
+    async with async_session() as session:
+        row = (await session.execute(select(MediaFile).where(MediaFile.key == key))).scalars().first()
+    if row is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["hits"] += 1
+    _remember_in_memory(key, row.media_type, row.file_id)
+    return row.media_type, row.file_id
+
+
+async def remember_file(key: str, media_type: str, file_id: str, telegram_id: int | None = None,
+                        model: str | None = None):
+    _remember_in_memory(key, media_type, file_id)
+    stmt = insert(MediaFile).values(
+        key=key, media_type=media_type, file_id=file_id, telegram_id=telegram_id, model=model
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaFile.key],
+        set_={"media_type": stmt.excluded.media_type, "file_id": stmt.excluded.file_id},
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def forget_file(key: str):
+    _files.pop(key, None)
+    async with async_session() as session:
+        await session.execute(delete(MediaFile).where(MediaFile.key == key))
+        await session.commit()
+
+
+def sent_file(message: Message) -> tuple[str, str] | None:
+    """(media_type, file_id) из отправленного сообщения. Telegram может сменить тип, например видео -> animation."""
+    if message.photo:
+        return "photo", message.photo[-1].file_id
+    for media_type in MEDIA_TYPES[1:]:
+        media = getattr(message, media_type)
+        if media is not None:
+            return media_type, media.file_id
+    return None
+
+
+async def remember_result(telegram_id: int, sent: Message, model: str | None = None):
+    """Запоминает file_id только что доставленного результата как последний в чате."""
+    file = sent_file(sent)
+    if file:
+        _stats["stored"] += 1
+        await remember_file(last_result_key(telegram_id), *file, telegram_id=telegram_id, model=model)
+
+
+async def answer_media(message: Message, media_type: str, source, model: str | None = None, **kwargs) -> Message:
+    """Отвечает медиа в чат message и запоминает его как последний результат."""
+    sent = await getattr(message, f"answer_{media_type}")(source, **kwargs)
+    await remember_result(message.chat.id, sent, model)
+    return sent
+
+
+async def send_cached_media(bot: Bot, chat_id: int, key: str, **kwargs) -> Message | None:
+    """Отправляет уже отправленный файл по file_id, без загрузки. None, если файла нет или он протух."""
+    cached = await get_cached_file(key)
+    if cached is None:
+        return None
+    media_type, file_id = cached
+    try:
+        return await getattr(bot, f"send_{media_type}")(chat_id, file_id, **kwargs)
+    except TelegramBadRequest:
+        # file_id мог протухнуть (например, после смены токена бота)
+        logger.warning(f"file_id для {key} отклонён Telegram")
+        _stats["stale"] += 1
+        await forget_file(key)
+        return None
+
+
+def file_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "size": len(_files), "hit_rate": _stats["hits"] / lookups if lookups else 0.0}
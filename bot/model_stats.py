@@ -0,0 +1,66 @@
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_session
+from database.models import ModelStat
+
+logger = logging.getLogger("model_stats")
+
+# Пока запусков меньше, средним значениям не доверяем и в подсказках их не показываем
+MIN_RUNS_FOR_HINT = 3
+
+
+async def _execute(stmt):
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(stmt)
+    except Exception:
+        # Статистика вспомогательная: из-за неё генерация не должна падать
+        logger.exception("Не удалось записать статистику моделей")
+
+
+async def _upsert(model: str, **deltas):
+    stmt = insert(ModelStat).values(model=model, **deltas)
+    await _execute(stmt.on_conflict_do_update(
+        index_elements=[ModelStat.model],
+        set_={name: getattr(ModelStat, name) + getattr(stmt.excluded, name) for name in deltas},
+    ))
+
+
+async def record_run(model: str, latency: float | None):
+    """Один запуск модели; latency=None — запуск не удался."""
+    if latency is None:
+        await _upsert(model, runs=1, failures=1)
+    else:
+        await _upsert(model, runs=1, latency_total=latency)
+
+
+async def record_pick(model: str):
+    await _upsert(model, picks=1)
+
+
+async def load_model_stats(models) -> dict[str, dict]:
+    """Средняя задержка, доля отказов и доля выборов по моделям, у которых достаточно запусков."""
+    async with async_session() as session:
+        rows = (await session.execute(select(ModelStat).where(ModelStat.model.in_(list(models))))).scalars()
+        stats = {}
+        for row in rows:
+            succeeded = row.runs - row.failures
+            if row.runs < MIN_RUNS_FOR_HINT or not succeeded:
+                continue
+            stats[row.model] = {
+                "latency": row.latency_total / succeeded,
+                "failure_rate": row.failures / row.runs,
+                "pick_rate": row.picks / succeeded,
+            }
+    return stats
+
+
+def preferred_model(stats: dict[str, dict]) -> str | None:
+    """Модель по умолчанию: чаще выбирают, при равенстве — быстрее."""
+    if not stats:
+        return None
+    return max(stats, key=lambda model: (stats[model]["pick_rate"], -stats[model]["latency"]))
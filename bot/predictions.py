@@ -0,0 +1,56 @@
+import os
+import time
+import asyncio
+import logging
+
+import replicate
+
+logger = logging.getLogger("predictions")
+
+REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+PREDICTION_POLL_INTERVAL = float(os.getenv("PREDICTION_POLL_INTERVAL", "2"))
+PREDICTION_TIMEOUT = float(os.getenv("PREDICTION_TIMEOUT", "900"))
+
+_client: replicate.Client | None = None
+
+
+class PredictionError(Exception):
+    def __init__(self, prediction_id: str | None, status: str, error=None):
+        super().__init__(f"Prediction {prediction_id} завершился со статусом {status}: {error}")
+        self.prediction_id = prediction_id
+        self.status = status
+        self.error = error
+
+
+def get_replicate_client() -> replicate.Client:
+    global _client
+    if _client is None:
+        _client = replicate.Client(api_token=REPLICATE_API_TOKEN)
+    return _client
+
+
+async def run_prediction(input: dict, model: str | None = None, version: str | None = None,
+                         poll_interval: float = PREDICTION_POLL_INTERVAL,
+                         timeout: float = PREDICTION_TIMEOUT):
+    """Запускает prediction в Replicate, не блокируя цикл событий, и возвращает его output."""
+    client = get_replicate_client()
+    target = {"model": model} if model else {"version": version}
+    started = time.perf_counter()
+    prediction = await client.predictions.async_create(input=input, **target)
+    try:
+        async with asyncio.timeout(timeout):
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                await asyncio.sleep(poll_interval)
+                prediction = await client.predictions.async_get(prediction.id)
+    except (TimeoutError, asyncio.CancelledError):
+        # Незачем платить за результат, который уже никто не ждёт
+        try:
+            await client.predictions.async_cancel(prediction.id)
+        except Exception:
+            logger.warning(f"Не удалось отменить prediction {prediction.id}", exc_info=True)
+        raise
+
+    if prediction.status != "succeeded":
+        raise PredictionError(prediction.id, prediction.status, prediction.error)
+    logger.info(f"Prediction {prediction.id} ({model or version}) готов за {time.perf_counter() - started:.1f} с")
+    return prediction.output
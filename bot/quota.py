@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import async_session
+from database.models import User, GenerationUsage
+from bot.config import (
+    FREE_GENERATIONS_ON_START,
+    FREE_GENERATION_MODELS,
+    FREE_GENERATIONS_PER_MODEL,
+    DAILY_GENERATION_CAP,
+    DAILY_GENERATION_CAPS_PER_MODEL,
+    QUOTA_FLUSH_INTERVAL,
+)
+
+logger = logging.getLogger("quota")
+
+# Результат проверки квоты
+QUOTA_PAID = "paid"              # обычная платная генерация
+QUOTA_FREE = "free"              # из общих бесплатных генераций (users.remaining_generations)
+QUOTA_MODEL_FREE = "model_free"  # из бесплатных генераций конкретной модели
+QUOTA_CAPPED = "capped"          # дневной лимит исчерпан
+
+QUOTA_CAPPED_MESSAGE = "⛔ Дневной лимит генераций для этой модели исчерпан. Попробуйте завтра."
+
+# === Счётчики в памяти ===
+# Проверка на подтверждении генерации идёт только по ним, без запросов к БД.
+# Счётчики у каждого процесса свои: бот рассчитан на один процесс-поллер, при нескольких
+# лимиты считаются отдельно в каждом. При штатной остановке main.py сбрасывает их в БД,
+# а при падении процесса теряется то, что накопилось с последнего сброса
+# (не больше QUOTA_FLUSH_INTERVAL секунд генераций).
+_remaining: dict[int, int] = {}                                  # telegram_id -> общие бесплатные
+_model_free_used: dict[tuple[int, str], int] = defaultdict(int)  # (telegram_id, model) -> бесплатных по модели
+_daily: dict[tuple[int, str], int] = defaultdict(int)            # (telegram_id, model) -> генераций за сегодня
+_day = date.today()
+
+# Что ещё не записано в БД
+_dirty_remaining: set[int] = set()
+_pending_usage: dict[tuple[int, str, date], list[int]] = {}      # (telegram_id, model, day) -> [count, free_used]
+
+
+def _rollover():
+    global _day
+    today = date.today()
+    if today != _day:
+        _day = today
+        _daily.clear()
+
+
+def _add_usage(telegram_id: int, model: str, count: int = 0, free_used: int = 0):
+    delta = _pending_usage.setdefault((telegram_id, model, _day), [0, 0])
+    delta[0] += count
+    delta[1] += free_used
+
+
+def _daily_cap(model: str) -> int:
+    return DAILY_GENERATION_CAPS_PER_MODEL.get(model, DAILY_GENERATION_CAP)
+
+
+def _model_free_left(telegram_id: int, model: str) -> int:
+    return FREE_GENERATIONS_PER_MODEL.get(model, 0) - _model_free_used[(telegram_id, model)]
+
+
+def _remaining_free(telegram_id: int, model: str) -> int:
+    if model not in FREE_GENERATION_MODELS:
+        return 0
+    # Пользователя нет в памяти — значит, он появился после старта и получил стартовые генерации
+    return _remaining.get(telegram_id, FREE_GENERATIONS_ON_START)
+
+
+def has_free_generation(telegram_id: int, model: str) -> bool:
+    return _model_free_left(telegram_id, model) > 0 or _remaining_free(telegram_id, model) > 0
+
+
+def acquire_generation(telegram_id: int, model: str, allow_free: bool = True) -> str:
+    """Резервирует генерацию: проверяет дневной лимит и тратит бесплатную генерацию, если она есть.
+
+    allow_free=False — для дорогих режимов модели, которые бесплатными генерациями не покрываются.
+    """
+    _rollover()
+    key = (telegram_id, model)
+
+    cap = _daily_cap(model)
+    if cap and _daily[key] >= cap:
+        return QUOTA_CAPPED
+
+    _daily[key] += 1
+    _add_usage(telegram_id, model, count=1)
+
+    if not allow_free:
+        return QUOTA_PAID
+
+    if _model_free_left(telegram_id, model) > 0:
+        _model_free_used[key] += 1
+        _add_usage(telegram_id, model, free_used=1)
+        return QUOTA_MODEL_FREE
+
+    remaining = _remaining_free(telegram_id, model)
+    if remaining > 0:
+        _remaining[telegram_id] = remaining - 1
+        _dirty_remaining.add(telegram_id)
+        return QUOTA_FREE
+
+    return QUOTA_PAID
+
+
+def release_generation(telegram_id: int, model: str, kind: str):
+    """Откатывает acquire_generation, если генерация так и не началась (например, не удалось списать средства)."""
+    if kind == QUOTA_CAPPED:
+        return
+
+    _rollover()
+    key = (telegram_id, model)
+    if _daily[key] > 0:
+        _daily[key] -= 1
+        _add_usage(telegram_id, model, count=-1)
+
+    if kind == QUOTA_MODEL_FREE:
+        _model_free_used[key] -= 1
+        _add_usage(telegram_id, model, free_used=-1)
+    elif kind == QUOTA_FREE:
+        _remaining[telegram_id] = _remaining.get(telegram_id, 0) + 1
+        _dirty_remaining.add(telegram_id)
+
+
+# === Синхронизация с БД ===
+async def load_quota():
+    """Восстанавливает счётчики из БД после перезапуска."""
+    global _day
+    _day = date.today()
+    _remaining.clear()
+    _model_free_used.clear()
+    _daily.clear()
+
+    async with async_session() as session:
+        result = await session.execute(select(User.telegram_id, User.remaining_generations))
+        _remaining.update({tg_id: remaining for tg_id, remaining in result})
+
+        result = await session.execute(
+            select(GenerationUsage.telegram_id, GenerationUsage.model, func.sum(GenerationUsage.free_used))
+            .group_by(GenerationUsage.telegram_id, GenerationUsage.model)
+        )
+        for tg_id, model, free_used in result:
+            _model_free_used[(tg_id, model)] = free_used or 0
+
+        result = await session.execute(
+            select(GenerationUsage.telegram_id, GenerationUsage.model, GenerationUsage.count)
+            .where(GenerationUsage.day == _day)
+        )
+        for tg_id, model, count in result:
+            _daily[(tg_id, model)] = count
+
+    logger.info(f"Квоты загружены: пользователей {len(_remaining)}, счётчиков за сегодня {len(_daily)}")
+
+
+async def flush_quota():
+    if not _dirty_remaining and not _pending_usage:
+        return
+
+    # Забираем изменения до await, чтобы новые генерации попали в следующий сброс
+    remaining = {tg_id: _remaining[tg_id] for tg_id in _dirty_remaining}
+    usage = dict(_pending_usage)
+    _dirty_remaining.clear()
+    _pending_usage.clear()
+    missing = set()
+
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                for tg_id, value in remaining.items():
+                    # Пользователей квоты не создают: их заводит бот при первом обращении к балансу
+                    result = await session.execute(
+                        update(User).where(User.telegram_id == tg_id).values(remaining_generations=value)
+                    )
+                    if not result.rowcount:
+                        missing.add(tg_id)
+
+                for (tg_id, model, day), (count, free_used) in usage.items():
+                    stmt = insert(GenerationUsage).values(
+                        telegram_id=tg_id, model=model, day=day, count=count, free_used=free_used
+                    )
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[GenerationUsage.telegram_id, GenerationUsage.model, GenerationUsage.day],
+                        set_={
+                            "count": GenerationUsage.count + stmt.excluded.count,
+                            "free_used": GenerationUsage.free_used + stmt.excluded.free_used,
+                        },
+                    ))
+    except Exception:
+        # Возвращаем несохранённые изменения, чтобы не потерять их
+        _dirty_remaining.update(remaining)
+        for key, (count, free_used) in usage.items():
+            delta = _pending_usage.setdefault(key, [0, 0])
+            delta[0] += count
+            delta[1] += free_used
+        raise
+    # Строки ещё нет — запишем, когда она появится
+    _dirty_remaining.update(missing)
+
+
+async def quota_flush_loop(interval: int = QUOTA_FLUSH_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_quota()
+        except Exception:
+            logger.exception("Ошибка при сохранении квот")
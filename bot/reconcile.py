@@ -0,0 +1,158 @@
+# Сверка платежей: локальные payment_records (пополнения из Telegram и вебхуков)
+# против списка платежей ЮKassa. Память не зависит от числа платежей: удалённые
+# платежи постранично складываются во временную таблицу SQLite, а расхождения
+# читаются потоково через курсор.
+#
+# Запуск: python bot/reconcile.py [--days 30] [--report reconcile.csv]
+import os
+import sys
+import csv
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+
+from database.db import engine
+from database.models import DEBIT_STATUS, REFUND_STATUS
+from bot.yookassa import YooKassaClient, get_yookassa_client
+
+logger = logging.getLogger("reconcile")
+
+PAGE_SIZE = 100
+STREAM_BATCH = 500
+
+# Каждый запрос возвращает строки одного вида расхождений
+CHECKS = {
+    # ЮKassa вернула один и тот же платёж несколько раз
+    "duplicate_remote": """
+        SELECT payment_id, NULL, MAX(amount), NULL, MAX(status), NULL, MAX(telegram_id)
+        FROM reconcile_remote
+        GROUP BY payment_id
+        HAVING COUNT(*) > 1
+    """,
+    # Успешный платёж есть в ЮKassa, но не зачислен у нас
+    "missing_local": """
+        SELECT r.payment_id, NULL, r.amount, NULL, r.status, NULL, r.telegram_id
+        FROM (SELECT DISTINCT payment_id, amount, status, telegram_id FROM reconcile_remote) r
+        LEFT JOIN payment_records p ON p.payment_id = r.payment_id
+        WHERE p.id IS NULL AND r.status = 'succeeded'
+    """,
+    # Зачисление у нас есть, а в ЮKassa такого платежа нет
+    "missing_remote": """
+        SELECT p.payment_id, p.amount, NULL, p.status, NULL, u.telegram_id, NULL
+        FROM payment_records p
+        JOIN users u ON u.id = p.user_id
+        WHERE p.status NOT IN (:debit_status, :refund_status) AND p.created_at >= :since
+          AND NOT EXISTS (SELECT 1 FROM reconcile_remote r WHERE r.payment_id = p.payment_id)
+    """,
+    # Платёж есть в обоих местах, но сумма, статус или пользователь не совпадают
+    "mismatch": """
+        SELECT p.payment_id, p.amount, r.amount, p.status, r.status, u.telegram_id, r.telegram_id
+        FROM payment_records p
+        JOIN users u ON u.id = p.user_id
+        JOIN (SELECT DISTINCT payment_id, amount, status, telegram_id FROM reconcile_remote) r
+          ON r.payment_id = p.payment_id
+        WHERE ABS(p.amount - r.amount) > 0.005
+           OR p.status != r.status
+           OR (r.telegram_id IS NOT NULL AND r.telegram_id != u.telegram_id)
+    """,
+}
+
+REPORT_COLUMNS = [
+    "kind", "payment_id", "local_amount", "remote_amount",
+    "local_status", "remote_status", "local_telegram_id", "remote_telegram_id",
+]
+
+
+async def _load_remote(conn, client: YooKassaClient, since: datetime) -> int:
+    loaded = 0
+    cursor = None
+    while True:
+        page = await client.list_payments(
+            cursor=cursor, limit=PAGE_SIZE, **{"created_at.gte": since.isoformat()}
+        )
+        rows = []
+        for payment in page.get("items", []):
+            telegram_id = (payment.get("metadata") or {}).get("telegram_id")
+            rows.append({
+                "payment_id": payment["id"],
+                "amount": float(payment["amount"]["value"]),
+                "status": payment["status"],
+                "telegram_id": int(telegram_id) if telegram_id else None,
+            })
+        if rows:
+            await conn.execute(
+                text("INSERT INTO reconcile_remote VALUES (:payment_id, :amount, :status, :telegram_id)"), rows
+            )
+            loaded += len(rows)
+
+        cursor = page.get("next_cursor")
+        if not cursor:
+            return loaded
+
+
+async def reconcile(since: datetime, report_path: str | None = None, client: YooKassaClient | None = None) -> dict:
+    client = client or get_yookassa_client()
+    summary = {kind: 0 for kind in CHECKS}
+    report_file = open(report_path, "w", newline="") if report_path else None
+    writer = csv.writer(report_file) if report_file else None
+    if writer:
+        writer.writerow(REPORT_COLUMNS)
+
+    try:
+        async with engine.connect() as conn:
+            # Временная таблица живёт только в этом соединении и не трогает основную схему
+            await conn.execute(text(
+                "CREATE TEMP TABLE IF NOT EXISTS reconcile_remote "
+                "(payment_id TEXT, amount REAL, status TEXT, telegram_id INTEGER)"
+            ))
+            await conn.execute(text("DELETE FROM reconcile_remote"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS temp.ix_reconcile_remote ON reconcile_remote (payment_id)"
+            ))
+            summary["remote_total"] = await _load_remote(conn, client, since)
+
+            params = {"debit_status": DEBIT_STATUS, "refund_status": REFUND_STATUS, "since": since.strftime("%Y-%m-%d %H:%M:%S")}
+            for kind, query in CHECKS.items():
+                result = await conn.stream(
+                    text(query).execution_options(yield_per=STREAM_BATCH),
+                    params if ":since" in query else {},
+                )
+                async for row in result:
+                    summary[kind] += 1
+                    if writer:
+                        writer.writerow([kind, *row])
+                    else:
+                        logger.warning(f"[{kind}] {dict(zip(REPORT_COLUMNS[1:], row))}")
+
+            await conn.execute(text("DROP TABLE reconcile_remote"))
+            await conn.commit()
+    finally:
+        if report_file:
+            report_file.close()
+
+    logger.info(f"Сверка платежей с {since:%Y-%m-%d}: {summary}")
+    return summary
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сверка платежей с ЮKassa")
+    parser.add_argument("--days", type=int, default=30, help="за сколько последних дней сверять")
+    parser.add_argument("--report", help="CSV-файл для списка расхождений")
+    args = parser.parse_args()
+
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    try:
+        summary = await reconcile(since, args.report)
+    finally:
+        await get_yookassa_client().close()
+    print(summary)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
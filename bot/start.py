@@ -3,6 +3,9 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, C
 from bot.invoice import create_invoice
 from database.db import async_session
 from database.models import User, PaymentRecord
+from bot.balance_cache import set_cached_balance
+from bot.config import FREE_GENERATIONS_ON_START
+from bot.billing import get_user_balance
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 import logging
@@ -11,11 +14,9 @@ import json
 router = Router()
 
 # Показать пользователю кнопки с вариантами пополнения
-async def show_payment_options(message: Message):
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-        user = result.scalar_one_or_none()
-        balance = float(user.balance) if user else 0.0
+async def show_payment_options(message: Message, telegram_id: int):
+    # telegram_id передаётся явно: из кнопки message — сообщение бота, и from_user у него — сам бот
+    balance = await get_user_balance(telegram_id)
 
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -158,11 +159,13 @@ async def success_payment(message: types.Message):
             user = result.scalar_one_or_none()
 
             if user is None:
-                user = User(telegram_id=tg_id, username=username, balance=amount_rub)
+                user = User(telegram_id=tg_id, username=username, balance=amount_rub,
+                            remaining_generations=FREE_GENERATIONS_ON_START)
                 session.add(user)
                 await session.flush()
             else:
-                user.balance += amount_rub
+                # Выражение, а не сумма в Python: параллельное списание не затрётся
+                user.balance = User.balance + amount_rub
 
             session.add(PaymentRecord(
                 user_id=user.id,
@@ -172,6 +175,8 @@ async def success_payment(message: types.Message):
             ))
 
             await session.commit()
+            await session.refresh(user, ["balance"])
+            set_cached_balance(tg_id, user.balance)
 
             await message.answer(
                 f"✅ Платёж прошёл успешно!\n"
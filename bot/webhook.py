@@ -1,72 +1,194 @@
-import os
 import hmac
 import hashlib
 import json
+import math
+import asyncio
+import logging
 from aiohttp import web
-from sqlalchemy import func
-from database import SessionLocal
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database.db import engine
 from database.models import User, PaymentRecord
-from yookassa import Configuration
+from bot.balance_cache import set_cached_balance
+from bot.config import FREE_GENERATIONS_ON_START, YOOKASSA_WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
 
-Configuration.account_id = os.getenv("YOOKASSA_SHOP_ID")
-Configuration.secret_key = os.getenv("YOOKASSA_API_KEY")
+logger = logging.getLogger("webhook")
 
-YOOKASSA_WEBHOOK_SECRET = os.getenv("YOOKASSA_WEBHOOK_SECRET")
+MAX_ATTEMPTS = 3
+WEBHOOK_BATCH_SIZE = 200
 
-def update_user_balance(db_session, user_id: int):
-    total_paid = db_session.query(func.sum(PaymentRecord.amount))\
-        .filter(PaymentRecord.telegram_id == user_id, PaymentRecord.status == "succeeded")\
-        .scalar() or 0.0
-    user = db_session.query(User).filter(User.telegram_id == user_id).first()
-    if user:
-        user.balance = total_paid
-        db_session.commit()
+# Вебхук только проверяет подпись и кладёт событие в очередь — запись в БД идёт в фоне
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+# telegram_id, для которых строка в users точно есть — лишний INSERT не нужен
+_known_users: set[int] = set()
 
-async def yookassa_webhook_handler(request):
-    body = await request.text()
-    signature = request.headers.get("Content-HMAC")
 
+def verify_signature(body: bytes, signature: str | None) -> bool:
+    if not signature or not YOOKASSA_WEBHOOK_SECRET:
+        return False
     computed_signature = hmac.new(
         YOOKASSA_WEBHOOK_SECRET.encode(),
-        body.encode(),
+        body,
         hashlib.sha256
     ).hexdigest()
+    return hmac.compare_digest(computed_signature, signature)
+
+
+def parse_event(event: dict) -> tuple[str, str, float, int | None]:
+    """(payment_id, status, сумма, telegram_id) из события ЮKassa.
+
+    ValueError/KeyError/TypeError — событие битое: его нельзя ни применить, ни повторить.
+    telegram_id = None — платёж не из бота.
+    """
+    payment = event["object"]
+    payment_id = payment["id"]
+    status = payment["status"]
+    if not isinstance(payment_id, str) or not payment_id or not isinstance(status, str) or not status:
+        raise ValueError("нет id или status платежа")
+    amount = float(payment["amount"]["value"])
+    if not math.isfinite(amount) or amount < 0:
+        raise ValueError(f"некорректная сумма {amount}")
+    telegram_id = (payment.get("metadata") or {}).get("telegram_id")
+    if not telegram_id:
+        return payment_id, status, amount, None
+    if not str(telegram_id).isdigit():
+        raise ValueError(f"некорректный telegram_id {telegram_id!r}")
+    return payment_id, status, amount, int(telegram_id)
+
+
+async def _apply_event(conn, event: dict) -> tuple[int, float] | None:
+    payment_id, status, amount, telegram_id = parse_event(event)
+    if telegram_id is None:
+        logger.warning(f"Платёж {payment_id} без telegram_id в metadata — пропускаем")
+        return None
+
+    if telegram_id not in _known_users:
+        await conn.execute(
+            insert(User).values(telegram_id=telegram_id, balance=0, remaining_generations=FREE_GENERATIONS_ON_START)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        )
+
+    # Одна вставка с дедупликацией по payment_id. Уже успешный платёж не трогаем,
+    # поэтому строка возвращается только если запись новая или её статус сменился.
+    stmt = insert(PaymentRecord).values(
+        user_id=select(User.id).where(User.telegram_id == telegram_id).scalar_subquery(),
+        amount=amount,
+        payment_id=payment_id,
+        status=status,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PaymentRecord.payment_id],
+        set_={"status": stmt.excluded.status},
+        where=PaymentRecord.status != "succeeded",
+    ).returning(PaymentRecord.user_id, PaymentRecord.amount, PaymentRecord.status)
+    row = (await conn.execute(stmt)).first()
+
+    if row is None or row.status != "succeeded":
+        return None
+
+    # Зачисляем только сумму этого платежа, без пересчёта всей истории
+    result = await conn.execute(
+        update(User)
+        .where(User.id == row.user_id)
+        .values(balance=User.balance + row.amount)
+        .returning(User.balance)
+    )
+    logger.info(f"Платёж {payment_id}: зачислено {row.amount:.2f} ₽ пользователю {telegram_id}")
+    return telegram_id, result.scalar_one()
+
+
+async def apply_payment_events(events: list[dict]) -> int:
+    """Применяет пачку событий в одной транзакции. Возвращает число новых зачислений."""
+    credited = []
+    # Core-соединение вместо ORM-сессии: здесь нет объектов, а накладные расходы ORM заметны
+    async with engine.begin() as conn:
+        for event in events:
+            result = await _apply_event(conn, event)
+            if result:
+                credited.append(result)
+
+    _known_users.update(telegram_id for *_, telegram_id in map(parse_event, events) if telegram_id is not None)
+    for telegram_id, balance in credited:
+        set_cached_balance(telegram_id, balance)
+    return len(credited)
+
 
-    if not hmac.compare_digest(computed_signature, signature):
+async def apply_payment_event(event: dict) -> bool:
+    return await apply_payment_events([event]) > 0
+
+
+async def yookassa_webhook_handler(request):
+    body = await request.read()
+    if not verify_signature(body, request.headers.get("Content-HMAC")):
         return web.Response(status=403, text="Invalid signature")
 
-    data = json.loads(body)
-    payment_id = data["object"]["id"]
-    status = data["object"]["status"]
-    amount = float(data["object"]["amount"]["value"])
-    metadata = data["object"].get("metadata", {})
-    telegram_id = metadata.get("telegram_id")
+    try:
+        event = json.loads(body)
+        parse_event(event)
+    except (ValueError, KeyError, TypeError):
+        # Событие, которое не удастся применить, в очередь не берём
+        return web.Response(status=400, text="Bad payload")
 
-    db = SessionLocal()
     try:
-        payment_record = db.query(PaymentRecord).filter(PaymentRecord.payment_id == payment_id).first()
-
-        if not payment_record:
-            payment_record = PaymentRecord(
-                payment_id=payment_id,
-                telegram_id=telegram_id,
-                amount=amount,
-                status=status
-            )
-            db.add(payment_record)
-        else:
-            payment_record.status = status
-
-        db.commit()
-
-        # Обновляем баланс пользователя, если платеж успешен и есть telegram_id
-        if status == "succeeded" and telegram_id:
-            update_user_balance(db, telegram_id)
-    finally:
-        db.close()
+        _queue.put_nowait((event, 1))
+    except asyncio.QueueFull:
+        # ЮKassa повторит доставку позже
+        return web.Response(status=503, text="Busy")
 
     return web.Response(status=200, text="OK")
 
 
+async def _webhook_worker():
+    while True:
+        batch = [await _queue.get()]
+        while len(batch) < WEBHOOK_BATCH_SIZE and not _queue.empty():
+            batch.append(_queue.get_nowait())
+
+        try:
+            await apply_payment_events([event for event, _ in batch])
+        except Exception:
+            # Пачка откатилась целиком — применяем события по одному, каждое в своей транзакции,
+            # чтобы одно плохое событие не задерживало остальные
+            logger.exception(f"Ошибка обработки пачки из {len(batch)} платежей")
+            for event, attempt in batch:
+                try:
+                    await apply_payment_events([event])
+                except Exception:
+                    logger.exception(f"Ошибка обработки платежа {event['object']['id']}")
+                    await _retry_event(event, attempt)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+async def _retry_event(event: dict, attempt: int):
+    if attempt >= MAX_ATTEMPTS:
+        logger.error(f"Платёж {event['object']['id']} не обработан после {attempt} попыток")
+        return
+    try:
+        _queue.put_nowait((event, attempt + 1))
+    except asyncio.QueueFull:
+        logger.error(f"Очередь переполнена, платёж {event['object']['id']} будет принят при повторе вебхука")
+
+
+async def start_webhook_workers(app: web.Application = None):
+    global _queue
+    _queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    _workers.extend(asyncio.create_task(_webhook_worker()) for _ in range(WEBHOOK_WORKERS))
+
+
+async def stop_webhook_workers(app: web.Application = None):
+    if _queue is not None:
+        # Дожидаемся уже принятых событий, чтобы не потерять зачисления
+        await _queue.join()
+    for task in _workers:
+        task.cancel()
+    _workers.clear()
+
+
 def setup_webhook_routes(app: web.Application):
     app.router.add_post("/yookassa_webhook", yookassa_webhook_handler)
+    app.on_startup.append(start_webhook_workers)
+    app.on_cleanup.append(stop_webhook_workers)
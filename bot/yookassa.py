@@ -0,0 +1,169 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+from collections import defaultdict, deque
+
+import aiohttp
+
+from bot.config import (
+    YOOKASSA_SHOP_ID,
+    YOOKASSA_API_KEY,
+    YOOKASSA_API_URL,
+    YOOKASSA_TIMEOUT,
+    YOOKASSA_MAX_RETRIES,
+)
+
+logger = logging.getLogger("yookassa")
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class YooKassaError(Exception):
+    def __init__(self, status: int, body):
+        super().__init__(f"YooKassa вернула {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+async def _error_body(resp: aiohttp.ClientResponse):
+    """Тело ответа с ошибкой: JSON от самой ЮKassa или текст (HTML прокси/балансировщика)."""
+    try:
+        return await resp.json(content_type=None)
+    except ValueError:
+        return await resp.text()
+
+
+class YooKassaClient:
+    """Асинхронный клиент API ЮKassa с общим пулом соединений и повторами."""
+
+    def __init__(
+        self,
+        shop_id: str = YOOKASSA_SHOP_ID,
+        api_key: str = YOOKASSA_API_KEY,
+        base_url: str = YOOKASSA_API_URL,
+        timeout: float = YOOKASSA_TIMEOUT,
+        max_retries: int = YOOKASSA_MAX_RETRIES,
+        backoff: float = 0.5,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._auth = aiohttp.BasicAuth(shop_id or "", api_key or "")
+        self._timeout = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, 5))
+        self._session: aiohttp.ClientSession | None = None
+        # Метрики по операциям: последние задержки (мс), число вызовов, повторов и ошибок
+        self._latencies = defaultdict(lambda: deque(maxlen=1000))
+        self._counters = defaultdict(lambda: {"calls": 0, "retries": 0, "errors": 0})
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=self._auth,
+                timeout=self._timeout,
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(self, operation: str, method: str, path: str, json=None, params=None, idempotence_key=None):
+        headers = {}
+        if idempotence_key:
+            # Один и тот же ключ на все попытки — ЮKassa не создаст платёж дважды
+            headers["Idempotence-Key"] = idempotence_key
+
+        counters = self._counters[operation]
+        counters["calls"] += 1
+        session = self._get_session()
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                async with session.request(method, self.base_url + path, json=json, params=params, headers=headers) as resp:
+                    if resp.status < 400:
+                        return await resp.json(content_type=None)
+                    body = await _error_body(resp)
+                    if resp.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        counters["errors"] += 1
+                        raise YooKassaError(resp.status, body)
+                    logger.warning(f"[{operation}] ЮKassa ответила {resp.status}, повтор {attempt + 1}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    counters["errors"] += 1
+                    raise
+                logger.warning(f"[{operation}] Сетевая ошибка {e!r}, повтор {attempt + 1}")
+            finally:
+                self._latencies[operation].append((time.perf_counter() - start) * 1000)
+
+            counters["retries"] += 1
+            # Экспоненциальная задержка с полным джиттером
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def create_payment(
+        self,
+        amount: float,
+        return_url: str,
+        description: str = "Оплата",
+        metadata: dict | None = None,
+        idempotence_key: str | None = None,
+    ) -> dict:
+        data = {
+            "amount": {
+                "value": f"{amount:.2f}",
+                "currency": "RUB"
+            },
+            "confirmation": {
+                "type": "redirect",
+                "return_url": return_url
+            },
+            "capture": True,
+            "description": description
+        }
+        if metadata:
+            data["metadata"] = metadata
+        return await self._request(
+            "create_payment", "POST", "/payments", json=data,
+            idempotence_key=idempotence_key or str(uuid.uuid4()),
+        )
+
+    async def get_payment(self, payment_id: str) -> dict:
+        return await self._request("get_payment", "GET", f"/payments/{payment_id}")
+
+    async def list_payments(self, cursor: str | None = None, limit: int = 100, **filters) -> dict:
+        params = {"limit": limit, **filters}
+        if cursor:
+            params["cursor"] = cursor
+        return await self._request("list_payments", "GET", "/payments", params=params)
+
+    def stats(self) -> dict:
+        result = {}
+        for operation, counters in self._counters.items():
+            latencies = sorted(self._latencies[operation])
+            result[operation] = {
+                **counters,
+                "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+                "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+            }
+        return result
+
+
+_client: YooKassaClient | None = None
+
+
+def get_yookassa_client() -> YooKassaClient:
+    global _client
+    if _client is None:
+        _client = YooKassaClient()
+    return _client
+
+
+async def close_yookassa_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
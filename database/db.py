@@ -1,8 +1,10 @@
+import os
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite+aiosqlite:///./ai-shniza.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./ai-shniza.db")
 
 engine = create_async_engine(DATABASE_URL, echo=True)
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from database.db import Base
 
@@ -8,9 +8,14 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(Integer, unique=True, index=True, nullable=False)
     username = Column(String, nullable=True)
-    remaining_generations = Column(Integer, default=0, nullable=False)
+    remaining_generations = Column(Integer, default=0, nullable=False)  # стартовые бесплатные задаёт бот при создании
     balance = Column(Float, default=0.0, nullable=False)
 
+# Статус записей о списании за генерацию (в отличие от пополнений через ЮKassa)
+DEBIT_STATUS = "debit"
+# Возврат части списания, если генерация не удалась; в ЮKassa таких записей тоже нет
+REFUND_STATUS = "refund"
+
 class PaymentRecord(Base):
     __tablename__ = "payment_records"
 
@@ -18,5 +23,40 @@ class PaymentRecord(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Float, nullable=False)
     payment_id = Column(String, unique=True, index=True, nullable=False)  # id платежа из Юкассы
-    status = Column(String, nullable=False)  # например "waiting_for_capture", "succeeded"
+    status = Column(String, nullable=False)  # например "waiting_for_capture", "succeeded", DEBIT_STATUS, REFUND_STATUS
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GenerationUsage(Base):
+    __tablename__ = "generation_usage"
+    __table_args__ = (UniqueConstraint("telegram_id", "model", "day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    telegram_id = Column(Integer, index=True, nullable=False)
+    model = Column(String, nullable=False)  # "flux", "kling", ...
+    day = Column(Date, nullable=False)
+    count = Column(Integer, default=0, nullable=False)  # все генерации за день
+    free_used = Column(Integer, default=0, nullable=False)  # из них бесплатных по лимиту модели
+
+class MediaFile(Base):
+    """Уже отправленный в Telegram файл: повторно отправляется по file_id без загрузки."""
+    __tablename__ = "media_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True, nullable=False)  # "last:<telegram_id>"
+    media_type = Column(String, nullable=False)  # "photo", "video", "audio", "voice", ...
+    file_id = Column(String, nullable=False)
+    telegram_id = Column(Integer, index=True, nullable=True)  # в чей чат отправлен
+    model = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ModelStat(Base):
+    """Накопленная статистика модели по режиму сравнения: скорость, отказы и какой результат выбирали."""
+    __tablename__ = "model_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model = Column(String, unique=True, index=True, nullable=False)  # "ideogram", "kling", ...
+    runs = Column(Integer, default=0, nullable=False)
+    failures = Column(Integer, default=0, nullable=False)
+    latency_total = Column(Float, default=0.0, nullable=False)  # секунды по успешным запускам
+    picks = Column(Integer, default=0, nullable=False)  # сколько раз результат назвали лучшим
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
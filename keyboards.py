@@ -38,6 +38,7 @@ def image_text_menu_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Ideogram.py", callback_data="ideogram")],
         [InlineKeyboardButton(text="Imagegen4.py", callback_data="imagegen4")],
+        [InlineKeyboardButton(text="⚖️ Сравнить модели", callback_data="compare_photo")],
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu")]
     ])
 
@@ -54,6 +55,9 @@ def video_image_menu_kb():
         [InlineKeyboardButton(text="Kling", callback_data="kling"),
          InlineKeyboardButton(text="Minimax", callback_data="minimax")],
         [InlineKeyboardButton(text="Seedance", callback_data="seedance")],
+        [InlineKeyboardButton(text="🎞 Видео из нескольких сцен", callback_data="storyboard")],
+        [InlineKeyboardButton(text="🎬🎵 Видео со звуком", callback_data="soundtrack")],
+        [InlineKeyboardButton(text="⚖️ Сравнить модели", callback_data="compare_video")],
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu")]
     ])
 
@@ -8,11 +8,22 @@ from aiogram.types import Message, CallbackQuery, InputFile, InlineKeyboardMarku
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import web
 from dotenv import load_dotenv
 
+from database.db import init_db
+from bot.quota import load_quota, flush_quota, quota_flush_loop
+from bot.balance_cache import start_balance_cache_channel, stop_balance_cache_channel, balance_cache_stats
+from bot.yookassa import close_yookassa_client
+from bot.webhook import setup_webhook_routes
+from bot.file_cache import file_cache_stats, send_cached_media, last_result_key
+from bot.delivery import delivery_stats
+from media.ingest import ingest_stats
+from media.pool import media_pool_stats, shutdown_media_pool
+from bot.config import YOOKASSA_WEBHOOK_SECRET, WEBHOOK_PORT
 from models.gpt import PromptTranslationState, gpt_start, handle_russian_prompt
 from bot.start import show_payment_options, router as start_router
-from models.kling import KlingVideoState, cmd_start_kling, handle_image_kling, handle_mode_selection_kling, handle_duration_selection_kling, handle_prompt_kling, handle_confirm_generation_kling
+from models.kling import KlingVideoState, cmd_start_kling, handle_image_kling, handle_mode_selection_kling, handle_duration_selection_kling, handle_prompt_kling, handle_confirm_generation_kling, confirm_draft_kling
 from models import ideogram, imagegen4, flux, veo3, kling, minimax, seedance, musicgen, chatterbox, gpt
 from models.minimax import VideoGenState, minimax_start, minimax_handle_image, minimax_handle_prompt,  minimax_confirm_generation
 from models.veo3 import (
@@ -20,6 +31,7 @@ from models.veo3 import (
     cmd_start_veo3,
     handle_prompt_veo3,
     confirm_generation_veo3,
+    confirm_draft_veo3,
 )
 
 
@@ -29,6 +41,8 @@ from models.imagegen4 import (
     aspect_imagegen4,
     handle_prompt_imagegen4,
     confirm_generation_imagegen4,
+    confirm_variants_imagegen4,
+    confirm_video_imagegen4,
     go_main_menu_imagegen4,
 )
 
@@ -37,6 +51,7 @@ from models.musicgen import (
     start_handler_musicgen,
     model_chosen_musicgen,
     normalization_chosen_musicgen,
+    duration_chosen_musicgen,
     receive_prompt_musicgen,
     confirm_generation_musicgen,
 )
@@ -48,6 +63,8 @@ from models.ideogram import (
     handle_style_aspect_ideogram,
     handle_prompt_aspect_ideogram,
     confirm_generation_ideogram,
+    confirm_variants_ideogram,
+    confirm_video_ideogram,
 )
 
 
@@ -60,6 +77,7 @@ from models.flux import (
     handle_flux_style_flux,
     handle_prompt_flux,
     confirm_generation_flux,
+    confirm_variants_flux,
     go_main_menu,
 )
 
@@ -75,6 +93,37 @@ from models.seedance import (
     seedance_handle_camera_fixed,
     seedance_handle_confirm_generation
 )
+from models.storyboard import (
+    StoryboardState,
+    storyboard_start,
+    storyboard_model_chosen,
+    storyboard_handle_image,
+    storyboard_duration_chosen,
+    storyboard_handle_shots,
+    storyboard_confirm,
+)
+from models.soundtrack import (
+    SoundtrackState,
+    soundtrack_start,
+    soundtrack_model_chosen,
+    soundtrack_handle_image,
+    soundtrack_duration_chosen,
+    soundtrack_handle_video_prompt,
+    soundtrack_audio_chosen,
+    soundtrack_handle_audio_prompt,
+    soundtrack_confirm,
+)
+from models.draft import DraftState, draft_handle_prompt, draft_render_final
+from models.compare import (
+    CompareState,
+    compare_start,
+    compare_model_toggled,
+    compare_models_chosen,
+    compare_handle_image,
+    compare_handle_prompt,
+    compare_confirm,
+    compare_picked,
+)
 from models.chatterbox import (
     VoiceGenState,
     go_main_menu_chatterbox,
@@ -143,13 +192,18 @@ async def cmd_start(message: Message, state: FSMContext):
         f"🖼 *Генерация изображений:*\n"
         f"- Ideogram — от 9 ₽\n"
         f"- Imagen-4 — от 9 ₽\n"
-        f"- FluxKontext — от 9 ₽\n\n"
+        f"- FluxKontext — от 9 ₽\n"
+        f"- Сравнение Ideogram и Imagen-4 на одном промпте — от 18 ₽\n\n"
 
         f"🎬 *Генерация видео:*\n"
         f"- Kling v2.1 — от 55 - 199 ₽\n"
         f"- Minimax Video — от 150 ₽\n"
         f"- Seedance  — от 80 ₽\n"
-        f"- Veo3 (8 секунд) —  660 ₽\n\n"
+        f"- Veo3 (8 секунд) —  660 ₽\n"
+        f"- Черновик перед Veo3 или Kling Pro (Seedance 480p) — 80 ₽\n"
+        f"- Видео из нескольких сцен (Seedance/Kling) — от 160 ₽\n"
+        f"- Видео с музыкой или озвучкой — от 89 ₽\n"
+        f"- Сравнение видеомоделей на одном промпте — сумма выбранных\n\n"
 
         f"🎵 *Генерация музыки:*\n"
         f"- Minimax Music — от 9 ₽\n"
@@ -159,6 +213,8 @@ async def cmd_start(message: Message, state: FSMContext):
         f"💬 *Текст и речь:*\n"
         f"- GPT перевод — бесплатно\n\n"
 
+        f"🔁 /last — прислать последний результат ещё раз\n\n"
+
         f"💼 *Юридическая информация:*\n"
         f"ИП А А Комарова\n"
         f"ИНН 504231947047 | \n ОГРН 322508100272216\n\n"
@@ -169,6 +225,12 @@ async def cmd_start(message: Message, state: FSMContext):
     # 👇 добавлено: сразу переход в главное меню
     await go_main_menu(message, state) 
 
+async def cmd_last(message: Message):
+    # По file_id: без повторной генерации и без загрузки файла
+    sent = await send_cached_media(message.bot, message.chat.id, last_result_key(message.chat.id))
+    if sent is None:
+        await message.answer("Пока нечего прислать: последний результат не найден.")
+
 @router.callback_query(F.data == "main_menu")
 async def cb_main_menu(callback: CallbackQuery, state: FSMContext):
     await state.clear()
@@ -176,7 +238,7 @@ async def cb_main_menu(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "balance")
 async def cb_balance(callback: CallbackQuery, state: FSMContext):
-    await show_payment_options(callback.message)
+    await show_payment_options(callback.message, callback.from_user.id)
 
 @router.callback_query(F.data == "generate")
 async def cb_generate(callback: CallbackQuery, state: FSMContext):
@@ -231,6 +293,18 @@ async def cb_minimax(callback: CallbackQuery, state: FSMContext):
 async def cb_seedance(callback: CallbackQuery, state: FSMContext):
     await seedance_cmd_start(callback.message, state)
 
+@router.callback_query(F.data == "storyboard")
+async def cb_storyboard(callback: CallbackQuery, state: FSMContext):
+    await storyboard_start(callback.message, state)
+
+@router.callback_query(F.data == "soundtrack")
+async def cb_soundtrack(callback: CallbackQuery, state: FSMContext):
+    await soundtrack_start(callback.message, state)
+
+@router.callback_query(F.data.in_({"compare_photo", "compare_video"}))
+async def cb_compare(callback: CallbackQuery, state: FSMContext):
+    await compare_start(callback.message, state, callback.data.removeprefix("compare_"))
+
 @router.callback_query(F.data == "music_menu")
 async def cb_music_menu(callback: CallbackQuery, state: FSMContext):
     await state.set_state(MenuState.music_menu)
@@ -265,6 +339,7 @@ async def main():
     # === Регистрация FSM-хендлеров ===
 
     dp.message.register(go_main_menu, Command("main"))
+    dp.message.register(cmd_last, Command("last"))
     dp.message.register(go_main_menu, F.text.lower() == "main")
     
     # ImageGen4 (Google Imagen)
@@ -273,6 +348,8 @@ async def main():
     dp.message.register(handle_prompt_imagegen4, StateFilter(ImageGenState.AWAITING_PROMPT))
     dp.message.register(go_main_menu_imagegen4, F.text == MAIN_MENU_BUTTON_TEXT, StateFilter(ImageGenState.AWAITING_PROMPT))
     dp.callback_query.register(confirm_generation_imagegen4, F.data == "confirm_generation_imagegen4", StateFilter(ImageGenState.CONFIRM_GENERATION))
+    dp.callback_query.register(confirm_variants_imagegen4, F.data == "confirm_variants_imagegen4", StateFilter(ImageGenState.CONFIRM_GENERATION))
+    dp.callback_query.register(confirm_video_imagegen4, F.data.startswith("confirm_video_imagegen4_"), StateFilter(ImageGenState.CONFIRM_GENERATION))
 
     
     dp.message.register(gpt_start, F.text == "🔤 Перевод")
@@ -304,18 +381,45 @@ async def main():
     dp.callback_query.register(handle_duration_selection_kling, F.data.startswith("duration_"), StateFilter(KlingVideoState.waiting_duration))
     dp.message.register(handle_prompt_kling, StateFilter(KlingVideoState.waiting_prompt))
     dp.callback_query.register(handle_confirm_generation_kling, F.data == "confirm_gen", StateFilter(KlingVideoState.confirm_pending))
+    dp.callback_query.register(confirm_draft_kling, F.data == "confirm_draft_kling", StateFilter(KlingVideoState.confirm_pending))
     dp.message.register(go_main_menu, F.text == MAIN_MENU_BUTTON_TEXT)
 
+    dp.callback_query.register(storyboard_model_chosen, F.data.startswith("sb_model_"), StateFilter(StoryboardState.choosing_model))
+    dp.message.register(storyboard_handle_image, StateFilter(StoryboardState.waiting_image))
+    dp.callback_query.register(storyboard_duration_chosen, F.data.startswith("sb_dur_"), StateFilter(StoryboardState.choosing_duration))
+    dp.message.register(storyboard_handle_shots, StateFilter(StoryboardState.waiting_shots))
+    dp.callback_query.register(storyboard_confirm, F.data == "storyboard_confirm", StateFilter(StoryboardState.confirm_pending))
+
+    dp.callback_query.register(soundtrack_model_chosen, F.data.startswith("st_model_"), StateFilter(SoundtrackState.choosing_model))
+    dp.message.register(soundtrack_handle_image, StateFilter(SoundtrackState.waiting_image))
+    dp.callback_query.register(soundtrack_duration_chosen, F.data.startswith("st_dur_"), StateFilter(SoundtrackState.choosing_duration))
+    dp.message.register(soundtrack_handle_video_prompt, StateFilter(SoundtrackState.waiting_video_prompt))
+    dp.callback_query.register(soundtrack_audio_chosen, F.data.startswith("st_audio_"), StateFilter(SoundtrackState.choosing_audio))
+    dp.message.register(soundtrack_handle_audio_prompt, StateFilter(SoundtrackState.waiting_audio_prompt))
+    dp.callback_query.register(soundtrack_confirm, F.data == "soundtrack_confirm", StateFilter(SoundtrackState.confirm_pending))
+
+    dp.callback_query.register(compare_model_toggled, F.data.startswith("cmp_toggle_"), StateFilter(CompareState.choosing_models))
+    dp.callback_query.register(compare_models_chosen, F.data == "cmp_next", StateFilter(CompareState.choosing_models))
+    dp.message.register(compare_handle_image, StateFilter(CompareState.waiting_image))
+    dp.message.register(compare_handle_prompt, StateFilter(CompareState.waiting_prompt))
+    dp.callback_query.register(compare_confirm, F.data == "compare_confirm", StateFilter(CompareState.confirm_pending))
+    dp.callback_query.register(compare_picked, F.data.startswith("cmp_pick_"), StateFilter(CompareState.picking))
+
     
     dp.message.register(start_handler_musicgen, F.text == "MusicGen")
     dp.callback_query.register(model_chosen_musicgen, StateFilter(MusicGenStates.choosing_model))
     dp.callback_query.register(normalization_chosen_musicgen, StateFilter(MusicGenStates.choosing_normalization))
+    dp.callback_query.register(duration_chosen_musicgen, StateFilter(MusicGenStates.choosing_duration))
     dp.message.register(receive_prompt_musicgen, StateFilter(MusicGenStates.waiting_for_prompt))
     dp.callback_query.register(confirm_generation_musicgen, F.data == "confirm_generation_musicgen", StateFilter(MusicGenStates.confirming_payment))
 
     dp.message.register(cmd_start_veo3, F.text == "Veo3")
     dp.message.register(handle_prompt_veo3, StateFilter(Veo3State.waiting_for_prompt))
     dp.callback_query.register(confirm_generation_veo3, F.data == "confirm_generation_veo3", StateFilter(Veo3State.confirming_payment))
+    dp.callback_query.register(confirm_draft_veo3, F.data == "confirm_draft_veo3", StateFilter(Veo3State.confirming_payment))
+
+    dp.message.register(draft_handle_prompt, StateFilter(DraftState.reviewing))
+    dp.callback_query.register(draft_render_final, F.data == "draft_final", StateFilter(DraftState.reviewing))
         
     dp.message.register(cmd_start_imagegen4, F.text == "Imagegen4.py")
     dp.callback_query.register(aspect_imagegen4, F.data.startswith("aspect_"), StateFilter(ImageGenState.AWAITING_ASPECT))
@@ -329,17 +433,49 @@ async def main():
     dp.callback_query.register(handle_style_aspect_ideogram, F.data.startswith("ideogram_style_"), StateFilter(IdeogramImageGenState.SELECTING_STYLE))
     dp.message.register(handle_prompt_aspect_ideogram, StateFilter(IdeogramImageGenState.AWAITING_PROMPT))
     dp.callback_query.register(confirm_generation_ideogram, F.data == "confirm_generation_ideogram", StateFilter(IdeogramImageGenState.CONFIRM_GENERATION_IDEOGRAM))
+    dp.callback_query.register(confirm_variants_ideogram, F.data == "confirm_variants_ideogram", StateFilter(IdeogramImageGenState.CONFIRM_GENERATION_IDEOGRAM))
+    dp.callback_query.register(confirm_video_ideogram, F.data.startswith("confirm_video_ideogram_"), StateFilter(IdeogramImageGenState.CONFIRM_GENERATION_IDEOGRAM))
 
     dp.message.register(cmd_start_flux, F.text == "Flux")
     dp.message.register(handle_image_flux, StateFilter(FluxKontextState.WAITING_IMAGE))
     dp.callback_query.register(handle_aspect_ratio_flux, StateFilter(FluxKontextState.WAITING_ASPECT_RATIO))
     dp.message.register(handle_prompt_flux, StateFilter(FluxKontextState.WAITING_PROMPT))
     dp.callback_query.register(confirm_generation_flux, F.data == "confirm_generation_flux", StateFilter(FluxKontextState.CONFIRM_GENERATION_FLUX))
+    dp.callback_query.register(confirm_variants_flux, F.data == "confirm_variants_flux", StateFilter(FluxKontextState.CONFIRM_GENERATION_FLUX))
     dp.message.register(go_main_menu, F.text == "🏠 Главное меню")
 
+    await init_db()
+    await load_quota()
+    quota_task = asyncio.create_task(quota_flush_loop())
+    await start_balance_cache_channel()
+
+    # HTTP-сервер для вебхуков ЮKassa
+    webhook_runner = None
+    if YOOKASSA_WEBHOOK_SECRET:
+        webhook_app = web.Application()
+        setup_webhook_routes(webhook_app)
+        webhook_runner = web.AppRunner(webhook_app)
+        await webhook_runner.setup()
+        await web.TCPSite(webhook_runner, "0.0.0.0", WEBHOOK_PORT).start()
+        logger.info(f"Вебхуки ЮKassa слушают порт {WEBHOOK_PORT}")
+
     logger.info("🤖 Бот запущен")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
+    finally:
+        if webhook_runner is not None:
+            await webhook_runner.cleanup()
+        quota_task.cancel()
+        await flush_quota()
+        stop_balance_cache_channel()
+        await close_yookassa_client()
+        logger.info(f"Кэш балансов: {balance_cache_stats()}")
+        logger.info(f"Кэш file_id: {file_cache_stats()}")
+        logger.info(f"Доставка результатов: {delivery_stats()}")
+        logger.info(f"Входные изображения: {ingest_stats()}")
+        shutdown_media_pool()
+        logger.info(f"Медиа-пул: {media_pool_stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
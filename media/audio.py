@@ -0,0 +1,214 @@
+import io
+import os
+import wave
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import aiohttp
+import numpy as np
+from aiogram.types import BufferedInputFile
+
+from media.loudness import master_audio
+from media.pool import media_slot, run_media_job
+from media.stream import iter_url, CHUNK_SIZE
+from media.waveform import render_waveform
+
+logger = logging.getLogger("media")
+
+FFMPEG = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# Голосовое сообщение Telegram: Opus в контейнере Ogg
+VOICE_OUTPUT_ARGS = ["-vn", "-c:a", "libopus", "-b:a", "64k", "-f", "ogg"]
+MP3_OUTPUT_ARGS = ["-vn", "-c:a", "libmp3lame", "-b:a", "192k", "-f", "mp3"]
+
+# Локальная обработка звука идёт в моно float32 с этой частотой (родная частота Chatterbox)
+SAMPLE_RATE = 24000
+
+
+class TranscodeError(Exception):
+    pass
+
+
+async def transcode_stream(chunks: AsyncIterator[bytes], output_args: list[str], input_args: list[str] = ()) -> bytes:
+    """Прогоняет поток байтов через ffmpeg (stdin -> stdout) без временных файлов."""
+    proc = await asyncio.create_subprocess_exec(
+        FFMPEG, "-hide_banner", "-loglevel", "error", *input_args, "-i", "pipe:0", *output_args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg завершился раньше — причину покажет код возврата и stderr
+            pass
+        finally:
+            proc.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        stdout, stderr = await asyncio.gather(proc.stdout.read(), proc.stderr.read())
+        await feeder
+        returncode = await proc.wait()
+    except BaseException:
+        feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+    if returncode != 0:
+        raise TranscodeError(f"ffmpeg завершился с кодом {returncode}: {stderr.decode(errors='ignore')[-500:]}")
+    return stdout
+
+
+async def url_to_voice(url: str, filename: str = "voice.ogg") -> BufferedInputFile:
+    """Скачивает аудио по частям прямо в ffmpeg и возвращает Opus для answer_voice."""
+    async with aiohttp.ClientSession() as session, media_slot():
+        data = await transcode_stream(iter_url(session, url), VOICE_OUTPUT_ARGS)
+    return BufferedInputFile(data, filename=filename)
+
+
+async def url_to_pcm(url: str, rate: int = SAMPLE_RATE, channels: int = 1) -> np.ndarray:
+    """Скачивает аудио и декодирует его в float32 с частотой rate: форма (n,) для моно, (n, channels) иначе."""
+    async with aiohttp.ClientSession() as session, media_slot():
+        data = await transcode_stream(
+            iter_url(session, url), ["-vn", "-ac", str(channels), "-ar", str(rate), "-f", "f32le"]
+        )
+    samples = np.frombuffer(data, dtype=np.float32)
+    return samples if channels == 1 else samples.reshape(-1, channels)
+
+
+async def url_to_mastered(url: str, rate: int = SAMPLE_RATE, channels: int = 1) -> np.ndarray:
+    """Декодирует аудио по ссылке и прогоняет через master_audio в пуле процессов."""
+    return await run_media_job(master_audio, await url_to_pcm(url, rate, channels), rate)
+
+
+async def _iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+async def encode_pcm(samples: np.ndarray, output_args: list[str], rate: int = SAMPLE_RATE) -> bytes:
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    async with media_slot():
+        return await transcode_stream(
+            _iter_bytes(samples.astype(np.float32).tobytes()), output_args,
+            input_args=["-f", "f32le", "-ac", str(channels), "-ar", str(rate)],
+        )
+
+
+async def pcm_to_voice(samples: np.ndarray, rate: int = SAMPLE_RATE, filename: str = "voice.ogg") -> BufferedInputFile:
+    return BufferedInputFile(await encode_pcm(samples, VOICE_OUTPUT_ARGS, rate), filename=filename)
+
+
+async def pcm_to_mp3(samples: np.ndarray, rate: int = SAMPLE_RATE, filename: str = "track.mp3") -> BufferedInputFile:
+    return BufferedInputFile(await encode_pcm(samples, MP3_OUTPUT_ARGS, rate), filename=filename)
+
+
+async def waveform_thumbnail(samples: np.ndarray, filename: str = "cover.jpg") -> BufferedInputFile:
+    """Форма волны обложкой для answer_audio: видно, чем треки отличаются, не переслушивая их."""
+    return BufferedInputFile(await run_media_job(render_waveform, samples), filename=filename)
+
+
+def pcm_to_wav(samples: np.ndarray, rate: int = SAMPLE_RATE) -> bytes:
+    """16-битный WAV без ffmpeg — для коротких кусков, которые уходят входом в модель."""
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return output.getvalue()
+
+
+def _active_rms(samples: np.ndarray, rate: int, frame_ms: int = 50) -> float:
+    # Громкость по кадрам с речью: паузы между фразами не должны занижать оценку
+    frame = int(rate * frame_ms / 1000)
+    usable = len(samples) // frame * frame
+    if usable == 0:
+        return float(np.sqrt(np.mean(samples ** 2))) if len(samples) else 0.0
+    frames = np.sqrt(np.mean(samples[:usable].reshape(-1, frame) ** 2, axis=1))
+    active = frames[frames > frames.max() * 0.1]
+    return float(np.sqrt(np.mean(active ** 2))) if len(active) else 0.0
+
+
+def match_loudness(parts: list[np.ndarray], rate: int = SAMPLE_RATE, max_gain: float = 2.0) -> list[np.ndarray]:
+    """Выравнивает громкость кусков по медиане, чтобы стыки не «прыгали»."""
+    levels = np.array([_active_rms(part, rate) for part in parts])
+    target = float(np.median(levels[levels > 0])) if np.any(levels > 0) else 0.0
+    gains = np.where(levels > 0, target / np.maximum(levels, 1e-9), 1.0).clip(1 / max_gain, max_gain)
+    return [part * np.float32(gain) for part, gain in zip(parts, gains)]
+
+
+def crossfade_concat(parts: list[np.ndarray], rate: int = SAMPLE_RATE, fade_ms: int = 30) -> np.ndarray:
+    """Склеивает куски с линейным кроссфейдом длиной fade_ms на каждом стыке."""
+    fade = min([int(rate * fade_ms / 1000)] + [len(part) // 2 for part in parts])
+    if len(parts) == 1 or fade == 0:
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+    ramp_in = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+    ramp_out = ramp_in[::-1]
+    output = np.zeros(sum(len(part) for part in parts) - fade * (len(parts) - 1), dtype=np.float32)
+    position = 0
+    for i, part in enumerate(parts):
+        part = part.astype(np.float32, copy=True)
+        if i > 0:
+            part[:fade] *= ramp_in
+        if i < len(parts) - 1:
+            part[-fade:] *= ramp_out
+        output[position:position + len(part)] += part
+        position += len(part) - fade
+    return output
+
+
+def stitch_speech(parts: list[np.ndarray], rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Склейка озвучки по кускам: выравнивание громкости, кроссфейды и master_audio. Выполняется в пуле процессов."""
+    return master_audio(crossfade_concat(match_loudness(parts, rate), rate), rate)
+
+
+async def stitch_to_voice(parts: list[np.ndarray], rate: int = SAMPLE_RATE, filename: str = "voice.ogg") -> BufferedInputFile:
+    samples = await run_media_job(stitch_speech, parts, rate)
+    return await pcm_to_voice(samples, rate, filename)
+
+
+def fit_to_duration(samples: np.ndarray, rate: int, duration: float, fade_seconds: float = 1.0) -> np.ndarray:
+    """Подгоняет звук под длину ролика: длинный обрезается с затуханием в конце, короткий дополняется тишиной."""
+    length = int(round(duration * rate))
+    if len(samples) >= length:
+        samples = samples[:length].astype(np.float32, copy=True)
+        fade = min(int(fade_seconds * rate), length)
+        ramp = np.linspace(1.0, 0.0, fade, dtype=np.float32)
+        samples[length - fade:] *= ramp if samples.ndim == 1 else ramp[:, None]
+        return samples
+    padding = [(0, length - len(samples))] + [(0, 0)] * (samples.ndim - 1)
+    return np.pad(samples.astype(np.float32, copy=False), padding)
+
+
+def equal_power_ramps(length: int, channels: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    t = np.linspace(0.0, 1.0, length, dtype=np.float32)
+    fade_in, fade_out = np.sin(t * np.pi / 2), np.cos(t * np.pi / 2)
+    if channels > 1:
+        return fade_in[:, None], fade_out[:, None]
+    return fade_in, fade_out
+
+
+def append_continuation(track: np.ndarray, segment: np.ndarray, overlap: int, fade: int) -> np.ndarray:
+    """Дописывает к треку продолжение MusicGen. Выполняется в пуле процессов.
+
+    Продолжение начинается с overlap сэмплов, повторяющих хвост трека (это был вход модели);
+    их заменяем, оставляя fade сэмплов на равномощный кроссфейд, чтобы стык был неслышен.
+    """
+    fade = min(fade, overlap, len(track))
+    start = overlap - fade
+    channels = 1 if track.ndim == 1 else track.shape[1]
+    fade_in, fade_out = equal_power_ramps(fade, channels)
+    joint = track[len(track) - fade:] * fade_out + segment[start:overlap] * fade_in
+    return np.concatenate([track[:len(track) - fade], joint, segment[overlap:]])
+
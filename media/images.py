@@ -0,0 +1,85 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Что имеет смысл отдавать каждой модели: крупнее она всё равно уменьшит сама
+IMAGE_PROFILES = {
+    "flux": {"max_side": 1440, "format": "WEBP", "quality": 90},
+    "kling": {"max_side": 1920, "format": "JPEG", "quality": 90},
+    "minimax": {"max_side": 1280, "format": "JPEG", "quality": 90},
+    "seedance": {"max_side": 1920, "format": "JPEG", "quality": 90},
+}
+
+FLUX_ASPECT_RATIOS = ["1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3", "4:5", "5:4", "21:9", "9:21"]
+
+
+def closest_aspect_ratio(width: int, height: int, choices: list[str]) -> str:
+    """Ближайшее к width:height соотношение из списка, сравнение по логарифму отношения."""
+    target = math.log(width / height)
+
+    def distance(choice: str) -> float:
+        w, h = choice.split(":")
+        return abs(math.log(int(w) / int(h)) - target)
+
+    return min(choices, key=distance)
+
+
+def normalize_image(data: bytes, max_side: int, format: str = "JPEG", quality: int = 90) -> bytes:
+    """Поворачивает по EXIF, уменьшает до max_side и пережимает. Выполняется в пуле процессов."""
+    with Image.open(io.BytesIO(data)) as original:
+        source_format = original.format
+        rotated = original.getexif().get(ImageOps.ExifTags.Base.Orientation, 1) != 1
+        image = ImageOps.exif_transpose(original)
+        resized = max(image.size) > max_side
+        if resized:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        if image.mode not in ("RGB", "L"):
+            # У JPEG нет прозрачности — подкладываем белый фон
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+            image = background
+
+        output = io.BytesIO()
+        image.save(output, format=format, quality=quality, optimize=True)
+
+    result = output.getvalue()
+    # Уже компактный файл без поворота и уменьшения оставляем как есть
+    if not (resized or rotated) and source_format == format and len(result) >= len(data):
+        return data
+    return result
+
+
+def dhash(data: bytes, size: int = 8) -> int:
+    """Разностный перцептивный хэш на size*size бит: переживает пережатие, ресайз и пересылку."""
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG декодируется сразу в уменьшенном виде — это основная экономия времени
+        image.draft("L", (size * 8, size * 8))
+        image = ImageOps.exif_transpose(image).convert("L").resize((size + 1, size), Image.BOX)
+        pixels = np.asarray(image, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, image_hash: int) -> np.ndarray:
+    """Расстояния Хэмминга от image_hash до каждого хэша из массива uint64."""
+    return np.bitwise_count(hashes ^ np.uint64(image_hash))
+
+
+def tile_frames(frames: list[np.ndarray], columns: int, gap: int = 4, background: int = 16,
+                quality: int = 85) -> bytes:
+    """Собирает кадры одного размера (h, w, 3) в сетку с columns колонками и отдаёт JPEG."""
+    rows = -(-len(frames) // columns)
+    height, width = frames[0].shape[:2]
+    grid = np.full((rows * columns, height + gap, width + gap, 3), background, dtype=np.uint8)
+    grid[:len(frames), :height, :width] = np.stack(frames)
+    # (ряд, колонка, y, x) -> (ряд, y, колонка, x): кадры встают в сетку одним reshape
+    sheet = grid.reshape(rows, columns, height + gap, width + gap, 3).transpose(0, 2, 1, 3, 4)
+    sheet = sheet.reshape(rows * (height + gap), columns * (width + gap), 3)
+    sheet = sheet[:rows * (height + gap) - gap, :columns * (width + gap) - gap]
+
+    output = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(sheet), "RGB").save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
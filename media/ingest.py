@@ -0,0 +1,141 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+import replicate
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from media.images import IMAGE_PROFILES, normalize_image, dhash, hamming_distances
+from media.pool import run_media_job
+
+logger = logging.getLogger("media")
+
+REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+# Сколько держать ссылку на загруженный файл, если Replicate не сообщил срок жизни сам
+INPUT_IMAGE_TTL = float(os.getenv("INPUT_IMAGE_TTL", str(12 * 3600)))
+# Сколько последних фото пользователя помнить и насколько они могут отличаться (бит из 64)
+RECENT_IMAGES_PER_USER = int(os.getenv("RECENT_IMAGES_PER_USER", "20"))
+DHASH_MAX_DISTANCE = int(os.getenv("DHASH_MAX_DISTANCE", "6"))
+
+# sha256 содержимого -> (URL в Replicate, когда истекает по time.monotonic())
+_urls: dict[str, tuple[str, float]] = {}
+# (file_unique_id Telegram, модель) -> sha256: повторно присланное фото даже не скачивается
+_hashes: dict[tuple[str, str | None], str] = {}
+# telegram_id -> последние загруженные фото: (dHash, модель, sha256 загруженного файла).
+# Почти такое же фото (пересжатая пересылка, скриншот) получает уже загруженный файл.
+_recent: dict[int, deque[tuple[int, str | None, str]]] = {}
+_uploads: dict[str, asyncio.Task] = {}
+_stats = {"hits": 0, "similar_hits": 0, "uploads": 0, "downloads": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _ttl(expires_at: str | None) -> float:
+    if not expires_at:
+        return INPUT_IMAGE_TTL
+    expires = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+    # Запас в минуту, чтобы модель не получила ссылку, истекающую прямо на старте
+    return min(INPUT_IMAGE_TTL, (expires - datetime.now(timezone.utc)).total_seconds() - 60)
+
+
+def _cached_url(digest: str) -> str | None:
+    cached = _urls.get(digest)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
+
+def _find_similar(user_id: int, model: str | None, image_hash: int) -> str | None:
+    candidates = [(known_hash, digest) for known_hash, known_model, digest in _recent.get(user_id, ())
+                  if known_model == model and _cached_url(digest)]
+    if not candidates:
+        return None
+    hashes = np.fromiter((known_hash for known_hash, _ in candidates), dtype=np.uint64, count=len(candidates))
+    distances = hamming_distances(hashes, image_hash)
+    best = int(distances.argmin())
+    return candidates[best][1] if distances[best] <= DHASH_MAX_DISTANCE else None
+
+
+async def _upload(data: bytes, digest: str, filename: str) -> str:
+    client = replicate.Client(api_token=REPLICATE_API_TOKEN)
+    file = await client.files.async_create(io.BytesIO(data), filename=filename, metadata={"sha256": digest})
+    url = file.urls["get"]
+
+    now = time.monotonic()
+    _urls[digest] = (url, now + _ttl(file.expires_at))
+    for key in [key for key, (_, expires) in _urls.items() if expires <= now]:
+        del _urls[key]
+    for key in [key for key, known in _hashes.items() if known not in _urls]:
+        del _hashes[key]
+    _stats["uploads"] += 1
+    logger.info(f"Изображение {digest[:12]} загружено в Replicate: {len(data)} байт")
+    return url
+
+
+async def ingest_image(data: bytes, filename: str = "input.jpg") -> str:
+    """Загружает изображение в Replicate один раз на содержимое и возвращает URL для input модели."""
+    digest = hashlib.sha256(data).hexdigest()
+    url = _cached_url(digest)
+    if url:
+        _stats["hits"] += 1
+        return url
+
+    # Одновременные запросы с тем же содержимым ждут одну загрузку
+    task = _uploads.get(digest)
+    if task is None:
+        task = asyncio.create_task(_upload(data, digest, filename))
+        _uploads[digest] = task
+        task.add_done_callback(lambda _: _uploads.pop(digest, None))
+    return await asyncio.shield(task)
+
+
+async def ingest_photo(bot: Bot, photo: PhotoSize, model: str | None = None, user_id: int | None = None) -> str:
+    """Скачивает фото из Telegram через API бота (без токена в ссылке) и отдаёт URL в Replicate.
+
+    Для моделей из IMAGE_PROFILES фото сначала поворачивается по EXIF, уменьшается и пережимается.
+    С user_id почти повторное фото этого пользователя получает уже загруженный файл.
+    """
+    key = (photo.file_unique_id, model)
+    digest = _hashes.get(key)
+    url = _cached_url(digest) if digest else None
+    if url:
+        _stats["hits"] += 1
+        return url
+
+    buffer = await bot.download(photo.file_id)
+    _stats["downloads"] += 1
+    data = buffer.getvalue()
+    _stats["bytes_in"] += len(data)
+
+    image_hash = None
+    if user_id is not None:
+        # Около миллисекунды на фото из Telegram — дешевле, чем передавать байты в пул
+        image_hash = dhash(data)
+        similar = _find_similar(user_id, model, image_hash)
+        if similar:
+            _stats["similar_hits"] += 1
+            _hashes[key] = similar
+            return _cached_url(similar)
+
+    extension = "jpg"
+    profile = IMAGE_PROFILES.get(model)
+    if profile:
+        data = await run_media_job(normalize_image, data, **profile)
+        extension = profile["format"].lower()
+    _stats["bytes_out"] += len(data)
+
+    digest = hashlib.sha256(data).hexdigest()
+    _hashes[key] = digest
+    url = await ingest_image(data, f"{photo.file_unique_id}.{extension}")
+    if image_hash is not None:
+        _recent.setdefault(user_id, deque(maxlen=RECENT_IMAGES_PER_USER)).append((image_hash, model, digest))
+    return url
+
+
+def ingest_stats() -> dict:
+    return {**_stats, "size": len(_urls)}
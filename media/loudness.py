@@ -0,0 +1,173 @@
+import os
+
+import numpy as np
+
+# Целевая громкость для всего сгенерированного звука и потолок пиков (по сэмплам, с запасом под MP3/Opus)
+AUDIO_TARGET_LUFS = float(os.getenv("AUDIO_TARGET_LUFS", "-16"))
+AUDIO_PEAK_CEILING_DB = float(os.getenv("AUDIO_PEAK_CEILING_DB", "-1"))
+# Тише этого уровня в начале и в конце — тишина, которую стоит обрезать
+SILENCE_THRESHOLD_DB = float(os.getenv("SILENCE_THRESHOLD_DB", "-50"))
+# Почти тишину не вытягиваем до целевой громкости — получится только шум
+MAX_GAIN_DB = 20.0
+
+BLOCK_SECONDS = 0.4  # блок измерения BS.1770: 400 мс
+SUBBLOCKS = 4  # шаг 100 мс — перекрытие блоков 75%
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+LIMITER_BLOCK_MS = 5
+LIMITER_HOLD_BLOCKS = 3  # упреждение и удержание усиления лимитера: ±15 мс
+EDGE_FADE_MS = 10
+
+
+def _biquad_response(b: tuple, a: tuple, w: np.ndarray) -> np.ndarray:
+    z = np.exp(-1j * w)
+    return np.abs((b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)) ** 2
+
+
+def k_weighting_power(n: int, rate: int) -> np.ndarray:
+    """|H(f)|² K-фильтра BS.1770 (полка +4 дБ над ~1.5 кГц и ФВЧ ~38 Гц) на частотах np.fft.rfftfreq(n)."""
+    w = 2 * np.pi * np.fft.rfftfreq(n)
+    # Полка по RBJ cookbook с параметрами из BS.1770 — годится для любой частоты дискретизации
+    gain, q, fc = 4.0, 1 / np.sqrt(2), 1500.0
+    a_gain = 10 ** (gain / 40)
+    w0 = 2 * np.pi * fc / rate
+    cos, alpha = np.cos(w0), np.sin(w0) / (2 * q)
+    root = 2 * np.sqrt(a_gain) * alpha
+    shelf = _biquad_response(
+        (a_gain * ((a_gain + 1) + (a_gain - 1) * cos + root),
+         -2 * a_gain * ((a_gain - 1) + (a_gain + 1) * cos),
+         a_gain * ((a_gain + 1) + (a_gain - 1) * cos - root)),
+        ((a_gain + 1) - (a_gain - 1) * cos + root,
+         2 * ((a_gain - 1) - (a_gain + 1) * cos),
+         (a_gain + 1) - (a_gain - 1) * cos - root),
+        w,
+    )
+    q, fc = 0.5, 38.0
+    w0 = 2 * np.pi * fc / rate
+    cos, alpha = np.cos(w0), np.sin(w0) / (2 * q)
+    high_pass = _biquad_response(
+        ((1 + cos) / 2, -(1 + cos), (1 + cos) / 2),
+        (1 + alpha, -2 * cos, 1 - alpha),
+        w,
+    )
+    return shelf * high_pass
+
+
+def _as_channels(samples: np.ndarray) -> np.ndarray:
+    return samples[:, None] if samples.ndim == 1 else samples
+
+
+def integrated_loudness(samples: np.ndarray, rate: int) -> float:
+    """Интегральная громкость в LUFS по EBU R128 / BS.1770 с абсолютным и относительным гейтом.
+
+    K-фильтр применяется в частотной области к подблокам по 100 мс одним пакетным rfft:
+    для гейта нужна только энергия блоков, а её по Парсевалю даёт спектр без обратного
+    преобразования и без рекурсивного фильтра по каждому сэмплу.
+    """
+    channels = _as_channels(samples)
+    step = int(rate * BLOCK_SECONDS / SUBBLOCKS)
+    count = len(channels) // step
+    if count < SUBBLOCKS:
+        return float("-inf")
+
+    frames = channels[:count * step].T.reshape(channels.shape[1], count, step)
+    spectrum = np.fft.rfft(frames, axis=-1)
+    # Вес бинов rfft в теореме Парсеваля: крайние один раз, остальные дважды
+    weights = np.full(spectrum.shape[-1], 2.0)
+    weights[0] = 1.0
+    if step % 2 == 0:
+        weights[-1] = 1.0
+    weights *= k_weighting_power(step, rate)
+    energy = (np.abs(spectrum) ** 2) @ weights / step ** 2
+
+    # Средний квадрат блока 400 мс — среднее четырёх подряд идущих подблоков, сумма по каналам
+    cumulative = np.concatenate([np.zeros((energy.shape[0], 1)), np.cumsum(energy, axis=1)], axis=1)
+    blocks = ((cumulative[:, SUBBLOCKS:] - cumulative[:, :-SUBBLOCKS]) / SUBBLOCKS).sum(axis=0)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(blocks)
+
+    gated = blocks[loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = blocks[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def limit_peaks(samples: np.ndarray, rate: int, ceiling_db: float = AUDIO_PEAK_CEILING_DB) -> np.ndarray:
+    """Лимитер с упреждением: ни один сэмпл не выходит за ceiling_db, усиление меняется плавно.
+
+    Нужное ослабление считается по блокам 5 мс, расширяется на соседние блоки (атака и
+    удержание) и внутри блока линейно переходит к значению следующего. Оба конца не больше
+    ослабления, нужного самому блоку, поэтому перегрузок не остаётся.
+    """
+    ceiling = 10 ** (ceiling_db / 20)
+    channels = _as_channels(samples)
+    block = max(1, int(rate * LIMITER_BLOCK_MS / 1000))
+    count = -(-len(channels) // block)
+    if count == 0:
+        return samples
+    padded = np.zeros((count * block, channels.shape[1]), dtype=np.float32)
+    padded[:len(channels)] = channels
+    block_peaks = np.abs(padded.reshape(count, -1)).max(axis=1)
+    if block_peaks.max() <= ceiling:
+        return samples
+
+    block_gain = np.minimum(1.0, ceiling / np.maximum(block_peaks, 1e-12)).astype(np.float32)
+    window = 2 * LIMITER_HOLD_BLOCKS + 1
+    edged = np.pad(block_gain, LIMITER_HOLD_BLOCKS, constant_values=1.0)
+    held = np.lib.stride_tricks.sliding_window_view(edged, window).min(axis=1)
+    # Внутри блока усиление линейно идёт к значению следующего — сразу для всех блоков
+    following = np.append(held[1:], held[-1])
+    ramp = np.arange(block, dtype=np.float32) / block
+    gain = (held[:, None] + (following - held)[:, None] * ramp).reshape(-1)[:len(channels)]
+    limited = channels * gain[:, None]
+    return limited[:, 0] if samples.ndim == 1 else limited
+
+
+def trim_silence(samples: np.ndarray, rate: int, threshold_db: float = SILENCE_THRESHOLD_DB,
+                 head_ms: int = 100, tail_ms: int = 250) -> np.ndarray:
+    """Обрезает тишину в начале и в конце, оставляя короткие поля, чтобы не съесть атаку и хвост."""
+    channels = _as_channels(samples)
+    frame = max(1, rate // 100)
+    count = len(channels) // frame
+    if count == 0:
+        return samples
+
+    levels = np.sqrt(np.mean(channels[:count * frame].reshape(count, frame, -1) ** 2, axis=(1, 2)))
+    loud = np.flatnonzero(levels > 10 ** (threshold_db / 20))
+    if not len(loud):
+        return samples
+    start = max(0, loud[0] * frame - rate * head_ms // 1000)
+    end = min(len(samples), (loud[-1] + 1) * frame + rate * tail_ms // 1000)
+    return samples[start:end]
+
+
+def fade_edges(samples: np.ndarray, rate: int, fade_ms: int = EDGE_FADE_MS) -> np.ndarray:
+    fade = min(len(samples) // 2, rate * fade_ms // 1000)
+    if fade == 0:
+        return samples
+    ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+    if samples.ndim > 1:
+        ramp = ramp[:, None]
+    samples = samples.copy()
+    samples[:fade] *= ramp
+    samples[-fade:] *= ramp[::-1]
+    return samples
+
+
+def master_audio(samples: np.ndarray, rate: int, target_lufs: float = AUDIO_TARGET_LUFS,
+                 ceiling_db: float = AUDIO_PEAK_CEILING_DB, trim: bool = True) -> np.ndarray:
+    """Финальная обработка сгенерированного звука: тишина по краям, громкость к target_lufs, лимитер.
+
+    Работает с float32 формы (n,) или (n, каналы). Выполняется в пуле процессов.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if trim:
+        samples = trim_silence(samples, rate)
+    loudness = integrated_loudness(samples, rate)
+    if np.isfinite(loudness):
+        gain_db = min(target_lufs - loudness, MAX_GAIN_DB)
+        samples = samples * np.float32(10 ** (gain_db / 20))
+    return fade_edges(limit_peaks(samples, rate, ceiling_db), rate).astype(np.float32, copy=False)
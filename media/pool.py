@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+logger = logging.getLogger("media")
+
+# Одно ядро оставляем циклу событий бота, остальные — под обработку медиа
+MEDIA_POOL_SIZE = int(os.getenv("MEDIA_POOL_SIZE", str(max(1, (os.cpu_count() or 2) - 1))))
+MEDIA_TASK_TIMEOUT = float(os.getenv("MEDIA_TASK_TIMEOUT", "120"))
+
+_executor: ProcessPoolExecutor | None = None
+# Общий лимит одновременных медиа-задач: и функций в пуле процессов, и ffmpeg-подпроцессов
+_slots = asyncio.Semaphore(MEDIA_POOL_SIZE)
+
+_stats = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "timeouts": 0}
+_wait_ms = deque(maxlen=1000)
+_run_ms = deque(maxlen=1000)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MEDIA_POOL_SIZE)
+    return _executor
+
+
+def _recycle_executor():
+    # Зависшую задачу в процессе не отменить — завершаем процессы старого пула и создаём новый.
+    # Остальные задачи этого пула тоже прервутся с BrokenProcessPool, зато зависший процесс
+    # не будет дальше держать ядро. shutdown обнуляет _processes, поэтому список берём до него.
+    global _executor
+    if _executor is not None:
+        processes = list((_executor._processes or {}).values())
+        _executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        _executor = None
+
+
+@asynccontextmanager
+async def media_slot(timeout: float = MEDIA_TASK_TIMEOUT):
+    """Занимает слот медиа-пула на время блока; при превышении timeout блок отменяется."""
+    queued_at = time.perf_counter()
+    _stats["queued"] += 1
+    async with _slots:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+        started_at = time.perf_counter()
+        _wait_ms.append((started_at - queued_at) * 1000)
+        try:
+            async with asyncio.timeout(timeout):
+                yield
+        except TimeoutError:
+            _stats["timeouts"] += 1
+            raise
+        except Exception:
+            _stats["failed"] += 1
+            raise
+        else:
+            _stats["completed"] += 1
+        finally:
+            _stats["running"] -= 1
+            _run_ms.append((time.perf_counter() - started_at) * 1000)
+
+
+def media_pool_busy() -> bool:
+    """Все слоты заняты — необязательную работу (превью, раскадровку) лучше пропустить, чем ждать."""
+    return _slots.locked()
+
+
+async def run_media_job(fn, *args, timeout: float = MEDIA_TASK_TIMEOUT, **kwargs):
+    """Выполняет CPU-тяжёлую функцию в пуле процессов. fn должна быть функцией уровня модуля."""
+    loop = asyncio.get_running_loop()
+    try:
+        async with media_slot(timeout):
+            return await loop.run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+    except TimeoutError:
+        logger.warning(f"Медиа-задача {fn.__name__} не уложилась в {timeout} с")
+        _recycle_executor()
+        raise
+
+
+def _percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def media_pool_stats() -> dict:
+    return {
+        **_stats,
+        "size": MEDIA_POOL_SIZE,
+        "wait_p50_ms": _percentile(_wait_ms, 0.5),
+        "wait_p99_ms": _percentile(_wait_ms, 0.99),
+        "run_p50_ms": _percentile(_run_ms, 0.5),
+        "run_p99_ms": _percentile(_run_ms, 0.99),
+    }
+
+
+def shutdown_media_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, AsyncGenerator
+
+import aiohttp
+from aiogram import Bot
+from aiogram.types import InputFile
+
+logger = logging.getLogger("media")
+
+CHUNK_SIZE = 64 * 1024
+# До этого размера файл держится в памяти, крупнее — уходит во временный файл задачи
+SPOOL_MAX_SIZE = int(os.getenv("MEDIA_SPOOL_MAX_SIZE", str(8 * 1024 * 1024)))
+
+
+class DownloadError(Exception):
+    pass
+
+
+async def iter_url(session: aiohttp.ClientSession, url: str) -> AsyncIterator[bytes]:
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            raise DownloadError(f"Ошибка скачивания {url}: HTTP {resp.status}")
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            yield chunk
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки в Telegram, который aiogram читает из буфера по частям."""
+
+    def __init__(self, spool: tempfile.SpooledTemporaryFile, filename: str, chunk_size: int = CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.spool = spool
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        # aiogram может прочитать файл повторно при ретрае запроса
+        self.spool.seek(0)
+        while chunk := self.spool.read(self.chunk_size):
+            yield chunk
+
+
+@asynccontextmanager
+async def download_spooled(session: aiohttp.ClientSession, url: str, filename: str,
+                           max_size: int = SPOOL_MAX_SIZE):
+    """Скачивает url по частям и отдаёт SpooledInputFile; буфер удаляется при выходе из блока."""
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size, prefix="media-")
+    try:
+        async for chunk in iter_url(session, url):
+            spool.write(chunk)
+        yield SpooledInputFile(spool, filename)
+    finally:
+        spool.close()
@@ -0,0 +1,304 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+
+import aiohttp
+import numpy as np
+
+from media.audio import FFMPEG, TranscodeError, fit_to_duration, pcm_to_wav
+from media.images import tile_frames
+from media.pool import media_slot, run_media_job
+from media.stream import iter_url
+
+logger = logging.getLogger("media")
+
+FFPROBE = os.getenv("FFPROBE_BINARY", "ffprobe")
+# Подготовка видео перед загрузкой. Сначала всё равно пробуется ссылка, если HEAD показал
+# mp4 в пределах лимита; подготовленная загрузка — запасной путь (bot/delivery.py, plan)
+VIDEO_POSTPROCESS = os.getenv("VIDEO_POSTPROCESS", "1") == "1"
+# Лимит Bot API на отправку файла ботом — 50 МБ, оставляем запас на контейнер
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(48 * 1024 * 1024)))
+VIDEO_TASK_TIMEOUT = float(os.getenv("VIDEO_TASK_TIMEOUT", "300"))
+AUDIO_BITRATE = 128_000
+# Ниже этого битрейта 1080p разваливается на блоки — лучше уменьшить кадр
+MIN_BITRATE_FOR_FULL_SIZE = 900_000
+
+THUMBNAIL_SIZE = 320  # Telegram принимает превью до 320 px по большей стороне
+
+# Раскадровка: кадры по всей длине ролика сеткой в один JPEG
+CONTACT_SHEET_FRAMES = int(os.getenv("CONTACT_SHEET_FRAMES", "6"))
+CONTACT_SHEET_COLUMNS = 3
+CONTACT_SHEET_TILE_WIDTH = 400
+CONTACT_SHEET_TIMEOUT = float(os.getenv("CONTACT_SHEET_TIMEOUT", "30"))
+
+
+class PreparedVideo:
+    def __init__(self, path: str, thumbnail: str | None, width: int, height: int, duration: float, mode: str):
+        self.path = path
+        self.thumbnail = thumbnail
+        self.width = width
+        self.height = height
+        self.duration = duration
+        self.mode = mode  # "copy", "transcode" или "two_pass" — для логов
+
+
+async def _run(*args: str) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise TranscodeError(f"{os.path.basename(args[0])} завершился с кодом {proc.returncode}: "
+                             f"{stderr.decode(errors='ignore')[-500:]}")
+    return stdout
+
+
+async def probe(path: str) -> dict:
+    output = await _run(FFPROBE, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path)
+    info = json.loads(output)
+    video = next((s for s in info["streams"] if s["codec_type"] == "video"), None)
+    audio = next((s for s in info["streams"] if s["codec_type"] == "audio"), None)
+    if video is None:
+        raise TranscodeError(f"В {path} нет видеодорожки")
+    return {
+        "video_codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "width": int(video.get("width", 0)),
+        "height": int(video.get("height", 0)),
+        "fps": video.get("r_frame_rate"),
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "duration": float(info["format"].get("duration") or video.get("duration") or 0),
+        "size": int(info["format"].get("size") or (os.path.getsize(path) if os.path.exists(path) else 0)),
+    }
+
+
+def _is_compatible(info: dict) -> bool:
+    # То, что Telegram проигрывает сразу на всех клиентах
+    return (info["video_codec"] == "h264" and info["pix_fmt"] == "yuv420p"
+            and info["audio_codec"] in (None, "aac"))
+
+
+def _audio_args(info: dict) -> list[str]:
+    if info["audio_codec"] is None:
+        return ["-an"]
+    if info["audio_codec"] == "aac":
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+
+
+async def _transcode(source: str, output: str, info: dict):
+    await _run(
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+        *_audio_args(info), "-movflags", "+faststart", output,
+    )
+
+
+async def _two_pass(source: str, output: str, info: dict, workdir: str):
+    # Битрейт под лимит размера: всё, что не занял звук, отдаём видео (с запасом 5% на контейнер)
+    audio_bitrate = AUDIO_BITRATE if info["audio_codec"] else 0
+    video_bitrate = int(VIDEO_MAX_BYTES * 8 * 0.95 / max(info["duration"], 1)) - audio_bitrate
+    if video_bitrate <= 0:
+        raise TranscodeError(f"Видео {info['duration']:.0f} с не уложить в {VIDEO_MAX_BYTES} байт")
+
+    scale = []
+    if video_bitrate < MIN_BITRATE_FOR_FULL_SIZE and max(info["width"], info["height"]) > 720:
+        scale = ["-vf", "scale='if(gt(iw,ih),-2,720)':'if(gt(iw,ih),720,-2)'"]
+
+    common = [
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", str(video_bitrate), "-pix_fmt", "yuv420p",
+        *scale, "-passlogfile", os.path.join(workdir, "pass"),
+    ]
+    await _run(FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source, *common,
+               "-pass", "1", "-an", "-f", "mp4", os.devnull)
+    audio = ["-an"] if not info["audio_codec"] else ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+    await _run(FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source, *common,
+               "-pass", "2", *audio, "-movflags", "+faststart", output)
+
+
+async def _thumbnail(source: str, output: str, duration: float) -> str | None:
+    try:
+        await _run(
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{min(1.0, duration / 2):.2f}",
+            "-i", source, "-frames:v", "1",
+            "-vf", f"scale='min({THUMBNAIL_SIZE},iw)':'min({THUMBNAIL_SIZE},ih)':force_original_aspect_ratio=decrease",
+            "-q:v", "4", output,
+        )
+    except TranscodeError:
+        logger.warning("Не удалось сделать превью видео", exc_info=True)
+        return None
+    return output
+
+
+async def _grab_frame(source: str, at: float, width: int, height: int) -> np.ndarray | None:
+    # -ss перед -i: ffmpeg прыгает к ближайшему ключевому кадру (по ссылке — Range-запросом)
+    # и декодирует только его окрестность, а не весь ролик. Слот — на каждый процесс ffmpeg.
+    async with media_slot(CONTACT_SHEET_TIMEOUT):
+        data = await _run(
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-ss", f"{at:.3f}", "-i", source,
+            "-frames:v", "1", "-vf", f"scale={width}:{height}", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1",
+        )
+    if len(data) < width * height * 3:
+        return None
+    return np.frombuffer(data[:width * height * 3], dtype=np.uint8).reshape(height, width, 3)
+
+
+async def contact_sheet(source: str, frames: int = CONTACT_SHEET_FRAMES, columns: int = CONTACT_SHEET_COLUMNS) -> bytes:
+    """Раскадровка ролика в JPEG: frames кадров, равномерно по длительности, сеткой по columns.
+
+    source может быть ссылкой: скачиваются только заголовок и окрестности нужных кадров.
+    """
+    async with media_slot(CONTACT_SHEET_TIMEOUT):
+        info = await probe(source)
+    width = CONTACT_SHEET_TILE_WIDTH
+    height = round(width * info["height"] / max(info["width"], 1) / 2) * 2
+    moments = (np.arange(frames) + 0.5) / frames * info["duration"]
+    images = await asyncio.gather(*(_grab_frame(source, float(at), width, height) for at in moments))
+    images = [image for image in images if image is not None]
+    if not images:
+        raise TranscodeError(f"Не удалось достать ни одного кадра из {source}")
+    return await run_media_job(tile_frames, images, min(columns, len(images)))
+
+
+async def last_frame(source: str) -> bytes:
+    """Кадр у самого конца ролика в JPEG — стартовое изображение для следующей сцены."""
+    async with media_slot(CONTACT_SHEET_TIMEOUT):
+        data = await _run(
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-sseof", "-0.1", "-i", source,
+            "-frames:v", "1", "-q:v", "2", "-c:v", "mjpeg", "-f", "image2pipe", "pipe:1",
+        )
+    if not data:
+        raise TranscodeError(f"Не удалось достать последний кадр из {source}")
+    return data
+
+
+async def _download(url: str, path: str):
+    async with aiohttp.ClientSession() as session:
+        with open(path, "wb") as f:
+            async for chunk in iter_url(session, url):
+                f.write(chunk)
+
+
+async def _prepare(source: str, workdir: str) -> PreparedVideo:
+    output = os.path.join(workdir, "video.mp4")
+    async with media_slot(VIDEO_TASK_TIMEOUT):
+        info = await probe(source)
+        if _is_compatible(info) and info["size"] <= VIDEO_MAX_BYTES:
+            mode = "copy"
+            await _run(FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+                       "-c", "copy", "-movflags", "+faststart", output)
+        else:
+            mode = "transcode"
+            await _transcode(source, output, info)
+            if os.path.getsize(output) > VIDEO_MAX_BYTES:
+                mode = "two_pass"
+                await _two_pass(source, output, info, workdir)
+        thumbnail = await _thumbnail(output, os.path.join(workdir, "thumb.jpg"), info["duration"])
+        result = await probe(output)
+
+    logger.info(f"Видео подготовлено ({mode}): {info['size']} -> {result['size']} байт, "
+                f"{info['video_codec']}/{info['audio_codec']} -> {result['video_codec']}/{result['audio_codec']}")
+    return PreparedVideo(output, thumbnail, result["width"], result["height"], result["duration"], mode)
+
+
+@asynccontextmanager
+async def prepare_video(url: str):
+    """Скачивает видео и готовит его к отправке в Telegram. Временные файлы удаляются при выходе из блока.
+
+    Совместимое видео (H.264 yuv420p + AAC) только перепаковывается с +faststart без перекодирования;
+    несовместимое перекодируется в H.264/AAC, а не влезающее в VIDEO_MAX_BYTES — в два прохода под лимит.
+    """
+    with tempfile.TemporaryDirectory(prefix="video-") as workdir:
+        source = os.path.join(workdir, "source.mp4")
+        await _download(url, source)
+        yield await _prepare(source, workdir)
+
+
+def _concat_signature(info: dict) -> tuple:
+    # Склеить без перекодирования можно только потоки с одинаковыми параметрами
+    return info["video_codec"], info["pix_fmt"], info["width"], info["height"], info["fps"], info["audio_codec"]
+
+
+async def _conform(source: str, output: str, reference: dict, with_audio: bool):
+    width, height = reference["width"], reference["height"]
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+    if reference["fps"]:
+        video_filter += f",fps={reference['fps']}"
+    audio = ["-c:a", "aac", "-b:a", str(AUDIO_BITRATE), "-ar", "44100", "-ac", "2"] if with_audio else ["-an"]
+    await _run(
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source, "-vf", video_filter,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p", *audio, output,
+    )
+
+
+@asynccontextmanager
+async def concat_videos(urls: list[str]):
+    """Склеивает ролики по порядку и готовит результат как prepare_video.
+
+    Ролики одной модели с одинаковыми настройками совпадают по кодеку, размеру и частоте кадров —
+    тогда они склеиваются concat-демультиплексором без перекодирования (-c copy), за доли секунды.
+    Несовпадающие сначала приводятся к параметрам первого ролика.
+    """
+    with tempfile.TemporaryDirectory(prefix="concat-") as workdir:
+        clips = [os.path.join(workdir, f"clip{i}.mp4") for i in range(len(urls))]
+        await asyncio.gather(*(_download(url, path) for url, path in zip(urls, clips)))
+
+        joined = os.path.join(workdir, "joined.mp4")
+        async with media_slot(VIDEO_TASK_TIMEOUT):
+            infos = await asyncio.gather(*(probe(path) for path in clips))
+            copy = len({_concat_signature(info) for info in infos}) == 1
+            if not copy:
+                with_audio = all(info["audio_codec"] for info in infos)
+                conformed = [os.path.join(workdir, f"conformed{i}.mp4") for i in range(len(clips))]
+                for source, output in zip(clips, conformed):
+                    await _conform(source, output, infos[0], with_audio)
+                clips = conformed
+
+            playlist = os.path.join(workdir, "clips.txt")
+            with open(playlist, "w") as f:
+                f.writelines(f"file '{os.path.basename(path)}'\n" for path in clips)
+            await _run(FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0",
+                       "-i", playlist, "-c", "copy", "-movflags", "+faststart", joined)
+
+        logger.info(f"Склеено {len(urls)} роликов ({'copy' if copy else 'conform'})")
+        yield await _prepare(joined, workdir)
+
+
+@asynccontextmanager
+async def video_with_audio(url: str, samples: np.ndarray, rate: int):
+    """Кладёт звук (float32 PCM) на видео по ссылке и готовит результат как prepare_video.
+
+    Видеопоток копируется без перекодирования, звук подгоняется под длину ролика
+    (обрезка с затуханием или тишина в конце) и кодируется в AAC.
+    """
+    with tempfile.TemporaryDirectory(prefix="mux-") as workdir:
+        source = os.path.join(workdir, "source.mp4")
+        soundtrack = os.path.join(workdir, "audio.wav")
+        muxed = os.path.join(workdir, "muxed.mp4")
+        await _download(url, source)
+
+        async with media_slot(VIDEO_TASK_TIMEOUT):
+            info = await probe(source)
+        samples = await run_media_job(fit_to_duration, samples, rate, info["duration"])
+        with open(soundtrack, "wb") as f:
+            f.write(pcm_to_wav(samples, rate))
+
+        async with media_slot(VIDEO_TASK_TIMEOUT):
+            await _run(
+                FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", source, "-i", soundtrack,
+                "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy",
+                "-c:a", "aac", "-b:a", str(AUDIO_BITRATE), "-ar", "48000", "-ac", "2",
+                "-shortest", "-movflags", "+faststart", muxed,
+            )
+        logger.info(f"Звук ({len(samples) / rate:.1f} с) наложен на видео {info['duration']:.1f} с")
+        yield await _prepare(muxed, workdir)
@@ -1,26 +1,26 @@
 import os
+import re
 import logging
 import asyncio
-import replicate
-import aiohttp
-import ffmpeg
-import uuid
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
-from aiogram.types import Message, FSInputFile, CallbackQuery
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
 
-from sqlalchemy import select
-from sqlalchemy.exc import NoResultFound
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.file_cache import answer_media
+from bot.predictions import run_prediction
 
 from keyboards import main_menu_kb
+from media.audio import url_to_pcm, url_to_mastered, pcm_to_voice, stitch_to_voice, SAMPLE_RATE
+from media.loudness import master_audio
+from media.pool import run_media_job
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -30,12 +30,57 @@ REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("tg_bot")
 
+# Длинный текст режется по предложениям на куски, которые озвучиваются параллельно
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "300"))
+
 class VoiceGenState(StatesGroup):
     CHOOSE_TEMPERATURE = State()
     CHOOSE_SEED = State()
     AWAITING_TEXT = State()
     CONFIRM_GENERATION = State()
 
+def split_text(text: str, max_chars: int = TTS_CHUNK_CHARS) -> list[str]:
+    """Режет текст на куски до max_chars, не разрывая предложения без необходимости."""
+    sentences = [s for s in re.split(r"(?<=[.!?…])\s+", text.strip()) if s]
+    pieces = []
+    for sentence in sentences:
+        # Слишком длинное предложение режем по запятым, а в крайнем случае по словам
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(", ", max_chars // 2, max_chars)
+            if cut < 0:
+                cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+async def synthesize_chunk(text: str, seed: int, temperature: float) -> str:
+    output = await run_prediction(
+        model="resemble-ai/chatterbox",
+        input={
+            "prompt": text,
+            "seed": seed,
+            "cfg_weight": 0.5,
+            "temperature": temperature,
+            "exaggeration": 0.5
+        }
+    )
+    audio_url = output if isinstance(output, str) else getattr(output, "url", None)
+    if not isinstance(audio_url, str) or not audio_url.startswith("http"):
+        raise ValueError("Невалидный URL аудио")
+    return audio_url
+
+async def synthesize_chunk_pcm(text: str, seed: int, temperature: float):
+    return await url_to_pcm(await synthesize_chunk(text, seed, temperature))
+
 # Кнопки
 def temperature_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -60,34 +105,6 @@ def confirm_keyboard():
 def calculate_chatterbox_price() -> float:
     return 9.0
 
-# Баланс
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user is None:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
 
 # /start
 async def cmd_start_chatterbox(message: Message, state: FSMContext):
@@ -131,15 +148,17 @@ async def handle_voice_text_chatterbox(message: Message, state: FSMContext):
 
     price = calculate_chatterbox_price()
     balance = await get_user_balance(message.from_user.id)
+    is_free = has_free_generation(message.from_user.id, "chatterbox")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(f"❌ Недостаточно средств.\n💰 Стоимость: {price:.2f} ₽\n 💼 Ваш баланс: {balance:.2f} ₽.\n Пополнить кошелек можно в разделе Баланс")
         await state.clear()
         return
 
     await state.update_data(prompt=text, price=price, is_confirmed=False)
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"💰 Стоимость генерации: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽\n\nПодтвердите генерацию:",
+        f"{free_note}💰 Стоимость генерации: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽\n\nПодтвердите генерацию:",
         reply_markup=confirm_keyboard()
     )
     await state.set_state(VoiceGenState.CONFIRM_GENERATION)
@@ -155,62 +174,62 @@ async def confirm_generation_chatterbox(callback: CallbackQuery, state: FSMConte
     await callback.message.edit_reply_markup(reply_markup=None)
 
     user_id = callback.from_user.id
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "chatterbox")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "chatterbox", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства.")
         await state.clear()
         return
 
     await callback.message.edit_text("🎤 Генерация озвучки - это может занять несколько минут...")
 
+    seed = data.get("seed", 0)
+    temperature = data.get("temperature", 0.5)
+    chunks = split_text(data["prompt"])
+    tasks = []
+    delivered = 0  # сколько кусков текста пользователь уже услышал
     try:
-        replicate.api_token = REPLICATE_API_TOKEN
-        prediction = await replicate.predictions.async_create(
-            model="resemble-ai/chatterbox",
-            input={
-                "prompt": data["prompt"],
-                "seed": data.get("seed", 0),
-                "cfg_weight": 0.5,
-                "temperature": data.get("temperature", 0.5),
-                "exaggeration": 0.5
-            }
+        if len(chunks) == 1:
+            # Громкость и тишина по краям выравниваются локально, Opus уходит в Telegram из памяти
+            samples = await url_to_mastered(await synthesize_chunk(chunks[0], seed, temperature))
+            voice = await pcm_to_voice(samples)
+            await answer_media(callback.message, "voice", voice, model="chatterbox")
+            delivered = 1
+            return
+
+        # Все куски рендерятся одновременно с одинаковыми seed и temperature, чтобы голос не менялся
+        tasks = [asyncio.create_task(synthesize_chunk_pcm(chunk, seed, temperature)) for chunk in chunks]
+        first = await tasks[0]
+        # Начало отправляем сразу, пока остальные куски ещё в работе
+        await callback.message.answer_voice(
+            await pcm_to_voice(await run_media_job(master_audio, first, SAMPLE_RATE), filename="voice_start.ogg"),
+            caption=f"▶️ Начало озвучки. Полная версия ({len(chunks)} частей) придёт следом."
         )
-
-        while prediction.status not in ("succeeded", "failed"):
-            await asyncio.sleep(2)
-            prediction = await replicate.predictions.async_get(prediction.id)
-
-        if prediction.status != "succeeded":
-            raise Exception(f"Модель завершилась с ошибкой: {prediction.status}")
-
-        audio_url = prediction.output
-        if not isinstance(audio_url, str) or not audio_url.startswith("http"):
-            raise ValueError("Невалидный URL аудио")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(audio_url) as resp:
-                if resp.status != 200:
-                    raise Exception("Ошибка скачивания")
-                with open("output.wav", "wb") as f:
-                    f.write(await resp.read())
-
-        (
-            ffmpeg
-            .input("output.wav")
-            .output("voice.ogg", format='opus', audio_bitrate='64k', acodec='libopus')
-            .overwrite_output()
-            .run()
-        )
-
-        voice = FSInputFile("voice.ogg")
-        await callback.message.answer_voice(voice)
+        delivered = 1
+        parts = [first, *await asyncio.gather(*tasks[1:])]
+        voice = await stitch_to_voice(parts)
+        await answer_media(callback.message, "voice", voice, model="chatterbox")
+        delivered = len(chunks)
 
     except Exception:
         logger.exception("Ошибка озвучки:")
-        await callback.message.answer("⚠️ Ошибка генерации аудио.")
+        # Возвращаем долю цены за неозвученные куски; генерацию в квоте — если не дошло ничего
+        if not delivered:
+            release_generation(user_id, "chatterbox", quota_kind)
+        if quota_kind == QUOTA_PAID:
+            amount = round(data["price"] * (len(chunks) - delivered) / len(chunks), 2)
+            await refund(user_id, amount)
+            await callback.message.answer(f"⚠️ Ошибка генерации аудио. {amount:.2f} ₽ возвращены на баланс.")
+        else:
+            await callback.message.answer("⚠️ Ошибка генерации аудио.")
     finally:
-        for f in ["output.wav", "voice.ogg"]:
-            if os.path.exists(f):
-                os.remove(f)
+        for task in tasks:
+            task.cancel()
         await state.clear()
 
 # Главное меню
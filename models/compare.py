@@ -0,0 +1,298 @@
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from bot.billing import get_user_balance, charge, refund
+from bot.delivery import deliver_album
+from bot.model_stats import record_run, record_pick, load_model_stats, preferred_model
+from bot.predictions import run_prediction
+from bot.quota import acquire_generation, release_generation, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from media.images import IMAGE_PROFILES
+from media.ingest import ingest_photo
+from models.ideogram import ideogram_input, calculate_ideogram_price
+from models.imagegen4 import imagegen4_input, calculate_imagegen4_price
+from models.minimax import calculate_minimax_price
+from models.storyboard import STORYBOARD_MODELS, output_video_url, keyboard
+from models.variants import output_image_url
+
+logger = logging.getLogger(__name__)
+
+MIN_PROMPT_LENGTH = 15
+COMPARE_VIDEO_DURATION = 5
+
+
+def _storyboard_model(key: str, title: str) -> dict:
+    config = STORYBOARD_MODELS[key]
+    return {
+        "title": title,
+        "model": config["model"],
+        "quota": config["quota"],
+        "image_profile": config["image_profile"],
+        "price": config["price"](COMPARE_VIDEO_DURATION),
+        "input": lambda prompt, image_url: config["input"](prompt, image_url, COMPARE_VIDEO_DURATION),
+    }
+
+
+# Один промпт на нескольких моделях. Ключ модели — он же ключ в model_stats.
+# Картинки сравниваются в одном соотношении сторон, видео — одной длительности.
+COMPARE_SETS = {
+    "photo": {
+        "ideogram": {
+            "title": "Ideogram v2 Turbo",
+            "model": "ideogram-ai/ideogram-v2-turbo",
+            "quota": "ideogram",
+            "price": calculate_ideogram_price(),
+            "input": lambda prompt, image_url: ideogram_input({"prompt": prompt, "aspect_ratio": "1:1"}),
+        },
+        "imagegen4": {
+            "title": "Imagen 4",
+            "model": "google/imagen-4",
+            "quota": "imagegen4",
+            "price": calculate_imagegen4_price(),
+            "input": lambda prompt, image_url: imagegen4_input({"prompt": prompt, "aspect_ratio": "1:1"}),
+        },
+    },
+    "video": {
+        "kling": _storyboard_model("kling", "Kling Standard"),
+        "minimax": {
+            "title": "Minimax Video-01 Live",
+            "model": "minimax/video-01-live",
+            "quota": "minimax",
+            "image_profile": "minimax",
+            "price": calculate_minimax_price(),
+            "input": lambda prompt, image_url: {
+                "prompt": prompt, "prompt_optimizer": True, "first_frame_image": image_url,
+            },
+        },
+        "seedance": _storyboard_model("seedance_480p", "Seedance 480p"),
+    },
+}
+MODEL_TITLES = {key: config["title"] for models in COMPARE_SETS.values() for key, config in models.items()}
+OUTPUT_URL = {"photo": output_image_url, "video": output_video_url}
+
+
+class CompareState(StatesGroup):
+    choosing_models = State()
+    waiting_image = State()
+    waiting_prompt = State()
+    confirm_pending = State()
+    picking = State()
+
+
+def _models_keyboard(media_type: str, selected: list[str], stats: dict[str, dict]):
+    preferred = preferred_model(stats)
+    kb = InlineKeyboardBuilder()
+    for key, config in COMPARE_SETS[media_type].items():
+        text = f"{'✅' if key in selected else '▫️'} {config['title']} · {config['price']:.0f} ₽"
+        if key in stats:
+            text += f" · ~{stats[key]['latency']:.0f} с · 👍 {stats[key]['pick_rate']:.0%}"
+        if key == preferred:
+            text += " ⭐"
+        kb.button(text=text, callback_data=f"cmp_toggle_{key}")
+    kb.button(text="▶️ Дальше", callback_data="cmp_next")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+async def compare_start(message: Message, state: FSMContext, media_type: str):
+    await state.clear()
+    models = COMPARE_SETS[media_type]
+    stats = await load_model_stats(models)
+    selected = list(models)
+    await state.update_data(media_type=media_type, selected=selected, stats=stats)
+    await message.answer(
+        "⚖️ Сравнение моделей: один prompt запускается на выбранных моделях одновременно, "
+        "результаты приходят одним альбомом с временем генерации и ценой каждой модели.\n\n"
+        "⚠️ Prompt на английском языке.\n"
+        "💰 Стоимость: сумма стоимостей выбранных моделей\n"
+        "⭐ — модель, результат которой чаще выбирают\n"
+        "🔤 Нажмите /main чтобы выйти",
+    )
+    await message.answer("Выбери модели (минимум две):", reply_markup=_models_keyboard(media_type, selected, stats))
+    await state.set_state(CompareState.choosing_models)
+
+
+async def compare_model_toggled(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    key = callback.data.removeprefix("cmp_toggle_")
+    selected = [k for k in data["selected"] if k != key] if key in data["selected"] else data["selected"] + [key]
+    # Порядок — как в COMPARE_SETS, чтобы альбом всегда шёл в одном порядке
+    selected = [k for k in COMPARE_SETS[data["media_type"]] if k in selected]
+    await state.update_data(selected=selected)
+    await callback.message.edit_reply_markup(
+        reply_markup=_models_keyboard(data["media_type"], selected, data["stats"])
+    )
+
+
+async def compare_models_chosen(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    if len(data["selected"]) < 2:
+        await callback.answer("Выбери хотя бы две модели.", show_alert=True)
+        return
+    await callback.answer()
+    if data["media_type"] == "video":
+        await callback.message.edit_text("📌 Пришли изображение, с которого начнётся видео.")
+        await state.set_state(CompareState.waiting_image)
+    else:
+        await callback.message.edit_text(f"✏️ Введи prompt на английском (минимум {MIN_PROMPT_LENGTH} символов):")
+        await state.set_state(CompareState.waiting_prompt)
+
+
+async def compare_handle_image(message: Message, state: FSMContext):
+    if not message.photo:
+        await message.answer("❌ Отправь изображение.")
+        return
+    data = await state.get_data()
+    models = COMPARE_SETS[data["media_type"]]
+    # Одна загрузка на всех: по самому строгому профилю среди выбранных моделей
+    profile = min((models[key]["image_profile"] for key in data["selected"]),
+                  key=lambda name: IMAGE_PROFILES[name]["max_side"])
+    try:
+        image_url = await ingest_photo(message.bot, message.photo[-1], model=profile, user_id=message.from_user.id)
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
+    await state.update_data(image_url=image_url)
+    await message.answer(f"✏️ Опиши сцену на английском (минимум {MIN_PROMPT_LENGTH} символов):")
+    await state.set_state(CompareState.waiting_prompt)
+
+
+async def compare_handle_prompt(message: Message, state: FSMContext):
+    prompt = (message.text or "").strip()
+    if len(prompt) < MIN_PROMPT_LENGTH:
+        await message.answer(f"❌ Описание слишком короткое. Минимум {MIN_PROMPT_LENGTH} символов.")
+        return
+
+    data = await state.get_data()
+    models = COMPARE_SETS[data["media_type"]]
+    price = sum(models[key]["price"] for key in data["selected"])
+    balance = await get_user_balance(message.from_user.id)
+    if balance < price:
+        await message.answer(f"❌ Недостаточно средств: нужно {price:.0f} ₽, у вас {balance:.0f} ₽.")
+        await state.clear()
+        return
+
+    titles = ", ".join(models[key]["title"] for key in data["selected"])
+    await state.update_data(prompt=prompt, price=price, is_confirmed=False)
+    await message.answer(
+        f"⚖️ {titles}\n💰 Стоимость: {price:.0f} ₽\n💼 Баланс: {balance:.0f} ₽\n\nПродолжить?",
+        reply_markup=keyboard([("✅ Сравнить", "compare_confirm")]),
+    )
+    await state.set_state(CompareState.confirm_pending)
+
+
+async def run_compare(media_type: str, keys: list[str], prompt: str, image_url: str | None,
+                      on_result=None) -> dict[str, tuple[str, float] | None]:
+    """Запускает все модели сразу; для каждой — (ссылка на результат, секунды) или None, если не вышло.
+
+    Задержка и отказы каждой модели сохраняются в model_stats.
+    """
+    models = COMPARE_SETS[media_type]
+    results: dict[str, tuple[str, float] | None] = dict.fromkeys(keys)
+
+    async def run(key: str):
+        config = models[key]
+        started = time.perf_counter()
+        try:
+            output = await run_prediction(model=config["model"], input=config["input"](prompt, image_url))
+        except Exception:
+            logger.exception(f"Сравнение: {key} не справилась")
+            await record_run(key, None)
+            return
+        latency = time.perf_counter() - started
+        results[key] = (OUTPUT_URL[media_type](output), latency)
+        await record_run(key, latency)
+        if on_result:
+            await on_result(key)
+
+    tasks = [asyncio.create_task(run(key)) for key in keys]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results
+
+
+async def compare_confirm(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    if data.get("is_confirmed"):
+        return
+    await state.update_data(is_confirmed=True)
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    user_id = callback.from_user.id
+    media_type = data["media_type"]
+    models = COMPARE_SETS[media_type]
+    keys = data["selected"]
+
+    kinds = {}
+    for key in keys:
+        kinds[key] = acquire_generation(user_id, models[key]["quota"], allow_free=False)
+        if kinds[key] == QUOTA_CAPPED:
+            for k, kind in kinds.items():
+                release_generation(user_id, models[k]["quota"], kind)
+            await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+            await state.clear()
+            return
+    if not await charge(user_id, data["price"]):
+        for k, kind in kinds.items():
+            release_generation(user_id, models[k]["quota"], kind)
+        await callback.message.edit_text("❌ Не удалось списать средства.")
+        await state.clear()
+        return
+
+    status = await callback.message.edit_text(f"⚖️ Генерация на {len(keys)} моделях одновременно...")
+    finished = []
+
+    async def on_result(key: str):
+        finished.append(models[key]["title"])
+        try:
+            await status.edit_text(f"⚖️ Генерация на {len(keys)} моделях одновременно...\n✅ Готово: {', '.join(finished)}")
+        except TelegramBadRequest:
+            pass
+
+    results = await run_compare(media_type, keys, data["prompt"], data.get("image_url"), on_result)
+    ready = [key for key in keys if results[key]]
+    failed = [key for key in keys if not results[key]]
+    if failed:
+        amount = sum(models[key]["price"] for key in failed)
+        await refund(user_id, amount)
+        for key in failed:
+            release_generation(user_id, models[key]["quota"], kinds[key])
+        titles = ", ".join(models[key]["title"] for key in failed)
+        await callback.message.answer(f"⚠️ Не справились: {titles}. {amount:.0f} ₽ возвращены на баланс.")
+    if not ready:
+        await state.clear()
+        return
+
+    await deliver_album(
+        callback.message, media_type, [results[key][0] for key in ready], model="compare",
+        captions=[f"{models[key]['title']} · {results[key][1]:.0f} с · {models[key]['price']:.0f} ₽" for key in ready],
+    )
+    if len(ready) < 2:
+        await state.clear()
+        return
+    await callback.message.answer(
+        "Какой результат лучше? Ответ поможет подсказывать модель другим.",
+        reply_markup=keyboard([(models[key]["title"], f"cmp_pick_{key}") for key in ready]),
+    )
+    await state.set_state(CompareState.picking)
+
+
+async def compare_picked(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    key = callback.data.removeprefix("cmp_pick_")
+    await record_pick(key)
+    await state.clear()
+    await callback.message.edit_text(f"🙏 Спасибо! Лучший результат: {MODEL_TITLES.get(key, key)}.")
+
@@ -0,0 +1,164 @@
+import os
+import random
+import logging
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.billing import charge, refund_generation
+from bot.delivery import deliver_video
+from bot.predictions import run_prediction
+from bot.quota import acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from models.seedance import calculate_price as calculate_seedance_price
+
+logger = logging.getLogger(__name__)
+
+# Черновик перед дорогой генерацией: тот же prompt, картинка и seed на Seedance 480p, 5 сек.
+# Промпт доводится на дешёвых черновиках, финал оплачивается один раз.
+DRAFT_MODEL = "bytedance/seedance-1-pro"
+DRAFT_RESOLUTION = "480p"
+DRAFT_DURATION = 5
+DRAFT_PRICE = calculate_seedance_price(DRAFT_RESOLUTION, DRAFT_DURATION)
+# Кнопка черновика появляется, только когда финал заметно дороже него
+DRAFT_MIN_FINAL_PRICE = float(os.getenv("DRAFT_MIN_FINAL_PRICE", "200"))
+MIN_PROMPT_LENGTH = 15
+
+
+class DraftState(StatesGroup):
+    drafting = State()
+    reviewing = State()
+    rendering = State()
+
+
+def draft_rows(callback_data: str, final_price: float) -> list[list[InlineKeyboardButton]]:
+    """Строки клавиатуры с кнопкой черновика; пусто, если финал и так дешёвый."""
+    if final_price < DRAFT_MIN_FINAL_PRICE:
+        return []
+    return [[InlineKeyboardButton(
+        text=f"🧪 Сначала черновик Seedance {DRAFT_RESOLUTION}, {DRAFT_DURATION} сек ({DRAFT_PRICE} ₽)",
+        callback_data=callback_data,
+    )]]
+
+
+def _video_url(output) -> str:
+    if isinstance(output, list):
+        output = next(item for item in output if str(item).endswith(".mp4"))
+    return str(output)
+
+
+def draft_input(prompt: str, image_url: str | None, seed: int, aspect_ratio: str = "16:9") -> dict:
+    params = {
+        "fps": 24,
+        "prompt": prompt,
+        "duration": DRAFT_DURATION,
+        "resolution": DRAFT_RESOLUTION,
+        "aspect_ratio": aspect_ratio,
+        "camera_fixed": False,
+        "seed": seed,
+    }
+    if image_url:
+        params["image"] = image_url
+    return params
+
+
+async def start_draft(callback: CallbackQuery, state: FSMContext, title: str, model: str, quota: str,
+                      price: float, final_input: dict, image_url: str | None = None, aspect_ratio: str = "16:9"):
+    """Переводит подтверждённую генерацию в режим черновика и сразу рендерит первый.
+
+    final_input — input дорогой модели; при рендере финала в нём меняется только prompt
+    (на последний из черновиков) и seed, если модель его принимает.
+    """
+    await callback.answer()
+    data = await state.get_data()
+    await state.set_data({
+        "title": title, "model": model, "quota": quota, "price": price,
+        "final_input": final_input,
+        "prompt": data["prompt"], "image_url": image_url, "aspect_ratio": aspect_ratio,
+        "seed": random.randint(0, 2**31 - 1),
+    })
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await run_draft(callback.message, callback.from_user.id, state)
+
+
+async def run_draft(message: Message, user_id: int, state: FSMContext):
+    await state.set_state(DraftState.drafting)
+    data = await state.get_data()
+    quota_kind = acquire_generation(user_id, "seedance", allow_free=False)
+    if quota_kind == QUOTA_CAPPED:
+        await message.answer(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+    if not await charge(user_id, DRAFT_PRICE):
+        release_generation(user_id, "seedance", quota_kind)
+        await message.answer("❌ Не удалось списать средства за черновик.")
+        await state.clear()
+        return
+
+    status = await message.answer("🧪 Черновик рендерится, обычно это меньше минуты...")
+    try:
+        output = await run_prediction(
+            model=DRAFT_MODEL,
+            input=draft_input(data["prompt"], data["image_url"], data["seed"], data["aspect_ratio"]),
+        )
+        await deliver_video(message, _video_url(output), model="seedance", caption=f"🧪 Черновик: {data['prompt']}")
+    except Exception:
+        logger.exception("Ошибка черновика:")
+        await refund_generation(user_id, "seedance", quota_kind, DRAFT_PRICE)
+        await status.edit_text(f"⚠️ Черновик не получился, {DRAFT_PRICE} ₽ возвращены. Пришли prompt ещё раз.")
+        await state.set_state(DraftState.reviewing)
+        return
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"🎬 Финал в {data['title']} — {data['price']:.0f} ₽", callback_data="draft_final")]
+    ])
+    await message.answer(
+        f"Если черновик устраивает — финал в {data['title']} с тем же prompt"
+        f"{', картинкой' if data['image_url'] else ''} и seed.\n"
+        f"✏️ Или пришли исправленный prompt — новый черновик за {DRAFT_PRICE} ₽.",
+        reply_markup=kb,
+    )
+    await state.set_state(DraftState.reviewing)
+
+
+async def draft_handle_prompt(message: Message, state: FSMContext):
+    prompt = (message.text or "").strip()
+    if len(prompt) < MIN_PROMPT_LENGTH:
+        await message.answer(f"❌ Описание слишком короткое. Минимум {MIN_PROMPT_LENGTH} символов.")
+        return
+    # Seed прежний: между черновиками меняется только prompt
+    await state.update_data(prompt=prompt)
+    await run_draft(message, message.from_user.id, state)
+
+
+async def draft_render_final(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(DraftState.rendering)
+    await callback.message.edit_reply_markup(reply_markup=None)
+    data = await state.get_data()
+    user_id = callback.from_user.id
+
+    quota_kind = acquire_generation(user_id, data["quota"])
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.answer(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, data["quota"], quota_kind)
+        await callback.message.answer("❌ Не удалось списать средства.")
+        await state.set_state(DraftState.reviewing)
+        return
+
+    final_input = {**data["final_input"], "prompt": data["prompt"]}
+    if "seed" in final_input:
+        final_input["seed"] = data["seed"]
+    await callback.message.answer(f"🎬 Финал рендерится в {data['title']}, это может занять несколько минут...")
+    try:
+        output = await run_prediction(model=data["model"], input=final_input)
+        await deliver_video(callback.message, _video_url(output), model=data["quota"], caption="✅ Готово! Вот финальное видео.")
+    except Exception:
+        logger.exception("Ошибка финальной генерации:")
+        note = await refund_generation(user_id, data["quota"], quota_kind, data["price"])
+        await callback.message.answer(f"⚠️ Финал не получился.\n{note}")
+    finally:
+        await state.clear()
@@ -2,7 +2,6 @@ import os
 import logging
 import asyncio
 import random
-import uuid
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
@@ -18,9 +17,12 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 import replicate
 
-from sqlalchemy import select
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from media.ingest import ingest_photo
+from models.variants import variants_button, run_variants
+from media.images import FLUX_ASPECT_RATIOS, closest_aspect_ratio
 
 from keyboards import main_menu_kb
 
@@ -40,33 +42,6 @@ class FluxKontextState(StatesGroup):
 def calculate_flux_price() -> float:
     return 9.0
 
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user is None:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
 
 async def cmd_start_flux(message: Message, state: FSMContext):
     await state.clear()
@@ -85,12 +60,19 @@ async def handle_image_flux(message: Message, state: FSMContext):
         await message.answer("❌ Пожалуйста, пришли изображение.")
         return
 
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model="flux", user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
     photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)
-    image_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
-    await state.update_data(image_url=image_url)
+    await state.update_data(image_url=image_url, image_size=(photo.width, photo.height))
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🪄 Авто (по фото)", callback_data="aspect_auto")],
         [
             InlineKeyboardButton(text="1:1", callback_data="aspect_1_1"),
             InlineKeyboardButton(text="16:9", callback_data="aspect_16_9"),
@@ -102,7 +84,12 @@ async def handle_image_flux(message: Message, state: FSMContext):
 
 async def handle_aspect_ratio_flux(callback: CallbackQuery, state: FSMContext):
     aspect_raw = callback.data.replace("aspect_", "")
-    aspect = aspect_raw.replace("_", ":")
+    if aspect_raw == "auto":
+        # Ближайшее поддерживаемое соотношение к пропорциям присланного фото
+        width, height = (await state.get_data())["image_size"]
+        aspect = closest_aspect_ratio(width, height, FLUX_ASPECT_RATIOS)
+    else:
+        aspect = aspect_raw.replace("_", ":")
     await state.update_data(aspect_ratio=aspect, safety_tolerance=3)
 
     await callback.message.edit_text("✅ Соотношение сторон выбрано. Загрузка стилей...")
@@ -138,25 +125,44 @@ async def handle_prompt_flux(message: Message, state: FSMContext):
 
     price = calculate_flux_price()
     balance = await get_user_balance(message.from_user.id)
+    is_free = has_free_generation(message.from_user.id, "flux")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(f"❌ Недостаточно средств.\n💰 Стоимость: {price:.2f} ₽\n💼 Ваш баланс: {balance:.2f} ₽. 💼 Для пополнения перейдите в раздел «Баланс».")
         await state.clear()
         return
 
     await state.update_data(prompt=prompt, price=price)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_flux")]
+        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_flux")],
+        [variants_button("confirm_variants_flux", price)]
     ])
-    await message.answer(f"💰 Стоимость генерации: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽. 💼 Для пополнения перейдите в раздел «Баланс». \n\nПодтвердите генерацию:", reply_markup=kb)
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
+    await message.answer(f"{free_note}💰 Стоимость генерации: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽. 💼 Для пополнения перейдите в раздел «Баланс». \n\nПодтвердите генерацию:", reply_markup=kb)
     await state.set_state(FluxKontextState.CONFIRM_GENERATION_FLUX)
 
+def flux_input(data: dict) -> dict:
+    return {
+        "prompt": data["prompt"],
+        "input_image": data["image_url"],
+        "aspect_ratio": data.get("aspect_ratio", "match_input_image"),
+        "output_format": "jpg",
+        "safety_tolerance": data.get("safety_tolerance", 3),
+    }
+
 async def confirm_generation_flux(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     data = await state.get_data()
 
     user_id = callback.from_user.id
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "flux")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "flux", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства.")
         await state.clear()
         return
@@ -168,14 +174,7 @@ async def confirm_generation_flux(callback: CallbackQuery, state: FSMContext):
         seed = random.randint(0, 2**31 - 1)
         prediction = client.predictions.create(
             version="black-forest-labs/flux-kontext-pro",
-            input={
-                "prompt": data["prompt"],
-                "input_image": data["image_url"],
-                "aspect_ratio": data.get("aspect_ratio", "match_input_image"),
-                "output_format": "jpg",
-                "safety_tolerance": data.get("safety_tolerance", 3),
-                "seed": seed
-            }
+            input={**flux_input(data), "seed": seed}
         )
 
         logger.info(f"[confirm_generation_flux] Prediction created: {prediction.id}")
@@ -186,22 +185,31 @@ async def confirm_generation_flux(callback: CallbackQuery, state: FSMContext):
         if prediction.status == "succeeded" and prediction.output:
             output_url = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
             if output_url:
-                await callback.message.answer_photo(
-                    output_url,
+                await deliver(
+                    callback.message, "photo", output_url, model="flux",
                     caption=f"✅ Готово!\n\n🌍 *Prompt:* {data['prompt']}",
                     parse_mode="Markdown",
                 )
             else:
                 raise ValueError("Ошибка: URL изображения не найден")
         else:
-            await callback.message.answer("❌ Не удалось сгенерировать изображение.")
-            logger.error(f"Ошибка генерации. Статус: {prediction.status}")
+            raise RuntimeError(f"Ошибка генерации. Статус: {prediction.status}")
 
     except Exception as e:
         logger.exception("❌ Ошибка во время генерации:")
-        await callback.message.answer("⚠️ Ошибка генерации. Попробуйте позже.")
+        note = await refund_generation(user_id, "flux", quota_kind, data["price"])
+        await callback.message.answer(f"⚠️ Ошибка генерации. Попробуйте позже.\n{note}")
+
+    await state.clear()
 
+async def confirm_variants_flux(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
     await state.clear()
+    await run_variants(
+        callback.message, callback.from_user.id, "black-forest-labs/flux-kontext-pro", "flux",
+        flux_input(data), data["price"], f"✅ Готово!\n\n🌍 Prompt: {data['prompt']}",
+    )
 
 async def go_main_menu(message: Message, state: FSMContext):
     await state.clear()
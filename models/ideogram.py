@@ -2,7 +2,6 @@ import os
 import logging
 import asyncio
 import replicate
-import uuid
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
 from aiogram.types import (
@@ -12,9 +11,11 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
-from sqlalchemy import select
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from models.pipeline import pipeline_rows, run_image_to_video
+from models.variants import variants_button, run_variants
 from keyboards import main_menu_kb, MAIN_MENU_BUTTON_TEXT
 
 # --- Загрузка переменных окружения ---
@@ -37,34 +38,6 @@ class IdeogramImageGenState(StatesGroup):
 def calculate_ideogram_price() -> float:
     return 9.0
 
-# --- Работа с балансом ---
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user is None:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
 
 # --- Клавиатура ---
 def aspect_ratio_kb():
@@ -134,25 +107,43 @@ async def handle_prompt_aspect_ideogram(message: Message, state: FSMContext):
 
     price = calculate_ideogram_price()
     balance = await get_user_balance(message.from_user.id)
+    is_free = has_free_generation(message.from_user.id, "ideogram")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(f"❌ Недостаточно средств. Стоимость: {price:.2f} ₽ | Баланс: {balance:.2f} ₽. 💼 Для пополнения перейдите в раздел «Баланс».")
         await state.clear()
         return
 
     await state.update_data(prompt=prompt, price=price)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_ideogram")]
+        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_ideogram")],
+        [variants_button("confirm_variants_ideogram", price)],
+        *pipeline_rows("confirm_video_ideogram", price, balance),
     ])
-    await message.answer(f"💰 Стоимость: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽\n Подтвердите генерацию:", reply_markup=kb)
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
+    await message.answer(f"{free_note}💰 Стоимость: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽\n Подтвердите генерацию:", reply_markup=kb)
     await state.set_state(IdeogramImageGenState.CONFIRM_GENERATION_IDEOGRAM)
 
+def ideogram_input(data: dict) -> dict:
+    return {
+        "prompt": data["prompt"],
+        "aspect_ratio": data.get("aspect_ratio", "1:1"),
+        "style": data.get("style", "auto")
+    }
+
 async def confirm_generation_ideogram(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     data = await state.get_data()
     user_id = callback.from_user.id
 
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "ideogram")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "ideogram", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства.")
         await state.clear()
         return
@@ -163,11 +154,7 @@ async def confirm_generation_ideogram(callback: CallbackQuery, state: FSMContext
         replicate.api_token = REPLICATE_API_TOKEN
         prediction = await replicate.predictions.async_create(
             model="ideogram-ai/ideogram-v2-turbo",
-            input={
-                "prompt": data["prompt"],
-                "aspect_ratio": data.get("aspect_ratio", "1:1"),
-                "style": data.get("style", "auto")
-            }
+            input=ideogram_input(data)
         )
 
         while prediction.status not in ("succeeded", "failed", "canceled"):
@@ -178,13 +165,33 @@ async def confirm_generation_ideogram(callback: CallbackQuery, state: FSMContext
             raise RuntimeError("Генерация не удалась")
 
         image_url = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
-        await callback.message.answer_photo(image_url, caption=f"✅ Prompt: {data['prompt']}")
+        await deliver(callback.message, "photo", image_url, model="ideogram", caption=f"✅ Prompt: {data['prompt']}")
 
     except Exception as e:
         logger.exception("Ошибка генерации изображения")
-        await callback.message.answer("❌ Произошла ошибка при генерации.")
+        note = await refund_generation(user_id, "ideogram", quota_kind, data["price"])
+        await callback.message.answer(f"❌ Произошла ошибка при генерации.\n{note}")
+
+    await state.clear()
+
+async def confirm_video_ideogram(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    await state.clear()
+    await run_image_to_video(
+        callback.message, callback.from_user.id, "ideogram-ai/ideogram-v2-turbo", "ideogram",
+        ideogram_input(data), data["price"], data["prompt"],
+        video_key=callback.data.removeprefix("confirm_video_ideogram_"),
+    )
 
+async def confirm_variants_ideogram(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
     await state.clear()
+    await run_variants(
+        callback.message, callback.from_user.id, "ideogram-ai/ideogram-v2-turbo", "ideogram",
+        ideogram_input(data), data["price"], f"✅ Prompt: {data['prompt']}",
+    )
 
 # --- main ---
 async def main():
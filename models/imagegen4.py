@@ -1,7 +1,6 @@
 import os
 import logging
 import asyncio
-import uuid
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
@@ -13,9 +12,11 @@ from aiogram.fsm.storage.memory import MemoryStorage
 import replicate
 from dotenv import load_dotenv
 
-from sqlalchemy import select
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from models.pipeline import pipeline_rows, run_image_to_video
+from models.variants import variants_button, run_variants
 
 from keyboards import main_menu_kb, MAIN_MENU_BUTTON_TEXT
 
@@ -37,34 +38,6 @@ class ImageGenState(StatesGroup):
 def calculate_imagegen4_price() -> float:
     return 9.0
 
-# --- Balance logic ---
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if not user:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
 
 # --- Keyboards ---
 def aspect_ratio_kb():
@@ -110,27 +83,48 @@ async def handle_prompt_imagegen4(message: Message, state: FSMContext):
 
     price = calculate_imagegen4_price()
     balance = await get_user_balance(user_id)
+    is_free = has_free_generation(user_id, "imagegen4")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(f"❌ Недостаточно средств.\n💰 Стоимость: {price:.2f} ₽\nБаланс: {balance:.2f} ₽. 💼 Для пополнения перейдите в раздел «Баланс».")
         await state.clear()
         return
 
     await state.update_data(prompt=text, price=price)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_imagegen4")]
+        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_generation_imagegen4")],
+        [variants_button("confirm_variants_imagegen4", price)],
+        *pipeline_rows("confirm_video_imagegen4", price, balance),
     ])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"💰 Стоимость: {price:.2f} ₽\nБаланс: {balance:.2f} ₽\nПодтвердите генерацию:",
+        f"{free_note}💰 Стоимость: {price:.2f} ₽\nБаланс: {balance:.2f} ₽\nПодтвердите генерацию:",
         reply_markup=kb
     )
     await state.set_state(ImageGenState.CONFIRM_GENERATION)
 
+def imagegen4_input(data: dict) -> dict:
+    return {
+        "prompt": data["prompt"],
+        "aspect_ratio": data.get("aspect_ratio", "9:16"),
+        "output_format": "png",
+        "safety_filter_level": "block_medium_and_above",
+        "guidance_scale": 7.5,
+        "num_inference_steps": 50
+    }
+
 async def confirm_generation_imagegen4(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     user_id = callback.from_user.id
 
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "imagegen4")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "imagegen4", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства.")
         await state.clear()
         return
@@ -141,14 +135,7 @@ async def confirm_generation_imagegen4(callback: CallbackQuery, state: FSMContex
         replicate.api_token = REPLICATE_API_TOKEN
         prediction = await replicate.predictions.async_create(
             model="google/imagen-4",
-            input={
-                "prompt": data["prompt"],
-                "aspect_ratio": data.get("aspect_ratio", "9:16"),
-                "output_format": "png",
-                "safety_filter_level": "block_medium_and_above",
-                "guidance_scale": 7.5,
-                "num_inference_steps": 50
-            }
+            input=imagegen4_input(data)
         )
 
         while prediction.status not in ("succeeded", "failed", "canceled"):
@@ -159,13 +146,34 @@ async def confirm_generation_imagegen4(callback: CallbackQuery, state: FSMContex
             raise RuntimeError("Генерация не удалась.")
 
         image_url = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
-        await callback.message.answer_photo(image_url, caption=f"✅ Prompt: {data['prompt']}")
+        await deliver(callback.message, "photo", image_url, model="imagegen4", caption=f"✅ Prompt: {data['prompt']}")
 
     except Exception as e:
         logger.exception("Ошибка генерации изображения")
-        await callback.message.answer("❌ Произошла ошибка при генерации.")
+        note = await refund_generation(user_id, "imagegen4", quota_kind, data["price"])
+        await callback.message.answer(f"❌ Произошла ошибка при генерации.\n{note}")
+
+    await state.clear()
+
+async def confirm_video_imagegen4(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    await state.clear()
+    await run_image_to_video(
+        callback.message, callback.from_user.id, "google/imagen-4", "imagegen4",
+        imagegen4_input(data), data["price"], data["prompt"],
+        video_key=callback.data.removeprefix("confirm_video_imagegen4_"),
+    )
 
+async def confirm_variants_imagegen4(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
     await state.clear()
+    # У Imagen 4 нет seed: варианты и так различаются от запуска к запуску
+    await run_variants(
+        callback.message, callback.from_user.id, "google/imagen-4", "imagegen4",
+        imagegen4_input(data), data["price"], f"✅ Prompt: {data['prompt']}", seed_key=None,
+    )
 
 # --- Main ---
 async def main():
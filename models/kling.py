@@ -2,7 +2,6 @@ import os
 import asyncio
 import logging
 import replicate
-import uuid
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -13,10 +12,11 @@ from dotenv import load_dotenv
 from aiogram.types import Message
 
 
-from sqlalchemy import select
-from sqlalchemy.exc import NoResultFound
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver_video
+from models.draft import draft_rows, start_draft
+from media.ingest import ingest_photo
 from keyboards import main_menu_kb
 
 
@@ -63,34 +63,6 @@ async def repeat_generation_kling(message: Message, state: FSMContext):
     await state.clear()
     await cmd_start_kling(message, state)
 
-async def get_user_balance(user_id: int) -> int:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            return int(user.balance)
-        except NoResultFound:
-            return 0
-
-async def deduct_user_balance(user_id: int, amount: int) -> bool:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            if user.balance >= amount:
-                user.balance -= amount
-                session.add(user)
-                session.add(PaymentRecord(
-                    user_id=user.id,
-                    amount=amount,
-                    payment_id=str(uuid.uuid4()),
-                    status="succeeded"
-                ))
-                await session.commit()
-                return True
-            return False
-        except NoResultFound:
-            return False
 
 # /start
 async def cmd_start_kling(message: Message, state: FSMContext):
@@ -113,9 +85,14 @@ async def handle_image_kling(message: Message, state: FSMContext):
         await send_kling_footer(message)
         return
 
-    photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)
-    image_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model="kling", user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
     await state.update_data(image_url=image_url)
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -164,10 +141,11 @@ async def handle_prompt_kling(message: Message, state: FSMContext):
     data = await state.get_data()
     price = calculate_kling_price(data["mode"], data["duration"])
     balance = await get_user_balance(message.from_user.id)
+    is_free = has_free_generation(message.from_user.id, "kling")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(
-            f"❌ Недостаточно средств: нужно {price} центов, у вас {balance} 💼 Для пополнения перейдите в раздел «Баланс».",
+            f"❌ Недостаточно средств: нужно {price} центов, у вас {balance:.0f} 💼 Для пополнения перейдите в раздел «Баланс».",
             reply_markup=kling_menu_kb()
         )
         await state.clear()
@@ -175,15 +153,26 @@ async def handle_prompt_kling(message: Message, state: FSMContext):
 
     await state.update_data(price=price)
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_gen")]
+        [InlineKeyboardButton(text="✅ Подтвердить генерацию", callback_data="confirm_gen")],
+        *draft_rows("confirm_draft_kling", price)
     ])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"💰 Стоимость генерации: {price} центов\n💼 Ваш баланс: {balance} центов\n Нажми, чтобы подтвердить.",
+        f"{free_note}💰 Стоимость генерации: {price} центов\n💼 Ваш баланс: {balance:.0f} центов\n Нажми, чтобы подтвердить.",
         reply_markup=keyboard
     )
     
     await state.set_state(KlingVideoState.confirm_pending)
 
+def kling_input(data: dict) -> dict:
+    return {
+        "mode": data["mode"],
+        "prompt": data.get("prompt", ""),
+        "duration": data["duration"],
+        "start_image": data["image_url"],
+        "negative_prompt": ""
+    }
+
 # Генерация
 async def handle_confirm_generation_kling(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
@@ -191,7 +180,14 @@ async def handle_confirm_generation_kling(callback: CallbackQuery, state: FSMCon
     prompt = data.get("prompt", "")
     user_id = callback.from_user.id
 
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "kling")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "kling", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства. Попробуй снова.")
         await state.clear()
         return
@@ -201,13 +197,7 @@ async def handle_confirm_generation_kling(callback: CallbackQuery, state: FSMCon
     try:
         prediction = await replicate.predictions.async_create(
             model="kwaivgi/kling-v2.1",
-            input={
-                "mode": data["mode"],
-                "prompt": prompt,
-                "duration": data["duration"],
-                "start_image": data["image_url"],
-                "negative_prompt": ""
-            }
+            input=kling_input(data)
         )
         logger.info(f"Создан prediction: {prediction.id}")
 
@@ -225,20 +215,27 @@ async def handle_confirm_generation_kling(callback: CallbackQuery, state: FSMCon
             elif isinstance(output, list):
                 video_url = next((url for url in output if isinstance(url, str) and url.endswith(".mp4")), None)
 
-            if video_url:
-                await callback.message.answer_video(video_url, caption="✅ Готово! Вот твое видео.")
-            else:
-                await callback.message.answer("⚠️ Видео получено, но формат неожидан или пустой.")
+            if not video_url:
+                raise ValueError(f"Видео получено, но формат неожидан или пустой: {output!r}")
+            await deliver_video(callback.message, video_url, model="kling", caption="✅ Готово! Вот твое видео.")
         else:
-            logger.error(f"Ошибка генерации: {prediction.error}")
-            await callback.message.answer("❌ Ошибка генерации видео.")
+            raise RuntimeError(f"Ошибка генерации: {prediction.error}")
 
     except Exception as e:
         logger.exception("Ошибка при генерации:")
-        await callback.message.answer("⚠️ Произошла ошибка при генерации видео.")
+        note = await refund_generation(user_id, "kling", quota_kind, data["price"])
+        await callback.message.answer(f"⚠️ Произошла ошибка при генерации видео.\n{note}")
     finally:
         await state.clear()
 
+# Черновик на Seedance, затем финал в Kling
+async def confirm_draft_kling(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await start_draft(
+        callback, state, f"Kling {data['mode']}, {data['duration']} сек", "kwaivgi/kling-v2.1", "kling",
+        data["price"], kling_input(data), image_url=data["image_url"],
+    )
+
 # Запуск
 async def main():
     bot = Bot(token=BOT_TOKEN)
@@ -1,7 +1,6 @@
 import os
 import asyncio
 import logging
-import uuid
 import replicate
 
 from aiogram import Bot, Dispatcher
@@ -11,11 +10,12 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from sqlalchemy import select
 from dotenv import load_dotenv
 
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from media.ingest import ingest_photo
 
 # Загрузка .env
 load_dotenv()
@@ -39,35 +39,6 @@ class VideoGenState(StatesGroup):
 def calculate_minimax_price() -> float:
     return 150.0  # рубли
 
-# Получение баланса
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if not user:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-# Списание средств
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
 
 # /start
 async def minimax_start(message: Message, state: FSMContext):
@@ -88,9 +59,14 @@ async def minimax_handle_image(message: Message, state: FSMContext):
         await message.answer("❌ Пожалуйста, отправьте изображение.")
         return
 
-    photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)
-    image_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model="minimax", user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
 
     await state.update_data(image_url=image_url)
     await message.answer("✏️ Теперь отправьте описание (на английском).")
@@ -106,8 +82,9 @@ async def minimax_handle_prompt(message: Message, state: FSMContext):
     user_id = message.from_user.id
     price = calculate_minimax_price()
     balance = await get_user_balance(user_id)
+    is_free = has_free_generation(user_id, "minimax")
 
-    if balance < price:
+    if balance < price and not is_free:
         await message.answer(
             f"❌ Недостаточно средств.\n💰 Стоимость: {price:.2f} ₽\nВаш баланс: {balance:.2f} ₽"
         )
@@ -119,8 +96,9 @@ async def minimax_handle_prompt(message: Message, state: FSMContext):
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"✅ Подтвердить генерацию за {price:.2f} ₽", callback_data="confirm_generation")]
     ])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"📋 Подтвердите генерацию видео.\n💰 Стоимость: {price:.2f} ₽\n💼 Ваш баланс: {balance:.2f} ₽",
+        f"{free_note}📋 Подтвердите генерацию видео.\n💰 Стоимость: {price:.2f} ₽\n💼 Ваш баланс: {balance:.2f} ₽",
         reply_markup=kb
     )
     await state.set_state(VideoGenState.confirming_payment)
@@ -139,7 +117,14 @@ async def minimax_confirm_generation(callback: CallbackQuery, state: FSMContext)
         await state.clear()
         return
 
-    if not await deduct_user_balance(user_id, price):
+    quota_kind = acquire_generation(user_id, "minimax")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.answer(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, price):
+        release_generation(user_id, "minimax", quota_kind)
         await callback.message.answer("❌ Не удалось списать средства. Проверьте баланс.")
         await state.clear()
         return
@@ -163,16 +148,15 @@ async def minimax_confirm_generation(callback: CallbackQuery, state: FSMContext)
 
         if prediction.status == "succeeded":
             video_url = prediction.output
-            if isinstance(video_url, str):
-                await callback.message.answer_video(video_url, caption="✅ Готово! Вот ваше видео.")
-            else:
-                await callback.message.answer("⚠️ Видео получено, но формат неизвестен.")
+            if not isinstance(video_url, str):
+                raise ValueError(f"[Minimax] Неизвестный формат ответа: {video_url!r}")
+            await deliver(callback.message, "video", video_url, model="minimax", caption="✅ Готово! Вот ваше видео.")
         else:
-            logger.error(f"[Minimax] Ошибка генерации: {prediction.error}")
-            await callback.message.answer("❌ Генерация не удалась.")
+            raise RuntimeError(f"[Minimax] Ошибка генерации: {prediction.error}")
     except Exception as e:
         logger.exception("Ошибка при генерации:")
-        await callback.message.answer("⚠️ Ошибка генерации. Попробуйте позже.")
+        note = await refund_generation(user_id, "minimax", quota_kind, price)
+        await callback.message.answer(f"⚠️ Ошибка генерации. Попробуйте позже.\n{note}")
 
     await state.clear()
 
@@ -1,8 +1,8 @@
+import io
 import os
 import asyncio
 import logging
-import uuid
-import aiohttp
+import math
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, F
@@ -11,24 +11,37 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.types import FSInputFile, Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, InputMediaAudio
 
-from sqlalchemy import select
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from bot.file_cache import answer_media
+from bot.predictions import run_prediction
+from media.audio import url_to_pcm, url_to_mastered, pcm_to_wav, pcm_to_mp3, append_continuation, waveform_thumbnail, TranscodeError
+from media.loudness import master_audio
+from media.pool import run_media_job
 
 # === Конфигурация ===
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 REPLICATE_MODEL_VERSION = "671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb"
-REPLICATE_API_URL = "https://api.replicate.com/v1/predictions"
 
-MUSICGEN_PRICE_RUB = 10.0
+MUSICGEN_PRICE_RUB = 10.0  # за один сегмент (одну генерацию MusicGen)
 
-HEADERS = {
-    "Authorization": f"Token {REPLICATE_API_TOKEN}",
-    "Content-Type": "application/json"
+# Длинные треки собираются из сегментов: каждый следующий продолжает хвост предыдущего
+SHORT_DURATION = 8
+SEGMENT_SECONDS = 30      # максимум, который MusicGen генерирует за раз
+OVERLAP_SECONDS = 5       # хвост предыдущего сегмента, который модель продолжает
+CROSSFADE_SECONDS = 1.5
+MUSIC_SAMPLE_RATE = 32000  # родная частота MusicGen
+
+DURATIONS = {
+    "dur_8": SHORT_DURATION,
+    "dur_60": 60,
+    "dur_120": 120,
+    "dur_180": 180,
 }
 
 MODEL_VERSIONS = {
@@ -49,37 +62,25 @@ NORMALIZATION_STRATEGIES = {
 class MusicGenStates(StatesGroup):
     choosing_model = State()
     choosing_normalization = State()
+    choosing_duration = State()
     waiting_for_prompt = State()
     confirming_payment = State()
 
-# === База: баланс ===
-async def get_user_balance(user_id: int) -> float:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if not user:
-            user = User(telegram_id=user_id, balance=0)
-            session.add(user)
-            await session.commit()
-            return 0.0
-        return float(user.balance)
-
-async def deduct_user_balance(user_id: int, amount: float) -> bool:
-    async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
-        if user and user.balance >= amount:
-            user.balance -= amount
-            session.add(user)
-            session.add(PaymentRecord(
-                user_id=user.id,
-                amount=amount,
-                payment_id=str(uuid.uuid4()),
-                status="succeeded"
-            ))
-            await session.commit()
-            return True
-        return False
+def plan_segments(duration: int) -> list[int]:
+    """Длительности сегментов (в секундах), из которых собирается трек нужной длины."""
+    first = min(duration, SEGMENT_SECONDS)
+    segments = [first]
+    left = duration - first
+    step = SEGMENT_SECONDS - OVERLAP_SECONDS
+    for _ in range(math.ceil(left / step)):
+        new = min(step, left)
+        segments.append(new + OVERLAP_SECONDS)
+        left -= new
+    return segments
+
+def musicgen_price(duration: int) -> float:
+    return MUSICGEN_PRICE_RUB * len(plan_segments(duration))
+
 
 # === Хендлеры ===
 async def start_handler_musicgen(message: Message, state: FSMContext):
@@ -91,7 +92,7 @@ async def start_handler_musicgen(message: Message, state: FSMContext):
     )
     await message.answer(
         "MusicGen — бот для генерации музыки по твоим описаниям.\n\n"
-        f"⚠️ Prompt на английском языке\n💰 Стоимость: 9₽\n"
+        f"⚠️ Prompt на английском языке\n💰 Стоимость: от {MUSICGEN_PRICE_RUB:.0f}₽\n"
         "🔤 Нажмите /main чтобы выйти\n\n"
         "📌 Выберете стиль генерации\n",
         reply_markup=model_keyboard
@@ -123,6 +124,23 @@ async def normalization_chosen_musicgen(query: CallbackQuery, state: FSMContext)
 
     await state.update_data(normalization_strategy=selected_norm)
     await query.answer(f"✅ Нормализация: {NORMALIZATION_STRATEGIES[selected_norm]}")
+
+    duration_keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=f"{seconds} сек — {musicgen_price(seconds):.0f} ₽", callback_data=key)]
+            for key, seconds in DURATIONS.items()
+        ]
+    )
+    await query.message.answer("⏱ Выбери длительность трека:", reply_markup=duration_keyboard)
+    await state.set_state(MusicGenStates.choosing_duration)
+
+async def duration_chosen_musicgen(query: CallbackQuery, state: FSMContext):
+    if query.data not in DURATIONS:
+        await query.answer("Некорректная длительность.", show_alert=True)
+        return
+
+    await state.update_data(duration=DURATIONS[query.data])
+    await query.answer(f"✅ Длительность: {DURATIONS[query.data]} сек")
     await query.message.answer("✍️ Отправь музыкальный промпт (на англ.)")
     await state.set_state(MusicGenStates.waiting_for_prompt)
 
@@ -133,25 +151,94 @@ async def receive_prompt_musicgen(message: Message, state: FSMContext):
         return
 
     user_id = message.from_user.id
+    duration = (await state.get_data()).get("duration", SHORT_DURATION)
+    price = musicgen_price(duration)
     balance = await get_user_balance(user_id)
+    # Бесплатные генерации покрывают только трек из одного сегмента
+    is_free = duration <= SEGMENT_SECONDS and has_free_generation(user_id, "musicgen")
 
-    if balance < MUSICGEN_PRICE_RUB:
+    if balance < price and not is_free:
         await message.answer(
-            f"❌ Недостаточно средств.\n💰 Стоимость: {MUSICGEN_PRICE_RUB:.2f} ₽\n💼 Баланс: {balance:.2f} ₽"
+            f"❌ Недостаточно средств.\n💰 Стоимость: {price:.2f} ₽\n💼 Баланс: {balance:.2f} ₽"
         )
         await state.clear()
         return
 
     await state.update_data(prompt=prompt)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"✅ Подтвердить генерацию за {MUSICGEN_PRICE_RUB:.2f} ₽", callback_data="confirm_generation_musicgen")]
+        [InlineKeyboardButton(text=f"✅ Подтвердить генерацию за {price:.2f} ₽", callback_data="confirm_generation_musicgen")]
     ])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"📋 Подтвердите генерацию музыки.\n💰 Стоимость: {MUSICGEN_PRICE_RUB:.2f} ₽\n💼 Ваш баланс: {balance:.2f} ₽",
+        f"{free_note}📋 Подтвердите генерацию музыки ({duration} сек).\n💰 Стоимость: {price:.2f} ₽\n💼 Ваш баланс: {balance:.2f} ₽",
         reply_markup=kb
     )
     await state.set_state(MusicGenStates.confirming_payment)
 
+def musicgen_input(prompt: str, model_version: str = "stereo-large", normalization_strategy: str = "peak") -> dict:
+    """Input MusicGen без duration: её добавляет тот, кто запускает генерацию."""
+    return {
+        "prompt": prompt,
+        "output_format": "mp3",
+        "model_version": model_version,
+        "classifier_free_guidance": 3,
+        "temperature": 1,
+        "top_k": 250,
+        "top_p": 0,
+        "continuation": False,
+        "multi_band_diffusion": False,
+        "normalization_strategy": normalization_strategy
+    }
+
+async def generate_long_track(message: Message, base_input: dict, duration: int, rendered: list[int]):
+    """Собирает трек из цепочки продолжений MusicGen и показывает его по мере готовности.
+
+    В rendered добавляется длительность каждого готового сегмента — по ним считается возврат при сбое.
+    """
+    segments = plan_segments(duration)
+    overlap = OVERLAP_SECONDS * MUSIC_SAMPLE_RATE
+    fade = int(CROSSFADE_SECONDS * MUSIC_SAMPLE_RATE)
+    track = None
+    sent = None
+
+    for i, seconds in enumerate(segments):
+        model_input = {**base_input, "duration": seconds}
+        if track is not None:
+            model_input.update({
+                "continuation": True,
+                "input_audio": io.BytesIO(pcm_to_wav(track[-overlap:], MUSIC_SAMPLE_RATE)),
+                "continuation_start": 0,
+                "continuation_end": OVERLAP_SECONDS,
+            })
+        output = await run_prediction(version=REPLICATE_MODEL_VERSION, input=model_input)
+        segment = await url_to_pcm(str(output), rate=MUSIC_SAMPLE_RATE, channels=2)
+        if track is None:
+            track = segment
+        else:
+            track = await run_media_job(append_continuation, track, segment, overlap, fade)
+        rendered.append(seconds)
+
+        if i == len(segments) - 1:
+            break
+        # Пользователь слушает уже готовую часть, пока генерируется продолжение
+        caption = f"🎶 Готово {len(track) // MUSIC_SAMPLE_RATE} из {duration} сек, продолжаю..."
+        # Без обрезки тишины: черновик должен звучать так же громко, как итоговый трек
+        preview = await run_media_job(master_audio, track, MUSIC_SAMPLE_RATE, trim=False)
+        audio = await pcm_to_mp3(preview, MUSIC_SAMPLE_RATE, filename="track_preview.mp3")
+        thumbnail = await waveform_thumbnail(preview)
+        if sent is None:
+            sent = await message.answer_audio(audio, caption=caption, thumbnail=thumbnail)
+        else:
+            await sent.edit_media(InputMediaAudio(media=audio, caption=caption, thumbnail=thumbnail))
+
+    track = await run_media_job(master_audio, track[:duration * MUSIC_SAMPLE_RATE], MUSIC_SAMPLE_RATE)
+    audio = await pcm_to_mp3(track, MUSIC_SAMPLE_RATE, filename="track.mp3")
+    thumbnail = await waveform_thumbnail(track)
+    if sent is None:
+        await message.answer_audio(audio, caption="🎧 Вот твоя музыка!", thumbnail=thumbnail)
+    else:
+        await sent.edit_media(InputMediaAudio(media=audio, caption="🎧 Вот твоя музыка!", thumbnail=thumbnail))
+
 async def confirm_generation_musicgen(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     data = await state.get_data()
@@ -160,80 +247,70 @@ async def confirm_generation_musicgen(callback: CallbackQuery, state: FSMContext
     prompt = data.get("prompt")
     model_version = data.get("model_version", "stereo-large")
     normalization_strategy = data.get("normalization_strategy", "peak")
+    duration = data.get("duration", SHORT_DURATION)
+    price = musicgen_price(duration)
 
     if not prompt:
         await callback.message.answer("❌ Недостаточно данных. Начните заново.")
         await state.clear()
         return
 
-    if not await deduct_user_balance(user_id, MUSICGEN_PRICE_RUB):
+    quota_kind = acquire_generation(user_id, "musicgen", allow_free=duration <= SEGMENT_SECONDS)
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.answer(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, price):
+        release_generation(user_id, "musicgen", quota_kind)
         await callback.message.answer("❌ Недостаточно средств. Попробуйте снова.")
         await state.clear()
         return
 
     await callback.message.edit_text("🎶 Генерация музыки... Пожалуйста, подождите.")
 
-    async with aiohttp.ClientSession() as session:
-        prediction_payload = {
-            "version": REPLICATE_MODEL_VERSION,
-            "input": {
-                "prompt": prompt,
-                "duration": 8,
-                "output_format": "mp3",
-                "model_version": model_version,
-                "classifier_free_guidance": 3,
-                "temperature": 1,
-                "top_k": 250,
-                "top_p": 0,
-                "continuation": False,
-                "multi_band_diffusion": False,
-                "normalization_strategy": normalization_strategy
-            }
-        }
-
-        async with session.post(REPLICATE_API_URL, json=prediction_payload, headers=HEADERS) as response:
-            prediction = await response.json()
-            prediction_id = prediction.get("id")
-            if not prediction_id:
-                await callback.message.answer("❌ Ошибка генерации.")
-                logging.error(f"Ошибка запуска: {prediction}")
-                return
-
-        output_url = None
-        for _ in range(40):
-            async with session.get(f"{REPLICATE_API_URL}/{prediction_id}", headers=HEADERS) as poll_response:
-                result = await poll_response.json()
-                if result.get("status") == "succeeded":
-                    output_url = result.get("output")
-                    break
-                elif result.get("status") == "failed":
-                    await callback.message.answer("❌ Генерация не удалась.")
-                    return
-            await asyncio.sleep(1)
-
-        if not output_url:
-            await callback.message.answer("❌ Не удалось получить аудио.")
-            return
-
-        filename = "generated_track.mp3"
-        async with session.get(output_url) as music_response:
-            if music_response.status == 200:
-                with open(filename, "wb") as f:
-                    f.write(await music_response.read())
+    base_input = musicgen_input(prompt, model_version, normalization_strategy)
+    rendered = []
+
+    try:
+        if duration <= SEGMENT_SECONDS:
+            output = await run_prediction(version=REPLICATE_MODEL_VERSION, input={**base_input, "duration": duration})
+            try:
+                track = await url_to_mastered(str(output), rate=MUSIC_SAMPLE_RATE, channels=2)
+                audio = await pcm_to_mp3(track, MUSIC_SAMPLE_RATE, filename="track.mp3")
+                thumbnail = await waveform_thumbnail(track)
+            except TranscodeError:
+                logging.warning("Не удалось обработать трек MusicGen, отправляю как есть", exc_info=True)
+                # Ссылкой, если Telegram её примет, иначе потоковой загрузкой через буфер задачи
+                await deliver(callback.message, "audio", str(output), model="musicgen", caption="🎧 Вот твоя музыка!")
             else:
-                await callback.message.answer("❌ Ошибка загрузки аудио.")
-                return
-
-        await callback.message.answer_audio(FSInputFile(filename), caption="🎧 Вот твоя музыка!")
-        os.remove(filename)
-
-    await state.clear()
+                await answer_media(callback.message, "audio", audio, model="musicgen",
+                                   caption="🎧 Вот твоя музыка!", thumbnail=thumbnail)
+            rendered.append(duration)
+        else:
+            await generate_long_track(callback.message, base_input, duration, rendered)
+    except Exception:
+        logging.exception("Ошибка генерации музыки:")
+        # Цена — за сегмент, поэтому возвращаем сегменты, до которых генерация не дошла
+        left = len(plan_segments(duration)) - len(rendered)
+        if not rendered:
+            release_generation(user_id, "musicgen", quota_kind)
+        if quota_kind == QUOTA_PAID and left:
+            await refund(user_id, MUSICGEN_PRICE_RUB * left)
+            await callback.message.answer(
+                f"❌ Генерация не удалась. {MUSICGEN_PRICE_RUB * left:.0f} ₽ за несгенерированные части возвращены на баланс."
+            )
+        else:
+            await callback.message.answer("❌ Генерация не удалась.")
+    finally:
+        await state.clear()
 
 # === Регистрация хендлеров ===
 def register_musicgen_handlers(dp: Dispatcher):
     dp.message.register(start_handler_musicgen, Command("start"))
     dp.callback_query.register(model_chosen_musicgen, StateFilter(MusicGenStates.choosing_model))
     dp.callback_query.register(normalization_chosen_musicgen, StateFilter(MusicGenStates.choosing_normalization))
+    dp.callback_query.register(duration_chosen_musicgen, StateFilter(MusicGenStates.choosing_duration))
     dp.message.register(receive_prompt_musicgen, StateFilter(MusicGenStates.waiting_for_prompt))
     dp.callback_query.register(confirm_generation_musicgen, F.data == "confirm_generation_musicgen", StateFilter(MusicGenStates.confirming_payment))
 
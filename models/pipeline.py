@@ -0,0 +1,92 @@
+import asyncio
+import logging
+
+from aiogram.types import Message, InlineKeyboardButton
+
+from bot.billing import charge, refund
+from bot.delivery import deliver, deliver_video
+from bot.predictions import run_prediction
+from bot.quota import acquire_generation, release_generation, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from models.storyboard import STORYBOARD_MODELS, output_video_url
+from models.variants import output_image_url
+
+logger = logging.getLogger(__name__)
+
+# Картинка сразу превращается в видео: ссылка на результат Imagen/Ideogram уходит в input видеомодели
+# прямо с серверов Replicate — без скачивания, повторной загрузки и лишних шагов пользователя.
+# Видеомодель — любая из STORYBOARD_MODELS, длительность ролика фиксированная.
+PIPELINE_VIDEO_DURATION = 5
+
+
+def pipeline_video_price(video_key: str) -> float:
+    return STORYBOARD_MODELS[video_key]["price"](PIPELINE_VIDEO_DURATION)
+
+
+def pipeline_rows(callback_prefix: str, image_price: float, balance: float) -> list[list[InlineKeyboardButton]]:
+    """Кнопки «картинка + видео» по видеомоделям, на которые хватает баланса.
+
+    callback_data — callback_prefix + "_" + ключ модели в STORYBOARD_MODELS.
+    """
+    rows = []
+    for key, config in STORYBOARD_MODELS.items():
+        video_price = pipeline_video_price(key)
+        if balance < image_price + video_price:
+            continue
+        rows.append([InlineKeyboardButton(
+            text=f"🎬 Картинка + видео {config['title']}, {PIPELINE_VIDEO_DURATION} сек (+{video_price:.0f} ₽)",
+            callback_data=f"{callback_prefix}_{key}",
+        )])
+    return rows
+
+
+async def run_image_to_video(message: Message, user_id: int, image_model: str, image_quota: str,
+                             image_input: dict, image_price: float, prompt: str, video_key: str):
+    """Картинка и видео из неё одним заказом: одно списание за обе генерации.
+
+    Если не получилась картинка, возвращается вся сумма; если только видео — его стоимость.
+    Картинка отправляется пользователю, пока видео уже рендерится.
+    """
+    config = STORYBOARD_MODELS[video_key]
+    video_price = pipeline_video_price(video_key)
+    total = image_price + video_price
+
+    image_quota_kind = acquire_generation(user_id, image_quota, allow_free=False)
+    video_quota_kind = acquire_generation(user_id, config["quota"], allow_free=False)
+    if QUOTA_CAPPED in (image_quota_kind, video_quota_kind):
+        release_generation(user_id, image_quota, image_quota_kind)
+        release_generation(user_id, config["quota"], video_quota_kind)
+        await message.edit_text(QUOTA_CAPPED_MESSAGE)
+        return
+    if not await charge(user_id, total):
+        release_generation(user_id, image_quota, image_quota_kind)
+        release_generation(user_id, config["quota"], video_quota_kind)
+        await message.edit_text("❌ Не удалось списать средства.")
+        return
+
+    await message.edit_text("🖼 Генерация изображения, затем видео из него...")
+    try:
+        image_url = output_image_url(await run_prediction(model=image_model, input=image_input))
+    except Exception:
+        logger.exception("Ошибка генерации изображения для видео:")
+        await refund(user_id, total)
+        release_generation(user_id, image_quota, image_quota_kind)
+        release_generation(user_id, config["quota"], video_quota_kind)
+        await message.answer(f"❌ Изображение не получилось, {total:.0f} ₽ возвращены на баланс.")
+        return
+
+    photo = asyncio.create_task(deliver(message, "photo", image_url, model=image_quota, caption=f"✅ Prompt: {prompt}"))
+    try:
+        output = await run_prediction(
+            model=config["model"], input=config["input"](prompt, image_url, PIPELINE_VIDEO_DURATION)
+        )
+        await deliver_video(message, output_video_url(output), model=config["quota"], caption="✅ Видео из картинки готово!")
+    except Exception:
+        logger.exception("Ошибка генерации видео из картинки:")
+        await refund(user_id, video_price)
+        release_generation(user_id, config["quota"], video_quota_kind)
+        await message.answer(f"⚠️ Видео не получилось, {video_price:.0f} ₽ возвращены на баланс.")
+    finally:
+        # deliver() сам откатывается на ссылку, так что ошибка тут — только повод для лога
+        for result in await asyncio.gather(photo, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Изображение для видео не отправлено: {result}")
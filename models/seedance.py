@@ -1,7 +1,6 @@
 import os
 import asyncio
 import logging
-import uuid
 import replicate
 from dotenv import load_dotenv
 
@@ -13,10 +12,10 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from sqlalchemy import select
-from sqlalchemy.exc import NoResultFound
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver_video
+from media.ingest import ingest_photo
 
 # Load .env
 load_dotenv()
@@ -51,37 +50,6 @@ def calculate_price(resolution: str, duration: int) -> int:
     return prices.get((resolution, duration), 0)
 
 
-async def get_user_balance(user_id: int) -> int:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            return int(user.balance)
-        except NoResultFound:
-            return 0
-
-
-async def deduct_user_balance(user_id: int, amount: int) -> bool:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            if user.balance >= amount:
-                user.balance -= amount
-                session.add(user)
-                session.add(PaymentRecord(
-                    user_id=user.id,
-                    amount=amount,
-                    payment_id=str(uuid.uuid4()),
-                    status="succeeded"
-                ))
-                await session.commit()
-                return True
-            return False
-        except NoResultFound:
-            return False
-
-
 def get_inline_keyboard(buttons):
     kb = InlineKeyboardBuilder()
     for text, callback_data in buttons:
@@ -106,9 +74,15 @@ async def seedance_handle_image(message: Message, state: FSMContext):
     if not message.photo:
         await message.answer("❌ Отправь изображение.")
         return
-    file = await message.bot.get_file(message.photo[-1].file_id)
-    url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
-    await state.update_data(image_url=url)
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model="seedance", user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
+    await state.update_data(image_url=image_url)
     await message.answer("✏️ Введи описание сцены (на английском):")
     await state.set_state(SeedanceState.waiting_prompt)
 
@@ -175,19 +149,21 @@ async def seedance_handle_camera_fixed(callback: CallbackQuery, state: FSMContex
     data = await state.get_data()
     price = calculate_price(data.get("resolution", "480p"), data.get("duration", 5))
     balance = await get_user_balance(callback.from_user.id)
+    is_free = has_free_generation(callback.from_user.id, "seedance")
 
-    if balance < price:
+    if balance < price and not is_free:
         await callback.message.edit_text(
-            f"❌ Недостаточно средств: нужно {price} центов, у вас {balance}."
+            f"❌ Недостаточно средств: нужно {price} центов, у вас {balance:.0f}."
         )
         await state.clear()
         return
 
     await state.update_data(price=price, balance=balance, is_confirmed=False)
     kb = get_inline_keyboard([("✅ Продолжить", "confirm_generation")])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await callback.message.edit_text(
-        f"💰 Стоимость генерации: {price} центов\n"
-        f"💼 Баланс: {balance} центов\n\nПродолжить?",
+        f"{free_note}💰 Стоимость генерации: {price} центов\n"
+        f"💼 Баланс: {balance:.0f} центов\n\nПродолжить?",
         reply_markup=kb.as_markup()
     )
     await state.set_state(SeedanceState.confirm_pending)
@@ -204,7 +180,14 @@ async def seedance_handle_confirm_generation(callback: CallbackQuery, state: FSM
     user_id = callback.from_user.id
 
     await callback.message.edit_reply_markup(reply_markup=None)
-    if not await deduct_user_balance(user_id, data["price"]):
+    quota_kind = acquire_generation(user_id, "seedance")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    if quota_kind == QUOTA_PAID and not await charge(user_id, data["price"]):
+        release_generation(user_id, "seedance", quota_kind)
         await callback.message.edit_text("❌ Не удалось списать средства.")
         await state.clear()
         return
@@ -229,13 +212,13 @@ async def seedance_handle_confirm_generation(callback: CallbackQuery, state: FSM
             await asyncio.sleep(5)
             prediction = await replicate.predictions.async_get(prediction.id)
 
-        if prediction.status == "succeeded":
-            await callback.message.answer_video(prediction.output, caption="✅ Готово!")
-        else:
-            await callback.message.answer("❌ Ошибка генерации.")
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Ошибка генерации: {prediction.error}")
+        await deliver_video(callback.message, prediction.output, model="seedance", caption="✅ Готово!")
     except Exception as e:
         logger.exception("Ошибка генерации:")
-        await callback.message.answer("⚠️ Возникла ошибка во время генерации.")
+        note = await refund_generation(user_id, "seedance", quota_kind, data["price"])
+        await callback.message.answer(f"⚠️ Возникла ошибка во время генерации.\n{note}")
 
     await state.clear()
 
@@ -0,0 +1,205 @@
+import math
+import asyncio
+import logging
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+
+from bot.billing import get_user_balance, charge, refund
+from bot.quota import acquire_generation, release_generation, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import send_prepared_video
+from bot.predictions import run_prediction
+from media.audio import url_to_mastered, SAMPLE_RATE
+from media.ingest import ingest_photo
+from media.video import video_with_audio
+from models.chatterbox import synthesize_chunk, calculate_chatterbox_price
+from models.musicgen import musicgen_input, REPLICATE_MODEL_VERSION as MUSICGEN_VERSION, MUSICGEN_PRICE_RUB, MUSIC_SAMPLE_RATE
+from models.storyboard import STORYBOARD_MODELS, output_video_url, keyboard
+
+logger = logging.getLogger(__name__)
+
+MIN_PROMPT_LENGTH = 15
+# Примерно столько символов английской речи Chatterbox произносит за секунду
+VOICEOVER_CHARS_PER_SECOND = 15
+
+AUDIO_KINDS = {
+    "music": {"title": "🎵 Музыка (MusicGen)", "price": MUSICGEN_PRICE_RUB},
+    "voice": {"title": "🎤 Озвучка (Chatterbox)", "price": calculate_chatterbox_price()},
+}
+
+
+class SoundtrackState(StatesGroup):
+    choosing_model = State()
+    waiting_image = State()
+    choosing_duration = State()
+    waiting_video_prompt = State()
+    choosing_audio = State()
+    waiting_audio_prompt = State()
+    confirm_pending = State()
+
+
+async def soundtrack_start(message: Message, state: FSMContext):
+    await state.clear()
+    await message.answer(
+        "🎬🎵 Видео со звуком: ролик и музыка или озвучка генерируются одновременно "
+        "и сводятся в одно видео.\n\n"
+        "⚠️ Prompt на английском языке.\n"
+        "💰 Стоимость: видео + звук\n"
+        "🔤 Нажмите /main чтобы выйти",
+    )
+    await message.answer(
+        "Выбери модель видео:",
+        reply_markup=keyboard([(config["title"], f"st_model_{key}") for key, config in STORYBOARD_MODELS.items()]),
+    )
+    await state.set_state(SoundtrackState.choosing_model)
+
+
+async def soundtrack_model_chosen(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.update_data(model_key=callback.data.removeprefix("st_model_"))
+    await callback.message.edit_text("📌 Пришли изображение, с которого начнется видео.")
+    await state.set_state(SoundtrackState.waiting_image)
+
+
+async def soundtrack_handle_image(message: Message, state: FSMContext):
+    if not message.photo:
+        await message.answer("❌ Отправь изображение.")
+        return
+    data = await state.get_data()
+    config = STORYBOARD_MODELS[data["model_key"]]
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model=config["image_profile"], user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
+    await state.update_data(image_url=image_url)
+    await message.answer(
+        "🕒 Выбери длительность видео:",
+        reply_markup=keyboard([("5 сек", "st_dur_5"), ("10 сек", "st_dur_10")]),
+    )
+    await state.set_state(SoundtrackState.choosing_duration)
+
+
+async def soundtrack_duration_chosen(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.update_data(duration=int(callback.data.removeprefix("st_dur_")))
+    await callback.message.edit_text("✏️ Опиши сцену на английском:")
+    await state.set_state(SoundtrackState.waiting_video_prompt)
+
+
+async def soundtrack_handle_video_prompt(message: Message, state: FSMContext):
+    prompt = (message.text or "").strip()
+    if len(prompt) < MIN_PROMPT_LENGTH:
+        await message.answer(f"❌ Описание слишком короткое. Минимум {MIN_PROMPT_LENGTH} символов.")
+        return
+    await state.update_data(video_prompt=prompt)
+    await message.answer(
+        "Что наложить на видео?",
+        reply_markup=keyboard([(kind["title"], f"st_audio_{key}") for key, kind in AUDIO_KINDS.items()]),
+    )
+    await state.set_state(SoundtrackState.choosing_audio)
+
+
+async def soundtrack_audio_chosen(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    audio_kind = callback.data.removeprefix("st_audio_")
+    await state.update_data(audio_kind=audio_kind)
+    data = await state.get_data()
+    if audio_kind == "music":
+        text = "🎵 Опиши музыку на английском (жанр, настроение, инструменты):"
+    else:
+        text = (f"🎤 Пришли текст озвучки на английском — до {data['duration'] * VOICEOVER_CHARS_PER_SECOND} "
+                f"символов, чтобы уложиться в {data['duration']} сек:")
+    await callback.message.edit_text(text)
+    await state.set_state(SoundtrackState.waiting_audio_prompt)
+
+
+async def soundtrack_handle_audio_prompt(message: Message, state: FSMContext):
+    prompt = (message.text or "").strip()
+    data = await state.get_data()
+    max_chars = data["duration"] * VOICEOVER_CHARS_PER_SECOND
+    if not prompt:
+        await message.answer("❌ Пришли текст.")
+        return
+    if data["audio_kind"] == "voice" and len(prompt) > max_chars:
+        await message.answer(f"❌ Текст не уложится в ролик: {len(prompt)} символов из {max_chars}.")
+        return
+
+    config = STORYBOARD_MODELS[data["model_key"]]
+    price = config["price"](data["duration"]) + AUDIO_KINDS[data["audio_kind"]]["price"]
+    balance = await get_user_balance(message.from_user.id)
+    if balance < price:
+        await message.answer(f"❌ Недостаточно средств: нужно {price:.0f} ₽, у вас {balance:.0f} ₽.")
+        await state.clear()
+        return
+
+    await state.update_data(audio_prompt=prompt, price=price, is_confirmed=False)
+    await message.answer(
+        f"🎬 {config['title']}, {data['duration']} сек + {AUDIO_KINDS[data['audio_kind']]['title']}\n"
+        f"💰 Стоимость: {price:.0f} ₽\n💼 Баланс: {balance:.0f} ₽\n\nПродолжить?",
+        reply_markup=keyboard([("✅ Продолжить", "soundtrack_confirm")]),
+    )
+    await state.set_state(SoundtrackState.confirm_pending)
+
+
+async def render_audio(audio_kind: str, prompt: str, duration: int):
+    """Генерирует звук и сразу декодирует его с мастерингом: (float32 PCM, частота)."""
+    if audio_kind == "music":
+        output = await run_prediction(
+            version=MUSICGEN_VERSION, input={**musicgen_input(prompt), "duration": math.ceil(duration)}
+        )
+        return await url_to_mastered(str(output), rate=MUSIC_SAMPLE_RATE, channels=2), MUSIC_SAMPLE_RATE
+    url = await synthesize_chunk(prompt, seed=0, temperature=0.5)
+    return await url_to_mastered(url), SAMPLE_RATE
+
+
+async def soundtrack_confirm(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    if data.get("is_confirmed"):
+        return
+    await state.update_data(is_confirmed=True)
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    user_id = callback.from_user.id
+    config = STORYBOARD_MODELS[data["model_key"]]
+    quota_kind = acquire_generation(user_id, config["quota"], allow_free=False)
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+    if not await charge(user_id, data["price"]):
+        release_generation(user_id, config["quota"], quota_kind)
+        await callback.message.edit_text("❌ Не удалось списать средства.")
+        await state.clear()
+        return
+
+    status = await callback.message.edit_text("🎬 Генерирую видео и звук одновременно...")
+    # Звук декодируется, пока видео ещё рендерится, — ждём только более медленную из генераций
+    video_task = asyncio.create_task(run_prediction(
+        model=config["model"], input=config["input"](data["video_prompt"], data["image_url"], data["duration"])
+    ))
+    audio_task = asyncio.create_task(render_audio(data["audio_kind"], data["audio_prompt"], data["duration"]))
+    delivered = False
+    try:
+        output, (samples, rate) = await asyncio.gather(video_task, audio_task)
+        await status.edit_text("🎞 Свожу звук с видео...")
+        async with video_with_audio(output_video_url(output), samples, rate) as video:
+            await send_prepared_video(callback.message, video, caption="✅ Готово! Вот твоё видео со звуком.")
+            delivered = True
+    except Exception:
+        logger.exception("Ошибка видео со звуком:")
+        if delivered:
+            return
+        # Не получилось видео, звук или сведение — пользователь не получил ничего, возвращаем всё
+        await refund(user_id, data["price"])
+        release_generation(user_id, config["quota"], quota_kind)
+        await callback.message.answer(f"⚠️ Не удалось собрать видео со звуком. {data['price']:.0f} ₽ возвращены на баланс.")
+    finally:
+        video_task.cancel()
+        audio_task.cancel()
+        await state.clear()
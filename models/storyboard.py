@@ -0,0 +1,297 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from bot.billing import get_user_balance, charge, refund
+from bot.quota import acquire_generation, release_generation, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import send_prepared_video
+from bot.predictions import run_prediction
+from media.ingest import ingest_photo, ingest_image
+from media.video import concat_videos, last_frame
+from models.kling import calculate_kling_price
+from models.seedance import calculate_price as calculate_seedance_price
+
+logger = logging.getLogger(__name__)
+
+# Storyboard: несколько сцен-промптов, каждая — отдельный ролик модели, итог склеивается в одно видео
+MIN_SHOTS = 2
+MAX_SHOTS = 6
+MIN_PROMPT_LENGTH = 15
+CONTINUE_MARK = ">"  # сцена с этим префиксом начинается с последнего кадра предыдущей
+
+
+def _seedance_input(resolution: str):
+    def build(prompt: str, image_url: str, duration: int) -> dict:
+        return {
+            "fps": 24,
+            "prompt": prompt,
+            "duration": duration,
+            "resolution": resolution,
+            "aspect_ratio": "16:9",
+            "camera_fixed": False,
+            "image": image_url,
+        }
+    return build
+
+
+def _kling_input(prompt: str, image_url: str, duration: int) -> dict:
+    return {
+        "mode": "standard",
+        "prompt": prompt,
+        "duration": duration,
+        "start_image": image_url,
+        "negative_prompt": "",
+    }
+
+
+# Одинаковые настройки у всех сцен дают ролики с одинаковыми кодеком, размером и fps,
+# и склейка обходится без перекодирования
+STORYBOARD_MODELS = {
+    "seedance_480p": {
+        "title": "Seedance 480p",
+        "model": "bytedance/seedance-1-pro",
+        "quota": "seedance",
+        "image_profile": "seedance",
+        "price": lambda duration: calculate_seedance_price("480p", duration),
+        "input": _seedance_input("480p"),
+    },
+    "seedance_1080p": {
+        "title": "Seedance 1080p",
+        "model": "bytedance/seedance-1-pro",
+        "quota": "seedance",
+        "image_profile": "seedance",
+        "price": lambda duration: calculate_seedance_price("1080p", duration),
+        "input": _seedance_input("1080p"),
+    },
+    "kling": {
+        "title": "Kling Standard",
+        "model": "kwaivgi/kling-v2.1",
+        "quota": "kling",
+        "image_profile": "kling",
+        "price": lambda duration: calculate_kling_price("standard", duration),
+        "input": _kling_input,
+    },
+}
+
+
+class StoryboardState(StatesGroup):
+    choosing_model = State()
+    waiting_image = State()
+    choosing_duration = State()
+    waiting_shots = State()
+    confirm_pending = State()
+
+
+def parse_shots(text: str) -> list[tuple[str, bool]]:
+    """Сцены по строкам: (промпт, продолжает ли сцена предыдущую)."""
+    shots = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        continues = line.startswith(CONTINUE_MARK) and bool(shots)
+        shots.append((line.lstrip(CONTINUE_MARK).strip(), continues))
+    return shots
+
+
+def plan_chains(shots: list[tuple[str, bool]]) -> list[list[int]]:
+    """Группирует сцены в цепочки: внутри цепочки рендер последовательный, цепочки — параллельно."""
+    chains = []
+    for i, (_, continues) in enumerate(shots):
+        if continues:
+            chains[-1].append(i)
+        else:
+            chains.append([i])
+    return chains
+
+
+def output_video_url(output) -> str:
+    if isinstance(output, list):
+        output = next(item for item in output if str(item).endswith(".mp4"))
+    return str(output)
+
+
+def keyboard(buttons):
+    kb = InlineKeyboardBuilder()
+    for text, callback_data in buttons:
+        kb.button(text=text, callback_data=callback_data)
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+async def storyboard_start(message: Message, state: FSMContext):
+    await state.clear()
+    await message.answer(
+        "🎞 Видео из нескольких сцен.\n\n"
+        f"Каждая сцена — отдельный ролик, все ролики склеиваются в одно видео (от {MIN_SHOTS} до {MAX_SHOTS} сцен).\n"
+        "Независимые сцены рендерятся одновременно, поэтому длинное видео готово почти так же быстро, как одна сцена.\n\n"
+        "⚠️ Prompt на английском языке.\n"
+        "💰 Стоимость: сумма стоимостей сцен\n"
+        "🔤 Нажмите /main чтобы выйти",
+    )
+    await message.answer(
+        "Выбери модель:",
+        reply_markup=keyboard([(config["title"], f"sb_model_{key}") for key, config in STORYBOARD_MODELS.items()]),
+    )
+    await state.set_state(StoryboardState.choosing_model)
+
+
+async def storyboard_model_chosen(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.update_data(model_key=callback.data.removeprefix("sb_model_"))
+    await callback.message.edit_text("📌 Пришли изображение, с которого начнутся сцены.")
+    await state.set_state(StoryboardState.waiting_image)
+
+
+async def storyboard_handle_image(message: Message, state: FSMContext):
+    if not message.photo:
+        await message.answer("❌ Отправь изображение.")
+        return
+    data = await state.get_data()
+    config = STORYBOARD_MODELS[data["model_key"]]
+    try:
+        image_url = await ingest_photo(
+            message.bot, message.photo[-1], model=config["image_profile"], user_id=message.from_user.id
+        )
+    except Exception:
+        logger.exception("Ошибка загрузки изображения:")
+        await message.answer("❌ Не удалось загрузить изображение. Попробуйте ещё раз.")
+        return
+    await state.update_data(image_url=image_url)
+    await message.answer(
+        "🕒 Длительность каждой сцены:",
+        reply_markup=keyboard([("5 сек", "sb_dur_5"), ("10 сек", "sb_dur_10")]),
+    )
+    await state.set_state(StoryboardState.choosing_duration)
+
+
+async def storyboard_duration_chosen(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.update_data(duration=int(callback.data.removeprefix("sb_dur_")))
+    await callback.message.edit_text(
+        "✏️ Опиши сцены на английском, каждую с новой строки.\n\n"
+        "Сцены начинаются с присланного изображения и рендерятся одновременно. "
+        f"Чтобы сцена продолжала предыдущую с её последнего кадра, начни строку с «{CONTINUE_MARK}» — "
+        "такие сцены рендерятся по очереди.\n\n"
+        "Пример:\n"
+        "A knight walks through a misty forest\n"
+        f"{CONTINUE_MARK} The knight stops and draws his sword\n"
+        "Close-up of a dragon opening its eyes"
+    )
+    await state.set_state(StoryboardState.waiting_shots)
+
+
+async def storyboard_handle_shots(message: Message, state: FSMContext):
+    shots = parse_shots(message.text or "")
+    if not MIN_SHOTS <= len(shots) <= MAX_SHOTS:
+        await message.answer(f"❌ Нужно от {MIN_SHOTS} до {MAX_SHOTS} сцен, каждая с новой строки.")
+        return
+    if any(len(prompt) < MIN_PROMPT_LENGTH for prompt, _ in shots):
+        await message.answer(f"❌ Описание каждой сцены — минимум {MIN_PROMPT_LENGTH} символов.")
+        return
+
+    data = await state.get_data()
+    config = STORYBOARD_MODELS[data["model_key"]]
+    price = config["price"](data["duration"]) * len(shots)
+    balance = await get_user_balance(message.from_user.id)
+    if balance < price:
+        await message.answer(f"❌ Недостаточно средств: нужно {price} ₽, у вас {balance:.0f} ₽.")
+        await state.clear()
+        return
+
+    chains = plan_chains(shots)
+    await state.update_data(shots=shots, price=price, is_confirmed=False)
+    await message.answer(
+        f"🎞 {len(shots)} сцен по {data['duration']} сек ({config['title']}), "
+        f"одновременно рендерится {len(chains)}.\n"
+        f"💰 Стоимость: {price} ₽\n💼 Баланс: {balance:.0f} ₽\n\nПродолжить?",
+        reply_markup=keyboard([("✅ Продолжить", "storyboard_confirm")]),
+    )
+    await state.set_state(StoryboardState.confirm_pending)
+
+
+async def render_storyboard(config: dict, shots: list[tuple[str, bool]], image_url: str, duration: int,
+                            on_progress=None) -> list[str]:
+    """Рендерит сцены и возвращает ссылки на ролики в порядке сцен.
+
+    Цепочки независимы и идут параллельно; сцена-продолжение ждёт предыдущую и стартует
+    с её последнего кадра. Если падает одна цепочка, остальные отменяются вместе с их predictions.
+    """
+    urls: list[str | None] = [None] * len(shots)
+
+    async def render_chain(chain: list[int]):
+        start_image = image_url
+        for index in chain:
+            prompt, continues = shots[index]
+            if continues:
+                start_image = await ingest_image(await last_frame(urls[index - 1]), f"shot{index}.jpg")
+            output = await run_prediction(
+                model=config["model"], input=config["input"](prompt, start_image, duration)
+            )
+            urls[index] = output_video_url(output)
+            if on_progress:
+                await on_progress(sum(url is not None for url in urls))
+
+    tasks = [asyncio.create_task(render_chain(chain)) for chain in plan_chains(shots)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return urls
+
+
+async def storyboard_confirm(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    if data.get("is_confirmed"):
+        return
+    await state.update_data(is_confirmed=True)
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    user_id = callback.from_user.id
+    config = STORYBOARD_MODELS[data["model_key"]]
+    # Бесплатная генерация покрывает один ролик, а не сборку из нескольких
+    quota_kind = acquire_generation(user_id, config["quota"], allow_free=False)
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.edit_text(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+    if not await charge(user_id, data["price"]):
+        release_generation(user_id, config["quota"], quota_kind)
+        await callback.message.edit_text("❌ Не удалось списать средства.")
+        await state.clear()
+        return
+
+    shots = [tuple(shot) for shot in data["shots"]]
+    status = await callback.message.edit_text(f"🎬 Рендер сцен: 0 из {len(shots)}...")
+
+    async def on_progress(done: int):
+        try:
+            await status.edit_text(f"🎬 Рендер сцен: {done} из {len(shots)}...")
+        except TelegramBadRequest:
+            pass
+
+    delivered = False
+    try:
+        urls = await render_storyboard(config, shots, data["image_url"], data["duration"], on_progress)
+        await status.edit_text("🎞 Сцены готовы, склеиваю видео...")
+        async with concat_videos(urls) as video:
+            await send_prepared_video(callback.message, video, caption="✅ Готово! Вот твоё видео из сцен.")
+            delivered = True
+    except Exception:
+        logger.exception("Ошибка сборки видео из сцен:")
+        if delivered:
+            return
+        # Видео не дошло — отдельные сцены пользователь не получает, поэтому возвращаем всю сумму
+        await refund(user_id, data["price"])
+        release_generation(user_id, config["quota"], quota_kind)
+        await callback.message.answer(f"⚠️ Не удалось собрать видео из сцен. {data['price']} ₽ возвращены на баланс.")
+    finally:
+        await state.clear()
+
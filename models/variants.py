@@ -0,0 +1,109 @@
+import os
+import random
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardButton
+
+from bot.billing import charge, refund
+from bot.delivery import deliver_album
+from bot.predictions import run_prediction
+from bot.quota import acquire_generation, release_generation, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Несколько вариантов за один заказ: K predictions с разными seed идут одновременно,
+# поэтому ждать приходится примерно как одну генерацию. Альбом Telegram — от 2 до 10 штук.
+VARIANTS_COUNT = min(max(int(os.getenv("VARIANTS_COUNT", "4")), 2), 10)
+
+
+def output_image_url(output) -> str:
+    return str(output[0] if isinstance(output, list) else output)
+
+
+def variants_button(callback_data: str, price: float) -> InlineKeyboardButton:
+    return InlineKeyboardButton(
+        text=f"🖼 Сразу {VARIANTS_COUNT} шт. на выбор ({price * VARIANTS_COUNT:.0f} ₽)",
+        callback_data=callback_data,
+    )
+
+
+def variant_inputs(base: dict, count: int, seed_key: str | None = "seed") -> list[dict]:
+    """Входы для count вариантов. У моделей без seed варианты различаются и так — от запуска к запуску."""
+    if seed_key is None:
+        return [dict(base) for _ in range(count)]
+    return [{**base, seed_key: seed} for seed in random.sample(range(2**31 - 1), count)]
+
+
+async def generate_variants(model: str, inputs: list[dict], on_result=None) -> list[str | None]:
+    """Запускает predictions параллельно и собирает ссылки по мере готовности.
+
+    Возвращает ссылки в порядке inputs; None — вариант, который не получился.
+    on_result(ссылка или None, готово, всего) вызывается после каждого завершившегося prediction.
+    """
+    urls: list[str | None] = [None] * len(inputs)
+
+    async def run(index: int) -> str | None:
+        try:
+            urls[index] = output_image_url(await run_prediction(model=model, input=inputs[index]))
+        except Exception:
+            logger.exception(f"Вариант {index + 1} ({model}) не получился:")
+        return urls[index]
+
+    tasks = [asyncio.create_task(run(i)) for i in range(len(inputs))]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            url = await task
+            if on_result:
+                await on_result(url, done, len(tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+    return urls
+
+
+async def run_variants(message: Message, user_id: int, model: str, quota: str, base_input: dict,
+                       price: float, caption: str, seed_key: str | None = "seed"):
+    """Заказ из VARIANTS_COUNT вариантов: одно списание, один альбом, возврат за неудавшиеся."""
+    kinds = []
+    for _ in range(VARIANTS_COUNT):
+        kinds.append(acquire_generation(user_id, quota, allow_free=False))
+        if kinds[-1] == QUOTA_CAPPED:
+            for kind in kinds:
+                release_generation(user_id, quota, kind)
+            await message.edit_text(QUOTA_CAPPED_MESSAGE)
+            return
+
+    total = price * VARIANTS_COUNT
+    if not await charge(user_id, total):
+        for kind in kinds:
+            release_generation(user_id, quota, kind)
+        await message.edit_text("❌ Не удалось списать средства.")
+        return
+
+    status = await message.edit_text(f"⏳ Генерация вариантов: 0 из {VARIANTS_COUNT}...")
+    ready = 0
+
+    async def on_result(url: str | None, done: int, count: int):
+        nonlocal ready
+        ready += bool(url)
+        try:
+            await status.edit_text(f"⏳ Генерация вариантов: {done} из {count}, готово {ready}...")
+        except TelegramBadRequest:
+            pass
+
+    urls = await generate_variants(model, variant_inputs(base_input, VARIANTS_COUNT, seed_key), on_result)
+    ready_urls = [url for url in urls if url]
+    failed = VARIANTS_COUNT - len(ready_urls)
+    if failed:
+        await refund(user_id, price * failed)
+        for kind in kinds[:failed]:
+            release_generation(user_id, quota, kind)
+    if not ready_urls:
+        await message.answer(f"❌ Ни один вариант не получился, {total:.0f} ₽ возвращены на баланс.")
+        return
+
+    await deliver_album(message, "photo", ready_urls, model=quota, caption=caption)
+    if failed:
+        await message.answer(f"⚠️ Не получилось вариантов: {failed}, {price * failed:.0f} ₽ возвращены на баланс.")
@@ -1,7 +1,6 @@
 import os
 import asyncio
 import logging
-import uuid
 import replicate
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command, StateFilter
@@ -9,12 +8,12 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, C
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy import select
-from sqlalchemy.exc import NoResultFound
 from dotenv import load_dotenv
 
-from database.db import async_session
-from database.models import User, PaymentRecord
+from bot.billing import get_user_balance, charge, refund_generation
+from bot.quota import has_free_generation, acquire_generation, release_generation, QUOTA_PAID, QUOTA_CAPPED, QUOTA_CAPPED_MESSAGE
+from bot.delivery import deliver
+from models.draft import draft_rows, start_draft
 
 # Загрузка переменных окружения из .env
 load_dotenv()
@@ -39,37 +38,8 @@ class Veo3State(StatesGroup):
 
 # Стоимость генерации видео (в рублях)
 GENERATION_COST_RUB = 660
+VEO3_ASPECT_RATIO = "9:16"
 
-# Получение баланса пользователя
-async def get_user_balance(user_id: int) -> int:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            return int(user.balance)
-        except NoResultFound:
-            return 0
-
-# Списание баланса
-async def deduct_user_balance(user_id: int, amount: int) -> bool:
-    async with async_session() as session:
-        try:
-            result = await session.execute(select(User).where(User.telegram_id == user_id))
-            user = result.scalars().one()
-            if user.balance >= amount:
-                user.balance -= amount
-                session.add(user)
-                session.add(PaymentRecord(
-                    user_id=user.id,
-                    amount=amount,
-                    payment_id=str(uuid.uuid4()),
-                    status="succeeded"
-                ))
-                await session.commit()
-                return True
-            return False
-        except NoResultFound:
-            return False
 
 # Обработчик команды /start — сразу запрашиваем промпт
 async def cmd_start_veo3(message: Message, state: FSMContext):
@@ -94,11 +64,12 @@ async def handle_prompt_veo3(message: Message, state: FSMContext):
 
     user_id = message.from_user.id
     balance = await get_user_balance(user_id)
+    is_free = has_free_generation(user_id, "veo3")
 
-    if balance < GENERATION_COST_RUB:
+    if balance < GENERATION_COST_RUB and not is_free:
         await message.answer(
             f"❌ Недостаточно средств.\n💸 Стоимость генерации: {GENERATION_COST_RUB}₽. \n"
-            f"💼 Ваш баланс: {balance}₽. \n 💼 Для пополнения перейдите в раздел «Баланс»."
+            f"💼 Ваш баланс: {balance:.0f}₽. \n 💼 Для пополнения перейдите в раздел «Баланс»."
         )
         await state.clear()
         return
@@ -106,14 +77,25 @@ async def handle_prompt_veo3(message: Message, state: FSMContext):
     await state.update_data(prompt=prompt)
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"✅ Подтвердить списание {GENERATION_COST_RUB}₽", callback_data="confirm_generation_veo3")]
+        [InlineKeyboardButton(text=f"✅ Подтвердить списание {GENERATION_COST_RUB}₽", callback_data="confirm_generation_veo3")],
+        *draft_rows("confirm_draft_veo3", GENERATION_COST_RUB)
     ])
+    free_note = "🎁 Эта генерация бесплатная\n" if is_free else ""
     await message.answer(
-        f"Подтвердите генерацию видео.\n💸 Стоимость: {GENERATION_COST_RUB}₽\n💼 Ваш баланс: {balance}₽",
+        f"{free_note}Подтвердите генерацию видео.\n💸 Стоимость: {GENERATION_COST_RUB}₽\n💼 Ваш баланс: {balance:.0f}₽",
         reply_markup=keyboard
     )
     await state.set_state(Veo3State.confirming_payment)
 
+def veo3_input(prompt: str, seed: int = 42) -> dict:
+    return {
+        "prompt": prompt,
+        "enhance_prompt": True,
+        "aspect_ratio": VEO3_ASPECT_RATIO,
+        "duration": 5,
+        "seed": seed
+    }
+
 # Подтверждение и генерация видео
 async def confirm_generation_veo3(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
@@ -126,8 +108,15 @@ async def confirm_generation_veo3(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         return
 
-    success = await deduct_user_balance(user_id, GENERATION_COST_RUB)
+    quota_kind = acquire_generation(user_id, "veo3")
+    if quota_kind == QUOTA_CAPPED:
+        await callback.message.answer(QUOTA_CAPPED_MESSAGE)
+        await state.clear()
+        return
+
+    success = quota_kind != QUOTA_PAID or await charge(user_id, GENERATION_COST_RUB)
     if not success:
+        release_generation(user_id, "veo3", quota_kind)
         await callback.message.answer("❌ Не удалось списать средства. Попробуйте позже.")
         await state.clear()
         return
@@ -137,26 +126,30 @@ async def confirm_generation_veo3(callback: CallbackQuery, state: FSMContext):
     try:
         output = replicate.run(
             "google/veo-3",
-            input={
-                "prompt": prompt,
-                "enhance_prompt": True,
-                "aspect_ratio": "9:16",
-                "duration": 5,
-                "seed": 42
-            }
+            input=veo3_input(prompt)
         )
         video_url = output.url if hasattr(output, "url") else output
         logger.info(f"Видео сгенерировано: {video_url}")
-        await callback.message.answer_video(video_url, caption="✅ Видео готово!")
+        await deliver(callback.message, "video", video_url, model="veo3", caption="✅ Видео готово!")
     except replicate.exceptions.ModelError as e:
         logger.warning(f"Модель отклонила prompt как чувствительный: {e}")
-        await callback.message.answer("⚠️ Модель отклонила описание как чувствительное. Пожалуйста, измените prompt.")
+        note = await refund_generation(user_id, "veo3", quota_kind, GENERATION_COST_RUB)
+        await callback.message.answer(f"⚠️ Модель отклонила описание как чувствительное. Пожалуйста, измените prompt.\n{note}")
     except Exception as e:
         logger.exception("Ошибка при генерации видео:")
-        await callback.message.answer("⚠️ Произошла ошибка при генерации видео.")
+        note = await refund_generation(user_id, "veo3", quota_kind, GENERATION_COST_RUB)
+        await callback.message.answer(f"⚠️ Произошла ошибка при генерации видео.\n{note}")
 
     await state.clear()
 
+# Черновик на Seedance в том же соотношении сторон, затем финал в Veo3
+async def confirm_draft_veo3(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await start_draft(
+        callback, state, "Veo3", "google/veo-3", "veo3", GENERATION_COST_RUB,
+        veo3_input(data["prompt"]), aspect_ratio=VEO3_ASPECT_RATIO,
+    )
+
 # Основная функция запуска бота
 async def main():
     bot = Bot(token=BOT_TOKEN)
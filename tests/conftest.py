@@ -0,0 +1,45 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# До импорта модулей бота: токены для конфигов и отдельная БД на время тестов
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp_dir}/test.db"
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+@pytest.fixture
+def db():
+    """Чистые таблицы на каждый тест."""
+    from database.db import Base, engine, init_db
+
+    async def reset():
+        engine.echo = False
+        await init_db()
+        async with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                await conn.execute(table.delete())
+
+    asyncio.run(reset())
+    yield
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def balance_cache():
+    from bot import balance_cache
+
+    balance_cache._balances.clear()
+    balance_cache._versions.clear()
+    yield balance_cache
+    balance_cache._balances.clear()
+    balance_cache._versions.clear()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from media.audio import fit_to_duration, append_continuation
+
+RATE = 1000
+
+
+def test_short_audio_is_padded_with_silence():
+    samples = np.ones(RATE * 2, dtype=np.float32)
+    fitted = fit_to_duration(samples, RATE, 5)
+    assert fitted.shape == (RATE * 5,)
+    assert fitted.dtype == np.float32
+    assert np.all(fitted[:RATE * 2] == 1) and np.all(fitted[RATE * 2:] == 0)
+
+
+def test_long_audio_is_cut_with_fade_out():
+    samples = np.ones((RATE * 10, 2), dtype=np.float32)
+    fitted = fit_to_duration(samples, RATE, 5, fade_seconds=1)
+    assert fitted.shape == (RATE * 5, 2)
+    assert np.all(fitted[:RATE * 4] == 1)
+    # Затухание монотонное и заканчивается тишиной
+    assert np.all(np.diff(fitted[RATE * 4:, 0]) <= 0)
+    assert fitted[-1, 0] == 0
+    # Исходный массив не меняется
+    assert np.all(samples == 1)
+
+
+def test_fade_longer_than_clip():
+    fitted = fit_to_duration(np.ones(RATE, dtype=np.float32), RATE, 0.5, fade_seconds=2)
+    assert len(fitted) == RATE // 2
+    assert fitted[0] == 1 and fitted[-1] == 0
+
+
+def test_fractional_duration_rounds_to_samples():
+    assert len(fit_to_duration(np.zeros(10, dtype=np.float32), RATE, 1.25)) == 1250
+
+
+def test_append_continuation_replaces_overlap():
+    track = np.ones(100, dtype=np.float32)
+    # Продолжение повторяет 20 последних сэмплов трека и добавляет 50 новых
+    segment = np.concatenate([np.ones(20), np.full(50, 2.0)]).astype(np.float32)
+    joined = append_continuation(track, segment, overlap=20, fade=10)
+    assert len(joined) == 150
+    assert np.all(joined[:90] == 1) and np.all(joined[100:] == 2)
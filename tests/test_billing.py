@@ -0,0 +1,110 @@
+import asyncio
+
+from sqlalchemy import select, update
+
+from bot.billing import get_user_balance, charge, refund
+from database.db import async_session
+from database.models import User, PaymentRecord, DEBIT_STATUS, REFUND_STATUS
+
+
+async def _add_user(telegram_id: int, balance: float):
+    async with async_session() as session:
+        session.add(User(telegram_id=telegram_id, balance=balance))
+        await session.commit()
+
+
+async def _statuses(telegram_id: int) -> list[str]:
+    async with async_session() as session:
+        rows = await session.execute(
+            select(PaymentRecord.status).join(User, User.id == PaymentRecord.user_id)
+            .where(User.telegram_id == telegram_id).order_by(PaymentRecord.id)
+        )
+        return list(rows.scalars())
+
+
+def test_fill_skipped_after_write(balance_cache):
+    version = balance_cache.balance_version(1)
+    # Пока читали из БД, баланс успели изменить и записать в кэш
+    balance_cache.set_cached_balance(1, 50, notify=False)
+    balance_cache.fill_cached_balance(1, 10, version)
+    assert balance_cache.get_cached_balance(1) == 50
+
+
+def test_fill_skipped_after_invalidation(balance_cache):
+    version = balance_cache.balance_version(1)
+    balance_cache.invalidate_balance(1, notify=False)
+    balance_cache.fill_cached_balance(1, 10, version)
+    assert balance_cache.get_cached_balance(1) is None
+
+
+def test_entry_expires(balance_cache, monkeypatch):
+    monkeypatch.setattr(balance_cache, "BALANCE_CACHE_TTL", 0)
+    # Правку из другого процесса без канала инвалидации бот увидит, когда запись устареет
+    balance_cache.set_cached_balance(1, 50, notify=False)
+    assert balance_cache.get_cached_balance(1) is None
+    balance_cache.fill_cached_balance(1, 70, balance_cache.balance_version(1))
+    assert balance_cache._balances[1][0] == 70
+
+
+def test_get_user_balance_creates_user(db, balance_cache):
+    async def scenario():
+        assert await get_user_balance(7) == 0
+        async with async_session() as session:
+            user = (await session.execute(select(User).where(User.telegram_id == 7))).scalar_one()
+        assert user.balance == 0
+        assert balance_cache.get_cached_balance(7) == 0
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_first_lookups_create_one_user(db, balance_cache):
+    async def scenario():
+        balances = await asyncio.gather(*(get_user_balance(8) for _ in range(5)))
+        assert balances == [0] * 5
+        async with async_session() as session:
+            users = (await session.execute(select(User).where(User.telegram_id == 8))).scalars().all()
+        assert len(users) == 1
+
+    asyncio.run(scenario())
+
+
+def test_charge_and_refund(db, balance_cache):
+    async def scenario():
+        await _add_user(9, 100)
+        assert await get_user_balance(9) == 100
+        assert not await charge(9, 150)
+        assert await charge(9, 60)
+        assert await get_user_balance(9) == 40
+        await refund(9, 20)
+        assert await get_user_balance(9) == 60
+        assert await _statuses(9) == [DEBIT_STATUS, REFUND_STATUS]
+
+    asyncio.run(scenario())
+
+
+def test_charge_unknown_user(db, balance_cache):
+    assert not asyncio.run(charge(404, 1))
+
+
+def test_concurrent_charges_never_overdraw(db, balance_cache):
+    async def scenario():
+        await _add_user(10, 100)
+        results = await asyncio.gather(*(charge(10, 30) for _ in range(5)))
+        assert sum(results) == 3
+        assert await get_user_balance(10) == 10
+
+    asyncio.run(scenario())
+
+
+def test_charge_keeps_credit_made_elsewhere(db, balance_cache):
+    async def scenario():
+        await _add_user(11, 100)
+        assert await get_user_balance(11) == 100
+        # Пополнение из вебхука пишет в БД напрямую, мимо этого процесса
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(update(User).where(User.telegram_id == 11).values(balance=User.balance + 50))
+        assert await charge(11, 30)
+        assert balance_cache.get_cached_balance(11) == 120
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+from models.chatterbox import split_text
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("  Hello there. How are you?  ", max_chars=100) == ["Hello there. How are you?"]
+
+
+def test_sentences_are_packed_up_to_limit():
+    text = "One two three. Four five six! Seven eight nine? Ten."
+    chunks = split_text(text, max_chars=30)
+    assert chunks == ["One two three. Four five six!", "Seven eight nine? Ten."]
+    assert " ".join(chunks) == text
+
+
+def test_long_sentence_is_cut_at_comma_then_space():
+    sentence = "alpha beta gamma, delta epsilon zeta, eta theta iota kappa lambda mu nu xi omicron pi rho"
+    chunks = split_text(sentence, max_chars=25)
+    assert all(len(chunk) <= 25 for chunk in chunks)
+    assert chunks[0] == "alpha beta gamma,"
+    assert " ".join(chunks).split() == sentence.split()
+
+
+def test_word_longer_than_limit_is_hard_cut():
+    chunks = split_text("a" * 25, max_chars=10)
+    assert chunks == ["a" * 10, "a" * 10, "a" * 5]
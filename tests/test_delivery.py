@@ -0,0 +1,42 @@
+import asyncio
+
+from bot import delivery
+from bot.delivery import plan, URL, UPLOAD, URL_LIMIT_DEFAULT, UPLOAD_LIMIT_DEFAULT
+
+MB = 1024 * 1024
+
+
+def _plan(monkeypatch, media_type, size, content_type, postprocess=True):
+    async def head(url):
+        return size, content_type
+
+    monkeypatch.setattr(delivery, "_head", head)
+    monkeypatch.setattr(delivery, "VIDEO_POSTPROCESS", postprocess)
+    return asyncio.run(plan(media_type, "https://example.com/out", model="test-plan"))
+
+
+def test_compatible_video_tries_url_first(monkeypatch):
+    assert _plan(monkeypatch, "video", 5 * MB, "video/mp4") == [URL, UPLOAD]
+
+
+def test_video_prepared_when_url_unlikely(monkeypatch):
+    assert _plan(monkeypatch, "video", URL_LIMIT_DEFAULT + 1, "video/mp4") == [UPLOAD, URL]
+    assert _plan(monkeypatch, "video", 5 * MB, "video/quicktime") == [UPLOAD, URL]
+    assert _plan(monkeypatch, "video", None, None) == [UPLOAD, URL]
+
+
+def test_size_limits_without_postprocess(monkeypatch):
+    assert _plan(monkeypatch, "video", URL_LIMIT_DEFAULT + 1, "video/mp4", postprocess=False) == [UPLOAD]
+    assert _plan(monkeypatch, "video", UPLOAD_LIMIT_DEFAULT + 1, "video/mp4", postprocess=False) == []
+    assert _plan(monkeypatch, "photo", 6 * MB, "image/png") == [UPLOAD]
+
+
+def test_upload_first_after_url_failures(monkeypatch):
+    for _ in range(delivery.MIN_ATTEMPTS):
+        delivery._record("flaky", "photo", URL, False)
+
+    async def head(url):
+        return 1 * MB, "image/png"
+
+    monkeypatch.setattr(delivery, "_head", head)
+    assert asyncio.run(plan("photo", "https://example.com/out", model="flaky")) == [UPLOAD, URL]
@@ -0,0 +1,61 @@
+import asyncio
+
+from models import draft
+from models.draft import draft_rows, draft_input, DRAFT_MIN_FINAL_PRICE, DraftState
+
+
+class _FakeMessage:
+    def __init__(self):
+        self.texts = []
+
+    async def answer(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+class _FakeState:
+    def __init__(self, data):
+        self.data, self.state = data, None
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def set_state(self, state):
+        self.state = state
+
+    async def clear(self):
+        self.data, self.state = {}, None
+
+
+def test_draft_button_only_for_expensive_finals():
+    assert draft_rows("cb", DRAFT_MIN_FINAL_PRICE - 1) == []
+    assert len(draft_rows("cb", DRAFT_MIN_FINAL_PRICE)) == 1
+
+
+def test_draft_input():
+    assert "image" not in draft_input("a cat", None, 1)
+    assert draft_input("a cat", "https://example.com/a.png", 1)["image"] == "https://example.com/a.png"
+
+
+def test_failed_draft_is_refunded(db, balance_cache, monkeypatch):
+    from bot import quota
+    from bot.billing import get_user_balance, refund
+
+    async def failing_prediction(model, input):
+        raise RuntimeError("prediction failed")
+
+    monkeypatch.setattr(draft, "run_prediction", failing_prediction)
+    state = _FakeState({"prompt": "a knight in the forest", "image_url": None, "seed": 1, "aspect_ratio": "16:9"})
+
+    async def scenario():
+        await get_user_balance(30)
+        await refund(30, 500)
+        await draft.run_draft(_FakeMessage(), 30, state)
+        assert await get_user_balance(30) == 500
+        assert quota._daily[(30, "seedance")] == 0
+        assert state.state == DraftState.reviewing
+
+    asyncio.run(scenario())
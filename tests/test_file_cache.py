@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+
+from bot import file_cache
+from bot.file_cache import remember_result, send_cached_media, last_result_key
+
+
+def _sent_photo(file_id: str):
+    media = dict.fromkeys(file_cache.MEDIA_TYPES[1:])
+    return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id=file_id)], **media)
+
+
+class _FakeBot:
+    def __init__(self, fail: bool = False):
+        self.sent, self.fail = [], fail
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if self.fail:
+            raise TelegramBadRequest(SendPhoto(chat_id=chat_id, photo=photo), "wrong file identifier")
+        self.sent.append((chat_id, photo))
+        return "sent"
+
+
+def test_last_result_is_resent_by_file_id(db):
+    file_cache._files.clear()
+
+    async def scenario():
+        bot = _FakeBot()
+        assert await send_cached_media(bot, 1, last_result_key(1)) is None
+        await remember_result(1, _sent_photo("first"))
+        await remember_result(1, _sent_photo("second"))
+        assert await send_cached_media(bot, 1, last_result_key(1)) == "sent"
+        # В чате повторяется именно последний результат, и переживает он перезапуск (запись в БД)
+        file_cache._files.clear()
+        assert await send_cached_media(bot, 1, last_result_key(1)) == "sent"
+        assert bot.sent == [(1, "second"), (1, "second")]
+
+    asyncio.run(scenario())
+
+
+def test_stale_file_id_is_forgotten(db):
+    file_cache._files.clear()
+
+    async def scenario():
+        await remember_result(2, _sent_photo("stale"))
+        assert await send_cached_media(_FakeBot(fail=True), 2, last_result_key(2)) is None
+        assert await file_cache.get_cached_file(last_result_key(2)) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from media.images import dhash, hamming_distances, tile_frames
+
+
+def _gradient(width: int = 320, height: int = 240, seed: int = 0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    # Крупные пятна: хэш считается по картинке 9x8, мелкий шум он не видит
+    blocks = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(blocks).resize((width, height), Image.BILINEAR)
+
+
+def _encode(image: Image.Image, format: str = "JPEG", **params) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=format, **params)
+    return output.getvalue()
+
+
+def _distance(a: int, b: int) -> int:
+    return int(hamming_distances(np.array([a], dtype=np.uint64), b)[0])
+
+
+def test_dhash_survives_recompression_and_resize():
+    image = _gradient()
+    original = dhash(_encode(image, quality=95))
+    assert _distance(original, dhash(_encode(image, quality=40))) <= 4
+    assert _distance(original, dhash(_encode(image.resize((160, 120)), "PNG"))) <= 4
+
+
+def test_dhash_differs_for_different_images():
+    assert _distance(dhash(_encode(_gradient(seed=1))), dhash(_encode(_gradient(seed=2)))) > 10
+
+
+def test_dhash_fits_uint64():
+    assert 0 <= dhash(_encode(_gradient())) < 2**64
+
+
+def test_hamming_distances():
+    hashes = np.array([0, 0b1011, 2**64 - 1], dtype=np.uint64)
+    assert hamming_distances(hashes, 0).tolist() == [0, 3, 64]
+    assert hamming_distances(hashes, 2**64 - 1).tolist() == [64, 61, 0]
+
+
+def _solid(value: int, height: int = 4, width: int = 6) -> np.ndarray:
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def _decode(data: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert("RGB")).astype(int)
+
+
+def test_tile_frames_grid():
+    frames = [_solid(value) for value in (50, 100, 150, 200, 250)]
+    sheet = _decode(tile_frames(frames, columns=3, gap=4, background=0, quality=100))
+    # 2 ряда по 3 колонки, между кадрами зазор gap, по краям зазора нет
+    assert sheet.shape == (2 * 4 + 4, 3 * 6 + 2 * 4, 3)
+    for index, value in enumerate((50, 100, 150, 200, 250)):
+        row, column = divmod(index, 3)
+        tile = sheet[row * 8:row * 8 + 4, column * 10:column * 10 + 6]
+        assert abs(tile.mean() - value) < 8
+    # Пустая ячейка — цвет фона
+    assert sheet[8:, 20:].mean() < 8
+
+
+def test_tile_frames_single_row():
+    sheet = _decode(tile_frames([_solid(128), _solid(128)], columns=2, gap=2))
+    assert sheet.shape == (4, 14, 3)
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+import pytest
+
+from media.loudness import integrated_loudness, limit_peaks, master_audio
+
+RATE = 48000
+
+
+def _sine(amplitude: float, seconds: float = 5.0, frequency: float = 997.0, rate: int = RATE) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def test_full_scale_sine_reference():
+    # BS.1770: синус 1 кГц 0 dBFS в одном канале — −3.01 LKFS
+    assert integrated_loudness(_sine(1.0), RATE) == pytest.approx(-3.01, abs=0.1)
+
+
+def test_stereo_adds_channel_energy():
+    mono = _sine(10 ** (-23 / 20))
+    # Тестовый сигнал EBU Tech 3341: синус −23 dBFS в обоих каналах — −23 LUFS
+    assert integrated_loudness(np.stack([mono, mono], axis=1), RATE) == pytest.approx(-23.0, abs=0.1)
+
+
+@pytest.mark.parametrize("rate", [24000, 32000, 44100])
+def test_loudness_tracks_gain_at_any_rate(rate):
+    quiet = integrated_loudness(_sine(0.1, rate=rate), rate)
+    loud = integrated_loudness(_sine(0.2, rate=rate), rate)
+    assert loud - quiet == pytest.approx(20 * math.log10(2), abs=0.01)
+
+
+def test_silence_and_short_input():
+    assert integrated_loudness(np.zeros(RATE * 2, dtype=np.float32), RATE) == float("-inf")
+    assert integrated_loudness(_sine(1.0, seconds=0.3), RATE) == float("-inf")
+
+
+def test_gates_ignore_silence_and_quiet_parts():
+    # Длинный тон: блоки на стыках с тишиной проходят гейт, но почти не влияют на среднее
+    tone = _sine(0.5, seconds=20)
+    padded = np.concatenate([np.zeros(RATE * 5, dtype=np.float32), tone, _sine(0.001), np.zeros(RATE * 5, dtype=np.float32)])
+    assert integrated_loudness(padded, RATE) == pytest.approx(integrated_loudness(tone, RATE), abs=0.1)
+
+
+def test_master_does_not_boost_near_silence():
+    # Усиление ограничено MAX_GAIN_DB (20 дБ): −43 LUFS дотягиваются только до −23
+    mastered = master_audio(_sine(0.01), RATE, target_lufs=-16)
+    assert integrated_loudness(mastered, RATE) == pytest.approx(-23, abs=0.5)
+
+
+def test_limiter_keeps_ceiling():
+    limited = limit_peaks(_sine(2.0), RATE, ceiling_db=-1)
+    assert np.abs(limited).max() <= 10 ** (-1 / 20) + 1e-6
+
+
+def test_master_reaches_target():
+    mastered = master_audio(_sine(0.05), RATE, target_lufs=-16)
+    assert integrated_loudness(mastered, RATE) == pytest.approx(-16, abs=0.5)
@@ -0,0 +1,32 @@
+import pytest
+
+from models.musicgen import (
+    plan_segments, musicgen_price, MUSICGEN_PRICE_RUB, SEGMENT_SECONDS, OVERLAP_SECONDS, SHORT_DURATION, DURATIONS,
+)
+
+
+def _track_length(segments: list[int]) -> int:
+    # Каждый следующий сегмент начинается с OVERLAP_SECONDS хвоста предыдущего
+    return segments[0] + sum(seconds - OVERLAP_SECONDS for seconds in segments[1:])
+
+
+def test_short_track_is_one_segment():
+    assert plan_segments(SHORT_DURATION) == [SHORT_DURATION]
+    assert plan_segments(SEGMENT_SECONDS) == [SEGMENT_SECONDS]
+
+
+def test_long_track_segments():
+    assert plan_segments(60) == [30, 30, 10]
+    assert plan_segments(120) == [30, 30, 30, 30, 20]
+
+
+@pytest.mark.parametrize("duration", [31, 55, 56, *DURATIONS.values()])
+def test_segments_cover_duration(duration):
+    segments = plan_segments(duration)
+    assert _track_length(segments) == duration
+    assert all(OVERLAP_SECONDS < seconds <= SEGMENT_SECONDS for seconds in segments[1:])
+
+
+def test_price_is_per_segment():
+    assert musicgen_price(SHORT_DURATION) == MUSICGEN_PRICE_RUB
+    assert musicgen_price(180) == MUSICGEN_PRICE_RUB * len(plan_segments(180))
@@ -0,0 +1,22 @@
+from models.pipeline import pipeline_rows, pipeline_video_price
+from models.storyboard import STORYBOARD_MODELS
+
+
+def test_only_affordable_models_are_offered():
+    prices = {key: pipeline_video_price(key) for key in STORYBOARD_MODELS}
+    cheapest = min(prices, key=prices.get)
+    balance = 9 + prices[cheapest]
+
+    rows = pipeline_rows("confirm_video_imagegen4", 9, balance)
+    offered = [row[0].callback_data.removeprefix("confirm_video_imagegen4_") for row in rows]
+    assert offered == [key for key in STORYBOARD_MODELS if prices[key] <= prices[cheapest]]
+
+
+def test_no_button_without_balance_for_both():
+    cheapest = min(pipeline_video_price(key) for key in STORYBOARD_MODELS)
+    assert pipeline_rows("confirm_video_ideogram", 9, 9 + cheapest - 1) == []
+
+
+def test_all_models_with_enough_balance():
+    rows = pipeline_rows("confirm_video_ideogram", 9, 10**6)
+    assert [row[0].callback_data for row in rows] == [f"confirm_video_ideogram_{key}" for key in STORYBOARD_MODELS]
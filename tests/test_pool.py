@@ -0,0 +1,29 @@
+import time
+import asyncio
+
+import pytest
+
+from media import pool
+
+
+def _hang(seconds: float):
+    time.sleep(seconds)
+
+
+def test_timeout_terminates_hung_worker():
+    async def scenario():
+        job = asyncio.create_task(pool.run_media_job(_hang, 60, timeout=1))
+        await asyncio.sleep(0.5)
+        processes = list(pool._get_executor()._processes.values())
+        with pytest.raises(TimeoutError):
+            await job
+        return processes
+
+    processes = asyncio.run(scenario())
+    assert processes
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive()
+    # Следующая задача идёт уже в новом пуле
+    assert asyncio.run(pool.run_media_job(sum, [1, 2])) == 3
+    pool.shutdown_media_pool()
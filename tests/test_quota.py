@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from bot import quota
+from bot.billing import get_user_balance, refund_generation
+from bot.config import FREE_GENERATIONS_ON_START
+from database.db import async_session
+from database.models import User, GenerationUsage
+
+
+@pytest.fixture
+def counters(db, balance_cache):
+    asyncio.run(quota.load_quota())
+    quota._dirty_remaining.clear()
+    quota._pending_usage.clear()
+    yield quota
+    quota._dirty_remaining.clear()
+    quota._pending_usage.clear()
+
+
+async def _users() -> dict[int, int]:
+    async with async_session() as session:
+        rows = await session.execute(select(User.telegram_id, User.remaining_generations))
+        return dict(rows.all())
+
+
+def test_new_user_gets_start_generations(counters):
+    asyncio.run(get_user_balance(1))
+    assert asyncio.run(_users()) == {1: FREE_GENERATIONS_ON_START}
+
+
+def test_free_generation_then_paid(counters):
+    assert counters.acquire_generation(1, "flux") == counters.QUOTA_FREE
+    assert counters.acquire_generation(1, "flux") == counters.QUOTA_PAID
+    # Модель без бесплатных генераций их не тратит
+    assert counters.acquire_generation(2, "veo3") == counters.QUOTA_PAID
+    assert counters.has_free_generation(2, "flux")
+
+
+def test_release_returns_free_generation(counters):
+    kind = counters.acquire_generation(1, "flux")
+    counters.release_generation(1, "flux", kind)
+    assert counters.acquire_generation(1, "flux") == counters.QUOTA_FREE
+
+
+def test_refund_generation(counters):
+    async def scenario():
+        assert await get_user_balance(3) == 0
+        kind = counters.acquire_generation(3, "veo3")
+        assert kind == counters.QUOTA_PAID
+        await refund_generation(3, "veo3", kind, 40)
+        assert await get_user_balance(3) == 40
+        assert counters._daily[(3, "veo3")] == 0
+
+    asyncio.run(scenario())
+
+
+def test_daily_cap(counters, monkeypatch):
+    monkeypatch.setitem(quota.DAILY_GENERATION_CAPS_PER_MODEL, "veo3", 2)
+    kinds = [counters.acquire_generation(1, "veo3") for _ in range(3)]
+    assert kinds == [counters.QUOTA_PAID, counters.QUOTA_PAID, counters.QUOTA_CAPPED]
+
+
+def test_flush_does_not_create_users(counters):
+    async def scenario():
+        await get_user_balance(1)
+        counters.acquire_generation(1, "flux")
+        counters.acquire_generation(2, "flux")
+        await counters.flush_quota()
+        assert await _users() == {1: FREE_GENERATIONS_ON_START - 1}
+        # Строки для 2 пока нет — значение ждёт следующего сброса
+        assert counters._dirty_remaining == {2}
+
+        await get_user_balance(2)
+        await counters.flush_quota()
+        assert await _users() == {1: FREE_GENERATIONS_ON_START - 1, 2: FREE_GENERATIONS_ON_START - 1}
+        assert not counters._dirty_remaining
+
+    asyncio.run(scenario())
+
+
+def test_counters_survive_restart(counters):
+    async def scenario():
+        await get_user_balance(1)
+        counters.acquire_generation(1, "flux")
+        counters.acquire_generation(1, "veo3")
+        await counters.flush_quota()
+        await counters.load_quota()
+        assert counters.acquire_generation(1, "flux") == counters.QUOTA_PAID
+        assert counters._daily[(1, "veo3")] == 1
+
+        async with async_session() as session:
+            usage = (await session.execute(select(GenerationUsage))).scalars().all()
+        assert {(row.model, row.count) for row in usage} == {("flux", 1), ("veo3", 1)}
+
+    asyncio.run(scenario())
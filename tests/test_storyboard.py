@@ -0,0 +1,37 @@
+from models.storyboard import parse_shots, plan_chains, STORYBOARD_MODELS
+
+
+def test_parse_shots():
+    text = """
+    A knight walks through a misty forest
+    > The knight stops and draws his sword
+
+    Close-up of a dragon opening its eyes
+    >>   The dragon breathes fire
+    """
+    assert parse_shots(text) == [
+        ("A knight walks through a misty forest", False),
+        ("The knight stops and draws his sword", True),
+        ("Close-up of a dragon opening its eyes", False),
+        ("The dragon breathes fire", True),
+    ]
+
+
+def test_first_shot_cannot_continue():
+    # Продолжать нечего — первая сцена стартует с присланного изображения
+    assert parse_shots("> Opening shot of a city") == [("Opening shot of a city", False)]
+
+
+def test_plan_chains():
+    shots = [("a", False), ("b", True), ("c", True), ("d", False), ("e", False), ("f", True)]
+    assert plan_chains(shots) == [[0, 1, 2], [3], [4, 5]]
+
+
+def test_independent_shots_render_in_parallel():
+    assert plan_chains([("a", False), ("b", False), ("c", False)]) == [[0], [1], [2]]
+    assert plan_chains([]) == []
+
+
+def test_models_price_per_shot():
+    for config in STORYBOARD_MODELS.values():
+        assert 0 < config["price"](5) < config["price"](10)
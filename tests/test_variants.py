@@ -0,0 +1,88 @@
+import asyncio
+
+from models import variants
+from models.variants import variant_inputs, generate_variants
+
+
+def test_variant_inputs_distinct_seeds():
+    inputs = variant_inputs({"prompt": "a cat"}, 4)
+    assert len({item["seed"] for item in inputs}) == 4
+    assert all(item["prompt"] == "a cat" for item in inputs)
+
+
+def test_variant_inputs_without_seed():
+    assert variant_inputs({"prompt": "a cat"}, 3, seed_key=None) == [{"prompt": "a cat"}] * 3
+
+
+def test_generate_variants_streams_results(monkeypatch):
+    async def fake_prediction(model, input):
+        await asyncio.sleep(input["delay"])
+        if input["delay"] < 0.02:
+            raise RuntimeError("prediction failed")
+        return [f"https://example.com/{input['delay']}.png"]
+
+    monkeypatch.setattr(variants, "run_prediction", fake_prediction)
+    seen = []
+
+    async def on_result(url, done, count):
+        seen.append((url, done, count))
+
+    inputs = [{"delay": 0.06}, {"delay": 0.01}, {"delay": 0.03}]
+    urls = asyncio.run(generate_variants("model", inputs, on_result))
+    # Порядок результата — как у inputs, колбэк — по мере готовности
+    assert urls == ["https://example.com/0.06.png", None, "https://example.com/0.03.png"]
+    assert seen == [
+        (None, 1, 3),
+        ("https://example.com/0.03.png", 2, 3),
+        ("https://example.com/0.06.png", 3, 3),
+    ]
+
+
+class _FakeMessage:
+    def __init__(self):
+        self.texts = []
+
+    async def edit_text(self, text):
+        self.texts.append(text)
+        return self
+
+    async def answer(self, text):
+        self.texts.append(text)
+
+
+def test_run_variants_one_album_and_refund(db, balance_cache, monkeypatch):
+    from bot import quota
+    from bot.billing import get_user_balance
+
+    async def fake_prediction(model, input):
+        if input["seed"] == seeds[0]:
+            raise RuntimeError("prediction failed")
+        return f"https://example.com/{input['seed']}.png"
+
+    albums = []
+
+    async def fake_album(message, media_type, urls, model=None, caption=None):
+        albums.append(urls)
+
+    seeds = []
+    real_inputs = variants.variant_inputs
+
+    def inputs(base, count, seed_key="seed"):
+        result = real_inputs(base, count, seed_key)
+        seeds.extend(item["seed"] for item in result)
+        return result
+
+    monkeypatch.setattr(variants, "run_prediction", fake_prediction)
+    monkeypatch.setattr(variants, "deliver_album", fake_album)
+    monkeypatch.setattr(variants, "variant_inputs", inputs)
+
+    async def scenario():
+        await get_user_balance(20)
+        await variants.refund(20, 1000)
+        await variants.run_variants(_FakeMessage(), 20, "model", "flux", {"prompt": "a cat"}, 10, "✅")
+        # Один вариант не получился: 10 ₽ вернулись, альбом — из остальных
+        assert await get_user_balance(20) == 1000 - 10 * (variants.VARIANTS_COUNT - 1)
+        assert albums == [[f"https://example.com/{seed}.png" for seed in seeds[1:]]]
+        assert quota._daily[(20, "flux")] == variants.VARIANTS_COUNT - 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import asyncio
+
+from media import pool, video
+
+
+def test_contact_sheet_takes_a_slot_per_ffmpeg(monkeypatch):
+    running = peak = 0
+
+    async def fake_run(*args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return bytes(video.CONTACT_SHEET_TILE_WIDTH * 226 * 3)
+
+    async def fake_probe(source):
+        return {"width": 1280, "height": 720, "duration": 5.0}
+
+    monkeypatch.setattr(video, "_run", fake_run)
+    monkeypatch.setattr(video, "probe", fake_probe)
+    monkeypatch.setattr(video, "run_media_job", lambda fn, *args: asyncio.sleep(0, fn(*args)))
+
+    async def scenario():
+        monkeypatch.setattr(pool, "_slots", asyncio.Semaphore(2))
+        sheet = await video.contact_sheet("clip.mp4", frames=6)
+        assert sheet[:2] == b"\xff\xd8"
+        assert not pool.media_pool_busy()
+        async with pool.media_slot(), pool.media_slot():
+            assert pool.media_pool_busy()
+
+    asyncio.run(scenario())
+    assert peak == 2
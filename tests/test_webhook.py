@@ -0,0 +1,128 @@
+import hmac
+import json
+import asyncio
+import hashlib
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from sqlalchemy import select
+
+from bot import webhook
+from database.db import async_session
+from database.models import User, PaymentRecord
+
+
+def _event(payment_id: str, status: str = "succeeded", amount="100.00", telegram_id="1") -> dict:
+    return {
+        "type": "notification",
+        "event": f"payment.{status}",
+        "object": {
+            "id": payment_id,
+            "status": status,
+            "amount": {"value": amount, "currency": "RUB"},
+            "metadata": {"telegram_id": telegram_id},
+        },
+    }
+
+
+async def _balances() -> dict[int, float]:
+    async with async_session() as session:
+        return dict((await session.execute(select(User.telegram_id, User.balance))).all())
+
+
+@pytest.fixture
+def payments(db, balance_cache):
+    webhook._known_users.clear()
+    yield webhook
+    webhook._known_users.clear()
+
+
+def test_parse_event():
+    assert webhook.parse_event(_event("p1")) == ("p1", "succeeded", 100.0, 1)
+    assert webhook.parse_event(_event("p1", telegram_id=None))[3] is None
+
+
+@pytest.mark.parametrize("event", [
+    _event(""),
+    _event("p1", status=None),
+    _event("p1", amount="abc"),
+    _event("p1", amount="-5"),
+    _event("p1", amount="nan"),
+    _event("p1", telegram_id="12ab"),
+    {"object": {"id": "p1", "status": "succeeded"}},
+    {"object": None},
+])
+def test_parse_event_rejects_bad_payloads(event):
+    with pytest.raises((ValueError, KeyError, TypeError)):
+        webhook.parse_event(event)
+
+
+def test_repeated_event_credits_once(payments):
+    async def scenario():
+        assert await webhook.apply_payment_events([_event("p1"), _event("p1")]) == 1
+        assert await webhook.apply_payment_event(_event("p1")) is False
+        assert await _balances() == {1: 100}
+
+    asyncio.run(scenario())
+
+
+def test_pending_then_succeeded_credits_once(payments):
+    async def scenario():
+        assert not await webhook.apply_payment_event(_event("p1", status="pending"))
+        assert await webhook.apply_payment_event(_event("p1"))
+        # Запоздавший pending уже успешный платёж не откатывает
+        assert not await webhook.apply_payment_event(_event("p1", status="pending"))
+        assert await webhook.apply_payment_event(_event("p2", amount="50.00"))
+        assert await _balances() == {1: 150}
+        async with async_session() as session:
+            statuses = dict((await session.execute(select(PaymentRecord.payment_id, PaymentRecord.status))).all())
+        assert statuses == {"p1": "succeeded", "p2": "succeeded"}
+
+    asyncio.run(scenario())
+
+
+def test_bad_event_does_not_block_batch(payments, monkeypatch):
+    calls = []
+    apply_event = webhook._apply_event
+
+    async def flaky_apply_event(conn, event):
+        calls.append(event["object"]["id"])
+        if event["object"]["id"] == "bad":
+            raise RuntimeError("сбой записи")
+        return await apply_event(conn, event)
+
+    monkeypatch.setattr(webhook, "_apply_event", flaky_apply_event)
+
+    async def scenario():
+        await webhook.start_webhook_workers()
+        for event in [_event("p1"), _event("bad"), _event("p2", telegram_id="2")]:
+            webhook._queue.put_nowait((event, 1))
+        await webhook.stop_webhook_workers()
+        assert await _balances() == {1: 100, 2: 100}
+
+    asyncio.run(scenario())
+    # Каждая попытка: в составе пачки и отдельно
+    assert calls.count("bad") == 2 * webhook.MAX_ATTEMPTS
+
+
+def test_handler_validates_payload(payments, monkeypatch):
+    monkeypatch.setattr(webhook, "YOOKASSA_WEBHOOK_SECRET", "secret")
+
+    async def post(client, event) -> int:
+        body = json.dumps(event).encode()
+        signature = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+        async with client.post("/yookassa_webhook", data=body, headers={"Content-HMAC": signature}) as resp:
+            return resp.status
+
+    async def scenario():
+        app = web.Application()
+        webhook.setup_webhook_routes(app)
+        async with TestClient(TestServer(app)) as client:
+            assert await post(client, _event("p1", amount="abc")) == 400
+            assert await post(client, _event("p1", telegram_id="@user")) == 400
+            assert await post(client, _event("p1")) == 200
+            await webhook._queue.join()
+        assert await _balances() == {1: 100}
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bench.yookassa_stub import create_stub_app
+from bot.yookassa import YooKassaClient, YooKassaError
+
+
+async def _with_server(app: web.Application, scenario):
+    server = TestServer(app)
+    await server.start_server()
+    client = YooKassaClient("shop", "key", base_url=str(server.make_url("/v3")), timeout=2, max_retries=2, backoff=0)
+    try:
+        return await scenario(client)
+    finally:
+        await client.close()
+        await server.close()
+
+
+def _scripted_app(responses: list) -> tuple[web.Application, list[str | None]]:
+    """Отвечает по очереди ответами из responses (последний — на все остальные запросы)
+    и запоминает Idempotence-Key каждого запроса."""
+    keys = []
+
+    async def handler(request: web.Request):
+        keys.append(request.headers.get("Idempotence-Key"))
+        return responses[min(len(keys), len(responses)) - 1]()
+
+    app = web.Application()
+    app.router.add_post("/v3/payments", handler)
+    return app, keys
+
+
+def test_retries_5xx_with_same_idempotence_key():
+    app, keys = _scripted_app([
+        lambda: web.json_response({"type": "error"}, status=503),
+        lambda: web.json_response({"type": "error"}, status=500),
+        lambda: web.json_response({"id": "p1", "status": "pending"}),
+    ])
+
+    async def scenario(client):
+        payment = await client.create_payment(100, "https://t.me/bot")
+        assert payment["id"] == "p1"
+        assert client.stats()["create_payment"]["retries"] == 2
+
+    asyncio.run(_with_server(app, scenario))
+    assert len(keys) == 3 and len(set(keys)) == 1 and keys[0]
+
+
+def test_gives_up_after_max_retries():
+    app, keys = _scripted_app([lambda: web.json_response({"type": "error"}, status=502)])
+
+    async def scenario(client):
+        with pytest.raises(YooKassaError) as error:
+            await client.create_payment(100, "https://t.me/bot")
+        assert error.value.status == 502
+        assert client.stats()["create_payment"]["errors"] == 1
+
+    asyncio.run(_with_server(app, scenario))
+    assert len(keys) == 3
+
+
+def test_non_json_error_body_is_retried():
+    html = "<html><body>502 Bad Gateway</body></html>"
+    app, keys = _scripted_app([
+        lambda: web.Response(text=html, status=502, content_type="text/html"),
+        lambda: web.json_response({"id": "p1", "status": "pending"}),
+    ])
+
+    async def scenario(client):
+        assert (await client.create_payment(100, "https://t.me/bot"))["id"] == "p1"
+
+    asyncio.run(_with_server(app, scenario))
+    assert len(keys) == 2
+
+
+def test_non_json_client_error_keeps_text():
+    app, _ = _scripted_app([lambda: web.Response(text="Forbidden", status=403)])
+
+    async def scenario(client):
+        with pytest.raises(YooKassaError) as error:
+            await client.create_payment(100, "https://t.me/bot")
+        assert error.value.status == 403
+        assert error.value.body == "Forbidden"
+
+    asyncio.run(_with_server(app, scenario))
+
+
+def test_stub_retry_creates_one_payment():
+    app = create_stub_app()
+    app["stub"]["fail_next"] = 2
+
+    async def scenario(client):
+        payment = await client.create_payment(100, "https://t.me/bot", idempotence_key="k")
+        again = await client.create_payment(100, "https://t.me/bot", idempotence_key="k")
+        assert payment["id"] == again["id"]
+
+    asyncio.run(_with_server(app, scenario))
+    assert app["stub"]["requests"] == 4
+    assert len(app["stub"]["payments"]) == 1